@@ -0,0 +1,258 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from database import db_instance
+from utils import Utils
+from outbound import TokenBucket
+from config import Config, logger
+
+
+# Названия статусов рассылки
+STATUS_NAMES = {
+    'sending': '⏳ отправляется',
+    'done': '✅ завершена',
+    'cancelled': '🚫 отменена',
+}
+
+
+class BroadcastJob:
+    """Рассылка одного сообщения всем незабаненным пользователям"""
+
+    def __init__(self, job_id, text, created_by, total, on_progress=None, on_done=None):
+        self.id = job_id
+        self.text = text
+        self.created_by = created_by
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.unknown = 0  # отправка прервана перезапуском, повторно не выполняется
+        self.status = 'sending'  # sending, done, cancelled
+        self.started_at = None
+        self.finished_at = None
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._results = []  # результаты, еще не записанные в broadcast_deliveries
+
+    @property
+    def processed(self):
+        return self.sent + self.failed + self.unknown
+
+    def record(self, username, success):
+        """Учет результата доставки одному получателю"""
+        with self._lock:
+            if success:
+                self.sent += 1
+            else:
+                self.failed += 1
+            self._results.append((username, 'sent' if success else 'failed'))
+
+    def take_results(self):
+        """Накопленные результаты доставки для записи в базу"""
+        with self._lock:
+            results, self._results = self._results, []
+            return results
+
+
+class BroadcastEngine:
+    """Параллельная рассылка с общим ограничением частоты отправки.
+
+    Рассылка и состояние доставки каждому получателю хранятся в базе:
+    получатель переводится в sending до отправки, поэтому после перезапуска
+    рассылка продолжается с оставшихся pending, а прерванные отправки
+    не повторяются. Результаты записываются пачками.
+    """
+
+    # Задержка повтора выборки получателей после ошибки базы (секунд)
+    MIN_RETRY_DELAY = 1
+    MAX_RETRY_DELAY = 60
+
+    def __init__(self, database, send, rate, workers):
+        self.database = database
+        self.send = send  # send(chat_id, text) -> bool
+        self.bucket = TokenBucket(rate, Config.BROADCAST_BURST)
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="broadcast-sender")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, text, created_by, on_progress=None, on_done=None):
+        """Создание и запуск рассылки. Возвращает BroadcastJob (None при ошибке), не дожидаясь отправки"""
+        job_id, total = self.database.create_broadcast_job(text, created_by)
+        if job_id is None:
+            return None
+
+        job = BroadcastJob(job_id, text, created_by, total, on_progress, on_done)
+        self._start(job)
+        logger.info(f"Broadcast #{job.id} by @{created_by} queued for {job.total} recipients")
+        return job
+
+    def resume(self):
+        """Продолжение рассылок, прерванных перезапуском. Возвращает их число"""
+        resumed = 0
+        for row in self.database.get_broadcast_jobs(status='sending'):
+            if row['id'] in self._jobs:
+                continue
+
+            unknown = self.database.mark_broadcast_unknown(row['id'])
+            current = self.database.get_broadcast_job(row['id'])
+            if current is None:
+                logger.error(f"Broadcast #{row['id']} could not be resumed: failed to read its state")
+                continue
+            deliveries = current['deliveries']
+            job = BroadcastJob(row['id'], row['text'], row['created_by'], row['total'])
+            job.sent = deliveries.get('sent', 0)
+            job.failed = deliveries.get('failed', 0)
+            job.unknown = deliveries.get('unknown', 0)
+
+            self._start(job)
+            resumed += 1
+            logger.info(
+                f"Broadcast #{job.id} resumed: {job.total - job.processed} recipients left, "
+                f"{unknown} interrupted deliveries will not be repeated"
+            )
+        return resumed
+
+    def cancel(self, job_id):
+        """Отмена рассылки. False, если она не найдена или уже завершена.
+
+        Рассылка другого процесса отменяется в базе: он перестает выбирать получателей.
+        """
+        job = self._jobs.get(job_id)
+        if job is not None and job.status == 'sending':
+            job.cancelled.set()
+            return True
+
+        row = self.database.get_broadcast_job(job_id)
+        if row is None or row['status'] != 'sending':
+            return False
+        return self.database.finish_broadcast_job(job_id, 'cancelled')
+
+    def get_job(self, job_id):
+        """Выполняющаяся в этом процессе рассылка по номеру или None (завершенные не хранятся)"""
+        return self._jobs.get(job_id)
+
+    def status_text(self, job_id=None):
+        """Состояние рассылки (или последних рассылок) для /alarmstatus. None, если рассылки нет"""
+        if job_id is None:
+            rows = self.database.get_broadcast_jobs(limit=5)
+            if not rows:
+                return "📭 Рассылок еще не было"
+            lines = ["📨 <b>Последние рассылки:</b>", ""]
+            for row in rows:
+                lines.append(f"#{row['id']} {STATUS_NAMES.get(row['status'], row['status'])} "
+                             f"({row['total']} получателей, @{row['created_by']})")
+            return "\n".join(lines)
+
+        row = self.database.get_broadcast_job(job_id)
+        if row is None:
+            return None
+
+        deliveries = row['deliveries']
+        sent, failed, unknown = deliveries.get('sent', 0), deliveries.get('failed', 0), deliveries.get('unknown', 0)
+        job = self._jobs.get(job_id)
+        if job is not None:
+            # В базу результаты пишутся пачками, в памяти счетчики точнее
+            sent, failed, unknown = job.sent, job.failed, job.unknown
+
+        created_at = time.strftime('%d.%m.%Y %H:%M', time.localtime(row['created_at']))
+        lines = [
+            f"📨 <b>Рассылка #{row['id']}</b>",
+            "",
+            f"📌 Статус: {STATUS_NAMES.get(row['status'], row['status'])}",
+            f"👤 Автор: @{row['created_by']}, {created_at}",
+            f"✅ Доставлено: {sent}/{row['total']}",
+            f"❌ Ошибок: {failed}",
+            f"⏳ Осталось: {row['total'] - sent - failed - unknown}",
+        ]
+        if unknown:
+            lines.append(f"❔ Прервано перезапуском (не повторяются): {unknown}")
+        return "\n".join(lines)
+
+    def _start(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+        threading.Thread(target=self._run, args=(job,), name=f"broadcast-{job.id}", daemon=True).start()
+
+    def _run(self, job):
+        """Раздача получателей пулу отправителей с учетом ограничения частоты"""
+        job.started_at = time.time()
+
+        # Не больше двух задач на поток в очереди пула, чтобы не держать в памяти всю рассылку
+        in_flight_limit = self.workers * 2
+        in_flight = threading.BoundedSemaphore(in_flight_limit)
+
+        retry_delay = self.MIN_RETRY_DELAY
+        while not job.cancelled.is_set():
+            batch = self.database.claim_broadcast_batch(job.id, Config.BROADCAST_BATCH_SIZE)
+            if batch is None:
+                # Ошибка базы - это не конец рассылки: получатели остаются pending, повтор с задержкой
+                logger.warning(f"Broadcast #{job.id}: failed to claim recipients, retry in {retry_delay}s")
+                job.cancelled.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, self.MAX_RETRY_DELAY)
+                continue
+            retry_delay = self.MIN_RETRY_DELAY
+            if not batch:
+                break
+
+            for index, recipient in enumerate(batch):
+                if job.cancelled.is_set() or not self.bucket.acquire(stop_event=job.cancelled):
+                    # Не отправленные получатели пачки возвращаются в очередь
+                    self.database.record_broadcast_results(
+                        job.id, [(r['username'], 'pending') for r in batch[index:]]
+                    )
+                    break
+                in_flight.acquire()
+                self._pool.submit(self._deliver, job, recipient, in_flight)
+
+            self.database.record_broadcast_results(job.id, job.take_results())
+
+        # Ожидание завершения отправок этой рассылки
+        for _ in range(in_flight_limit):
+            in_flight.acquire()
+        self.database.record_broadcast_results(job.id, job.take_results())
+
+        job.status = 'cancelled' if job.cancelled.is_set() else 'done'
+        job.finished_at = time.time()
+        if not self.database.finish_broadcast_job(job.id, job.status):
+            # Рассылку отменили через базу (выборка получателей ее больше не возвращала)
+            row = self.database.get_broadcast_job(job.id)
+            if row is not None and row['status'] != 'sending':
+                job.status = row['status']
+        # Завершенная рассылка полностью записана в базу, в памяти она больше не нужна
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        logger.info(
+            f"Broadcast #{job.id} {job.status}: sent {job.sent}, failed {job.failed} of {job.total} "
+            f"in {job.finished_at - job.started_at:.1f}s"
+        )
+        self._notify(job.on_done, job)
+
+    def _deliver(self, job, recipient, in_flight):
+        """Отправка сообщения одному получателю"""
+        try:
+            try:
+                success = self.send(recipient['user_id'], job.text)
+            except Exception as e:
+                logger.error(f"Broadcast #{job.id} error sending to @{recipient['username']}: {e}")
+                success = False
+
+            job.record(recipient['username'], success)
+            self._notify(job.on_progress, job)
+        finally:
+            in_flight.release()
+
+    @staticmethod
+    def _notify(callback, job):
+        """Вызов обработчика прогресса, ошибки которого не должны прерывать рассылку"""
+        if callback is None:
+            return
+        try:
+            callback(job)
+        except Exception as e:
+            logger.error(f"Broadcast #{job.id} callback error: {e}")
+
+
+# Глобальный движок рассылок
+broadcast_engine = BroadcastEngine(db_instance, Utils.send_message_to_chat, Config.BROADCAST_RATE, Config.BROADCAST_WORKERS)
@@ -16,14 +16,135 @@ class Config:
     DEFAULT_BAN_TIME = int(os.getenv('DEFAULT_BAN_TIME', 0))
     AUTH_CODE_EXPIRE_TIME = int(os.getenv('AUTH_CODE_EXPIRE_TIME', 300))
 
+    # Периодическая очистка кодов аутентификации (интервал 0 отключает ее)
+    AUTH_CLEANUP_INTERVAL = int(os.getenv('AUTH_CLEANUP_INTERVAL', 600))
+    AUTH_CLEANUP_BATCH_SIZE = int(os.getenv('AUTH_CLEANUP_BATCH_SIZE', 500))
+    DB_OPTIMIZE_AFTER_CLEANUP = os.getenv('DB_OPTIMIZE_AFTER_CLEANUP', 'true').lower() in ('1', 'true', 'yes')
+    DB_INCREMENTAL_VACUUM_PAGES = int(os.getenv('DB_INCREMENTAL_VACUUM_PAGES', 0))
+
     # Директории
     DATA_DIR = os.getenv('DATA_DIR', 'data')
     LOGS_DIR = os.getenv('LOGS_DIR', 'logs')
     BOTS_DIR = os.getenv('BOTS_DIR', 'bots')
 
+    # Автоматический перезапуск ботов: политика по умолчанию для новых ботов (never, on-failure, always),
+    # экспоненциальная задержка, не более BOT_RESTART_MAX перезапусков за BOT_RESTART_WINDOW секунд
+    BOT_RESTART_POLICY = os.getenv('BOT_RESTART_POLICY', 'never')
+    BOT_RESTART_BACKOFF_BASE = float(os.getenv('BOT_RESTART_BACKOFF_BASE', 1))
+    BOT_RESTART_BACKOFF_MAX = float(os.getenv('BOT_RESTART_BACKOFF_MAX', 60))
+    BOT_RESTART_MAX = int(os.getenv('BOT_RESTART_MAX', 5))
+    BOT_RESTART_WINDOW = int(os.getenv('BOT_RESTART_WINDOW', 300))
+    # После стольких секунд работы задержка перезапуска сбрасывается
+    BOT_RESTART_STABLE_TIME = int(os.getenv('BOT_RESTART_STABLE_TIME', 60))
+
+    # Замеры ресурсов ботов: интервал замеров (0 отключает), размер буфера в памяти,
+    # период сохранения усредненных замеров в базу и срок их хранения
+    METRICS_SAMPLE_INTERVAL = int(os.getenv('METRICS_SAMPLE_INTERVAL', 5))
+    METRICS_BUFFER_SIZE = int(os.getenv('METRICS_BUFFER_SIZE', 720))
+    METRICS_PERSIST_INTERVAL = int(os.getenv('METRICS_PERSIST_INTERVAL', 60))
+    METRICS_RETENTION_DAYS = int(os.getenv('METRICS_RETENTION_DAYS', 7))
+
+    # Вывод ботов (stdout/stderr) пишется процессом бота в LOGS_DIR/<бот>.log: строк в памяти на бота,
+    # строк в ответе /botlogs по умолчанию, ротация по размеру (BOT_LOG_MAX_BYTES=0 отключает ротацию)
+    # и как часто менеджер дочитывает файлы (секунд)
+    BOT_LOG_BUFFER_LINES = int(os.getenv('BOT_LOG_BUFFER_LINES', 1000))
+    BOT_LOGS_DEFAULT_LINES = int(os.getenv('BOT_LOGS_DEFAULT_LINES', 20))
+    BOT_LOG_MAX_BYTES = int(os.getenv('BOT_LOG_MAX_BYTES', 1048576))
+    BOT_LOG_BACKUP_COUNT = int(os.getenv('BOT_LOG_BACKUP_COUNT', 3))
+    BOT_LOG_POLL_INTERVAL = float(os.getenv('BOT_LOG_POLL_INTERVAL', 1))
+
+    # Сколько секунд ждать завершения бота после SIGTERM перед принудительной остановкой
+    BOT_STOP_TIMEOUT = float(os.getenv('BOT_STOP_TIMEOUT', 10))
+    # Потоков для параллельного запуска ботов (/startbot all)
+    BOT_BULK_WORKERS = int(os.getenv('BOT_BULK_WORKERS', 8))
+
+    # Пробы здоровья ботов: интервал (0 отключает), таймаут пробы, число неудач подряд до статуса
+    # unhealthy, пауза после запуска, потоков для параллельных проб, допустимый возраст файла-пульса
+    HEALTH_PROBE_INTERVAL = int(os.getenv('HEALTH_PROBE_INTERVAL', 15))
+    HEALTH_PROBE_TIMEOUT = float(os.getenv('HEALTH_PROBE_TIMEOUT', 5))
+    HEALTH_PROBE_FAILURES = int(os.getenv('HEALTH_PROBE_FAILURES', 3))
+    HEALTH_PROBE_START_GRACE = int(os.getenv('HEALTH_PROBE_START_GRACE', 30))
+    HEALTH_PROBE_WORKERS = int(os.getenv('HEALTH_PROBE_WORKERS', 16))
+    HEALTH_HEARTBEAT_MAX_AGE = int(os.getenv('HEALTH_HEARTBEAT_MAX_AGE', 60))
+    # Хосты (через запятую), кроме loopback, к которым могут обращаться пробы tcp и http
+    HEALTH_PROBE_ALLOWED_HOSTS = [
+        host.strip().lower() for host in os.getenv('HEALTH_PROBE_ALLOWED_HOSTS', '').split(',') if host.strip()
+    ]
+
+    # Рассылка /alarm: сообщений в секунду (лимит Telegram около 30), допустимый всплеск, потоков отправки
+    BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 25))
+    BROADCAST_BURST = int(os.getenv('BROADCAST_BURST', 25))
+    BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', 8))
+    # Получателей, выбираемых из базы за раз (результаты доставки тоже записываются пачками)
+    BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', 100))
+
+    # Очередь исходящих сообщений Telegram: сообщений в секунду на всех и в один чат, всплеск для одного чата
+    OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 30))
+    OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', 1))
+    OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', 3))
+    # Потоков отправки, максимум сообщений в очереди и сколько ждать места в ней (секунд)
+    OUTBOUND_WORKERS = int(os.getenv('OUTBOUND_WORKERS', 4))
+    OUTBOUND_QUEUE_SIZE = int(os.getenv('OUTBOUND_QUEUE_SIZE', 10000))
+    OUTBOUND_ENQUEUE_TIMEOUT = float(os.getenv('OUTBOUND_ENQUEUE_TIMEOUT', 5))
+    # Повторы при временных ошибках: количество и задержка с разбросом (секунд)
+    OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 5))
+    OUTBOUND_BACKOFF_BASE = float(os.getenv('OUTBOUND_BACKOFF_BASE', 1))
+    OUTBOUND_BACKOFF_MAX = float(os.getenv('OUTBOUND_BACKOFF_MAX', 60))
+    # Сколько раз одно сообщение может получить 429 Too Many Requests, прежде чем считаться недоставленным
+    OUTBOUND_MAX_RATE_LIMITED = int(os.getenv('OUTBOUND_MAX_RATE_LIMITED', 10))
+
+    # Сообщения о ходе долгих операций (рассылки, массовый запуск ботов) правятся не чаще раза в столько секунд
+    PROGRESS_UPDATE_INTERVAL = float(os.getenv('PROGRESS_UPDATE_INTERVAL', 3))
+
+    # Получение обновлений Telegram: polling (infinity_polling) или webhook (локальный HTTP-сервер)
+    TELEGRAM_MODE = os.getenv('TELEGRAM_MODE', 'polling').lower()
+    # Публичный адрес webhook для Telegram и секрет, который Telegram передает в заголовке
+    # X-Telegram-Bot-Api-Secret-Token (одинаковые у всех реплик за балансировщиком)
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+    # Адрес, порт и путь локального HTTP-сервера (TLS завершается на прокси или балансировщике)
+    WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+    # Очередь входящих обновлений (при переполнении ответ 503 и Telegram повторит доставку) и потоков ее разбора
+    WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 2))
+    # Одновременных соединений Telegram к webhook
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+
     # Файл базы данных
     DB_FILE = os.path.join(DATA_DIR, 'system.db')
 
+    # Пул соединений с базой данных
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 16))
+    DB_POOL_HEALTHCHECK_INTERVAL = int(os.getenv('DB_POOL_HEALTHCHECK_INTERVAL', 60))
+
+    # Кэш пользователей и прав (CACHE_TTL=0 отключает кэш)
+    CACHE_SIZE = int(os.getenv('CACHE_SIZE', 4096))
+    CACHE_TTL = int(os.getenv('CACHE_TTL', 60))
+
+    # Интервал сверки счетчиков статистики с таблицами (0 отключает сверку)
+    COUNTERS_RECONCILE_INTERVAL = int(os.getenv('COUNTERS_RECONCILE_INTERVAL', 3600))
+
+    # Автоматическое применение миграций схемы при запуске
+    DB_AUTO_MIGRATE = os.getenv('DB_AUTO_MIGRATE', 'true').lower() in ('1', 'true', 'yes')
+
+    # Профиль хранилища SQLite: legacy, balanced, durable, fast
+    DB_PROFILE = os.getenv('DB_PROFILE', 'balanced')
+    # Переопределения отдельных PRAGMA профиля
+    DB_PRAGMA_OVERRIDES = {
+        name: os.getenv(env)
+        for name, env in {
+            'journal_mode': 'DB_JOURNAL_MODE',
+            'synchronous': 'DB_SYNCHRONOUS',
+            'busy_timeout': 'DB_BUSY_TIMEOUT',
+            'cache_size': 'DB_CACHE_SIZE',
+            'mmap_size': 'DB_MMAP_SIZE',
+            'temp_store': 'DB_TEMP_STORE',
+        }.items()
+        if os.getenv(env)
+    }
+
     @classmethod
     def setup_directories(cls):
         """Создает необходимые директории"""
@@ -1,6 +1,6 @@
 import sys
 import threading
-from database import db_instance as Database
+from database import db_instance as Database, format_migration_report
 from utils import Utils
 from config import logger
 
@@ -15,6 +15,10 @@ class ConsoleHandler:
                 return
 
             parts = command.split()
+            if parts[0].lower() == "/migrate":
+                ConsoleHandler.handle_migrate(parts)
+                return
+
             if len(parts) < 2:
                 print("❌ Использование: /op @username или /unop @username")
                 return
@@ -41,12 +45,31 @@ class ConsoleHandler:
                     print(f"❌ Не удалось понизить @{username}")
 
             else:
-                print("❌ Неизвестная команда. Доступно: /op, /unop")
+                print("❌ Неизвестная команда. Доступно: /op, /unop, /migrate")
 
         except Exception as e:
             print(f"❌ Ошибка обработки команды: {e}")
             logger.error(f"Console command error: {e}")
 
+    @staticmethod
+    def handle_migrate(parts):
+        """Обработка команды /migrate [status|dry|apply]"""
+        mode = parts[1].lower() if len(parts) > 1 else "status"
+
+        if mode == "status":
+            current_version, latest_version = Database.get_schema_version()
+            print(f"🗄️ Версия схемы: {current_version} (последняя: {latest_version})")
+        elif mode == "dry":
+            print(format_migration_report(Database.migrate(dry_run=True)))
+        elif mode == "apply":
+            was_ready = Database.schema_ready.is_set()
+            print(format_migration_report(Database.migrate()))
+            logger.info("CONSOLE: database migrations applied")
+            if not was_ready and Database.schema_ready.is_set():
+                print("▶️ Схема актуальна, запускаю ботов...")
+        else:
+            print("❌ Использование: /migrate [status|dry|apply]")
+
     @staticmethod
     def start_console_listener():
         """Запуск прослушивания консольных команд в отдельном потоке"""
@@ -56,6 +79,7 @@ class ConsoleHandler:
             print("Доступные команды:")
             print("  /op @username    - повысить до оператора")
             print("  /unop @username  - понизить с оператора")
+            print("  /migrate [status|dry|apply] - миграции базы данных")
             print("Для выхода: Ctrl+C\n")
 
             while True:
@@ -1,18 +1,615 @@
 import sqlite3
+import threading
 import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
 from config import Config, logger
 
 
+# Профили хранилища: PRAGMA, применяемые к каждому новому соединению
+STORAGE_PROFILES = {
+    # Настройки SQLite по умолчанию (rollback journal)
+    'legacy': {},
+    # WAL: читатели не блокируются писателями
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -16000,
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+    # WAL с полной синхронизацией на диск
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 10000,
+        'cache_size': -8000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+    },
+    # Максимальная скорость ценой устойчивости к сбоям питания
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'busy_timeout': 5000,
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+}
+
+# Допустимые значения PRAGMA (значения подставляются в SQL, поэтому проверяются)
+PRAGMA_CHOICES = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+    'temp_store': {'DEFAULT', 'FILE', 'MEMORY'},
+}
+PRAGMA_INTEGERS = {'busy_timeout', 'cache_size', 'mmap_size'}
+
+
+def resolve_storage_profile():
+    """Сборка PRAGMA из профиля Config.DB_PROFILE и переопределений из .env"""
+    profile = STORAGE_PROFILES.get(Config.DB_PROFILE)
+    if profile is None:
+        logger.error(f"Unknown DB_PROFILE '{Config.DB_PROFILE}', falling back to 'balanced'")
+        profile = STORAGE_PROFILES['balanced']
+
+    pragmas = dict(profile)
+    pragmas.update(Config.DB_PRAGMA_OVERRIDES)
+
+    for name, value in list(pragmas.items()):
+        if name in PRAGMA_INTEGERS:
+            try:
+                pragmas[name] = int(value)
+            except (TypeError, ValueError):
+                logger.error(f"Invalid value for PRAGMA {name}: {value}")
+                del pragmas[name]
+        elif name in PRAGMA_CHOICES:
+            pragmas[name] = str(value).upper()
+            if pragmas[name] not in PRAGMA_CHOICES[name]:
+                logger.error(f"Invalid value for PRAGMA {name}: {value}")
+                del pragmas[name]
+        else:
+            logger.error(f"Unsupported PRAGMA {name}")
+            del pragmas[name]
+
+    return pragmas
+
+
+# Материализованные счетчики для /stats: имя -> запрос реального значения
+COUNTER_QUERIES = {
+    'total_users': 'SELECT COUNT(*) FROM users',
+    'banned_users': 'SELECT COUNT(*) FROM users WHERE banned',
+    'operators': 'SELECT COUNT(*) FROM operators',
+    'global_admins': 'SELECT COUNT(*) FROM global_admins',
+    'local_admins': 'SELECT COUNT(DISTINCT username) FROM bot_ladmins',
+    'total_bots': 'SELECT COUNT(*) FROM bots',
+    'running_bots': 'SELECT COUNT(*) FROM bots WHERE state',
+}
+
+
+def _counter_delta(name, delta):
+    return f"UPDATE counters SET value = value + ({delta}) WHERE name = '{name}';"
+
+
+def _create_counters(conn):
+    """Таблица счетчиков, начальные значения и триггеры, обновляющие их в той же транзакции"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for name, query in COUNTER_QUERIES.items():
+        conn.execute(f'INSERT OR REPLACE INTO counters (name, value) SELECT ?, ({query})', (name,))
+
+    triggers = {
+        'trg_users_insert': ('AFTER INSERT ON users', [
+            _counter_delta('total_users', 1),
+            _counter_delta('banned_users', 'NEW.banned != 0'),
+        ]),
+        'trg_users_delete': ('AFTER DELETE ON users', [
+            _counter_delta('total_users', -1),
+            _counter_delta('banned_users', '-(OLD.banned != 0)'),
+        ]),
+        'trg_users_banned': ('AFTER UPDATE OF banned ON users', [
+            _counter_delta('banned_users', '(NEW.banned != 0) - (OLD.banned != 0)'),
+        ]),
+        'trg_operators_insert': ('AFTER INSERT ON operators', [_counter_delta('operators', 1)]),
+        'trg_operators_delete': ('AFTER DELETE ON operators', [_counter_delta('operators', -1)]),
+        'trg_global_admins_insert': ('AFTER INSERT ON global_admins', [_counter_delta('global_admins', 1)]),
+        'trg_global_admins_delete': ('AFTER DELETE ON global_admins', [_counter_delta('global_admins', -1)]),
+        # Локальный админ считается один раз, сколько бы ботов у него ни было
+        'trg_bot_ladmins_insert': (
+            'AFTER INSERT ON bot_ladmins WHEN NOT EXISTS (SELECT 1 FROM bot_ladmins '
+            'WHERE username = NEW.username AND bot_name != NEW.bot_name)',
+            [_counter_delta('local_admins', 1)]
+        ),
+        'trg_bot_ladmins_delete': (
+            'AFTER DELETE ON bot_ladmins WHEN NOT EXISTS (SELECT 1 FROM bot_ladmins '
+            'WHERE username = OLD.username)',
+            [_counter_delta('local_admins', -1)]
+        ),
+        'trg_bots_insert': ('AFTER INSERT ON bots', [
+            _counter_delta('total_bots', 1),
+            _counter_delta('running_bots', 'NEW.state != 0'),
+        ]),
+        'trg_bots_delete': ('AFTER DELETE ON bots', [
+            _counter_delta('total_bots', -1),
+            _counter_delta('running_bots', '-(OLD.state != 0)'),
+        ]),
+        'trg_bots_state': ('AFTER UPDATE OF state ON bots', [
+            _counter_delta('running_bots', '(NEW.state != 0) - (OLD.state != 0)'),
+        ]),
+    }
+    for trigger_name, (event, statements) in triggers.items():
+        conn.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {trigger_name} {event} '
+            f'BEGIN {" ".join(statements)} END'
+        )
+
+
+
+class Migration:
+    """Шаг миграции схемы: SQL-выражения и/или функция, получающая соединение"""
+
+    def __init__(self, version, description, statements=(), func=None):
+        self.version = version
+        self.description = description
+        self.statements = list(statements)
+        self.func = func
+
+    def apply(self, conn):
+        """Выполнение шага на переданном соединении"""
+        for statement in self.statements:
+            conn.execute(statement)
+        if self.func:
+            self.func(conn)
+
+
+# Миграции схемы по возрастанию версии. Версия базы хранится в PRAGMA user_version
+MIGRATIONS = [
+    Migration(1, "Secondary indexes for hot lookup columns", [
+        'CREATE INDEX IF NOT EXISTS idx_bot_ladmins_username ON bot_ladmins (username)',
+        'CREATE INDEX IF NOT EXISTS idx_auth_codes_created_at ON auth_codes (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_auth_codes_username ON auth_codes (username)',
+        'CREATE INDEX IF NOT EXISTS idx_bans_banned_at ON bans (banned_at)',
+        'CREATE INDEX IF NOT EXISTS idx_users_user_id ON users (user_id)',
+    ]),
+    Migration(2, "Indexed expiry time for temporary bans", [
+        'ALTER TABLE bans ADD COLUMN expires_at INTEGER',
+        'UPDATE bans SET expires_at = banned_at + ban_time * 3600 WHERE ban_time > 0',
+        'CREATE INDEX IF NOT EXISTS idx_bans_expires_at ON bans (expires_at) WHERE expires_at IS NOT NULL',
+    ]),
+    Migration(3, "Index for used auth codes cleanup", [
+        'CREATE INDEX IF NOT EXISTS idx_auth_codes_used ON auth_codes (used)',
+    ]),
+    Migration(4, "Materialized counters maintained by triggers", func=_create_counters),
+    Migration(5, "Process id and create time of supervised bots", [
+        'ALTER TABLE bots ADD COLUMN pid INTEGER',
+        'ALTER TABLE bots ADD COLUMN pid_create_time REAL',
+    ]),
+    Migration(6, "Exit code and time of supervised bots", [
+        'ALTER TABLE bots ADD COLUMN exit_code INTEGER',
+        'ALTER TABLE bots ADD COLUMN exited_at INTEGER',
+    ]),
+    Migration(7, "Restart policy of supervised bots", [
+        "ALTER TABLE bots ADD COLUMN restart_policy TEXT NOT NULL DEFAULT 'never'",
+    ]),
+    Migration(8, "Downsampled resource usage of supervised bots", [
+        '''CREATE TABLE IF NOT EXISTS bot_metrics (
+            bot_name TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            cpu_avg REAL NOT NULL,
+            cpu_max REAL NOT NULL,
+            rss_avg INTEGER NOT NULL,
+            rss_max INTEGER NOT NULL,
+            threads INTEGER NOT NULL,
+            fds INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (bot_name, ts)
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_bot_metrics_ts ON bot_metrics (ts)',
+    ]),
+    Migration(9, "Health probe of supervised bots", [
+        'ALTER TABLE bots ADD COLUMN probe_type TEXT',
+        'ALTER TABLE bots ADD COLUMN probe_target TEXT',
+    ]),
+    Migration(10, "Persisted broadcast jobs and per-recipient delivery state", [
+        '''CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            created_by TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'sending',
+            total INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER NOT NULL,
+            finished_at INTEGER
+        )''',
+        '''CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            job_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            updated_at INTEGER,
+            PRIMARY KEY (job_id, username),
+            FOREIGN KEY (job_id) REFERENCES broadcast_jobs (id) ON DELETE CASCADE
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_broadcast_deliveries_pending "
+        "ON broadcast_deliveries (job_id, username) WHERE status = 'pending'",
+    ]),
+    Migration(11, "Remove rows left by ON DELETE CASCADE while foreign keys were not enforced", [
+        'DELETE FROM bot_ladmins WHERE bot_name NOT IN (SELECT name FROM bots)',
+        'DELETE FROM broadcast_deliveries WHERE job_id NOT IN (SELECT id FROM broadcast_jobs)',
+    ]),
+]
+
+
+class SchemaMigrator:
+    """Применение миграций схемы с учетом PRAGMA user_version"""
+
+    def __init__(self, conn, migrations=None):
+        self.conn = conn
+        self.migrations = sorted(migrations or MIGRATIONS, key=lambda m: m.version)
+
+        versions = [m.version for m in self.migrations]
+        if len(set(versions)) != len(versions):
+            raise ValueError("Duplicate migration versions")
+
+    def current_version(self):
+        """Текущая версия схемы базы"""
+        return self.conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def pending(self):
+        """Миграции, которые еще не применены"""
+        current_version = self.current_version()
+        return [m for m in self.migrations if m.version > current_version]
+
+    def run(self, dry_run=False):
+        """Применение ожидающих миграций, каждая в своей транзакции.
+
+        В режиме dry_run все шаги выполняются в одной транзакции, которая
+        затем откатывается: так проверяются SQL и замеряется время.
+        Возвращает отчет: список словарей version/description/status/duration_ms.
+        """
+        report = []
+        pending = self.pending()
+        if not pending:
+            return report
+
+        if dry_run:
+            self.conn.execute('BEGIN')
+        try:
+            for migration in pending:
+                started = time.perf_counter()
+                if not dry_run:
+                    self.conn.execute('BEGIN')
+                try:
+                    migration.apply(self.conn)
+                    self.conn.execute(f'PRAGMA user_version = {int(migration.version)}')
+                    if not dry_run:
+                        self.conn.commit()
+                except Exception as e:
+                    if not dry_run:
+                        self.conn.rollback()
+                    report.append(self._report_entry(migration, f"failed: {e}", started))
+                    logger.error(f"Migration {migration.version} failed: {e}")
+                    break
+
+                status = "ok (dry-run)" if dry_run else "applied"
+                report.append(self._report_entry(migration, status, started))
+                if not dry_run:
+                    logger.info(f"Database migrated to version {migration.version}: {migration.description}")
+        finally:
+            if dry_run:
+                self.conn.rollback()
+
+        return report
+
+    @staticmethod
+    def _report_entry(migration, status, started):
+        return {
+            'version': migration.version,
+            'description': migration.description,
+            'status': status,
+            'duration_ms': (time.perf_counter() - started) * 1000,
+        }
+
+
+def format_migration_report(report):
+    """Форматирование отчета о миграциях"""
+    if not report:
+        return "✅ Схема базы данных актуальна"
+
+    lines = []
+    for entry in report:
+        lines.append(
+            f"v{entry['version']} {entry['description']}: "
+            f"{entry['status']} ({entry['duration_ms']:.1f} ms)"
+        )
+    return "\n".join(lines)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Пользователь и его права, загруженные одним запросом"""
+    username: str = None
+    user: MappingProxyType = None
+    ban: MappingProxyType = None
+    operator: bool = False
+    global_admin: bool = False
+    ladmin_bots: frozenset = frozenset()
+
+    @property
+    def exists(self):
+        """Пользователь зарегистрирован в системе"""
+        return self.user is not None
+
+    @property
+    def banned(self):
+        """Действующий бан (истекший временный бан не учитывается)"""
+        if not self.ban:
+            return False
+        expires_at = self.ban.get('expires_at')
+        return expires_at is None or int(time.time()) < expires_at
+
+    @property
+    def rank(self):
+        """Ранг пользователя или None, если его нет в базе"""
+        return self.user.get('rank', 'user') if self.user else None
+
+    @property
+    def is_operator(self):
+        return self.operator
+
+    @property
+    def is_global_admin(self):
+        return self.operator or self.global_admin
+
+    def is_local_admin(self, bot_name=None):
+        """Локальный админ бота (глобальные админы и операторы - для всех ботов)"""
+        if self.is_global_admin:
+            return True
+        return bool(bot_name) and bot_name in self.ladmin_bots
+
+
+class TTLCache:
+    """Ограниченный LRU-кэш с временем жизни записей и счетчиками попаданий"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._data = OrderedDict()  # ключ -> (время истечения, значение)
+        self._lock = threading.Lock()
+        # Увеличивается при каждой инвалидации: значение, загруженное до нее, не кэшируется
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        """Значение из кэша или None"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation):
+        """Сохранение значения, загруженного при указанном поколении кэша"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        """Удаление записей по ключам"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if key:
+                    self._data.pop(key.lower(), None)
+
+    def clear(self):
+        """Полная очистка кэша"""
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        """Счетчики кэша"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений SQLite: одно соединение на поток.
+
+    Соединения сверх DB_POOL_SIZE (и открытые после close_all) тоже
+    учитываются: они закрываются, когда их поток завершается, или в close_all.
+    """
+
+    def __init__(self, db_file, max_size, health_check_interval, pragmas=None):
+        self.db_file = db_file
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.pragmas = pragmas or {}
+
+        self._local = threading.local()
+        self._connections = {}  # ident потока -> (поток, соединение)
+        self._overflow = {}  # ident потока -> (поток, соединение) сверх max_size
+        self._lock = threading.Lock()
+        self._closed = False
+        self._generation = 0  # увеличивается в close_all: старые соединения потоков недействительны
+        self._exhausted = False  # предупреждение о заполненном пуле уже выведено
+
+    def _connect(self):
+        """Открытие нового соединения"""
+        # Соединение используется только своим потоком, но закрывается из close_all()
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # Без этого SQLite не проверяет внешние ключи и не выполняет ON DELETE CASCADE
+        conn.execute('PRAGMA foreign_keys = ON')
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn):
+        """Проверка работоспособности соединения"""
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Error closing database connection: {e}")
+
+    def _prune_dead_threads(self):
+        """Закрытие соединений завершившихся потоков (вызывается под блокировкой)"""
+        for connections in (self._connections, self._overflow):
+            for ident, (thread, conn) in list(connections.items()):
+                if not thread.is_alive():
+                    del connections[ident]
+                    self._close(conn)
+
+    def _discard(self, ident):
+        """Удаление соединения потока из пула"""
+        with self._lock:
+            entries = [self._connections.pop(ident, None), self._overflow.pop(ident, None)]
+        self._local.conn = None
+        for entry in entries:
+            if entry:
+                self._close(entry[1])
+
+    def acquire(self):
+        """Получение соединения текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.generation == self._generation:
+            now = time.monotonic()
+            if now - self._local.checked_at < self.health_check_interval:
+                return conn
+            if self._is_healthy(conn):
+                self._local.checked_at = now
+                return conn
+            logger.warning("Database connection failed health check, reconnecting")
+            self._discard(threading.get_ident())
+
+        conn = self._connect()
+        ident = threading.get_ident()
+        with self._lock:
+            # Соединения завершившихся потоков (в том числе с тем же ident) освобождают место
+            self._prune_dead_threads()
+            for connections in (self._connections, self._overflow):
+                stale = connections.pop(ident, None)
+                if stale:
+                    self._close(stale[1])
+
+            if self._closed or len(self._connections) >= self.max_size:
+                if not self._closed and not self._exhausted:
+                    self._exhausted = True
+                    logger.warning(f"Database connection pool exhausted ({self.max_size}), "
+                                   f"using overflow connections")
+                self._overflow[ident] = (threading.current_thread(), conn)
+            else:
+                self._exhausted = False
+                self._connections[ident] = (threading.current_thread(), conn)
+            generation = self._generation
+
+        self._local.conn = conn
+        self._local.checked_at = time.monotonic()
+        self._local.generation = generation
+        return conn
+
+    def size(self):
+        """Количество открытых соединений в пуле"""
+        with self._lock:
+            return len(self._connections)
+
+    def overflow_size(self):
+        """Количество открытых соединений сверх размера пула"""
+        with self._lock:
+            return len(self._overflow)
+
+    def close_all(self):
+        """Закрытие всех соединений пула"""
+        with self._lock:
+            self._closed = True
+            self._generation += 1
+            connections = list(self._connections.values()) + list(self._overflow.values())
+            self._connections.clear()
+            self._overflow.clear()
+
+        for _, conn in connections:
+            self._close(conn)
+        logger.info(f"Database connection pool closed ({len(connections)} connections)")
+
+
 class Database:
     def __init__(self):
         self.db_file = Config.DB_FILE
+        self.pool = ConnectionPool(
+            self.db_file,
+            Config.DB_POOL_SIZE,
+            Config.DB_POOL_HEALTHCHECK_INTERVAL,
+            resolve_storage_profile()
+        )
+        self.cache = TTLCache(Config.CACHE_SIZE, Config.CACHE_TTL)
+        self.ban_listeners = []
+        # Схема соответствует коду (нет ожидающих миграций): только тогда боты обслуживают запросы
+        self.schema_ready = threading.Event()
         self.init_database()
 
     def get_connection(self):
-        """Получение соединения с базой данных"""
-        conn = sqlite3.connect(self.db_file)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Получение соединения с базой данных из пула"""
+        return self.pool.acquire()
+
+    def close(self):
+        """Закрытие соединений с базой данных"""
+        self.pool.close_all()
+
+    def cache_stats(self):
+        """Статистика кэша пользователей и прав"""
+        return self.cache.stats()
 
     def init_database(self):
         """Инициализация таблиц базы данных"""
@@ -95,12 +692,104 @@ class Database:
                 ''')
 
                 conn.commit()
-                logger.info("Database initialized successfully")
+
+                if Config.DB_AUTO_MIGRATE:
+                    self.migrate(conn)
+                else:
+                    pending = SchemaMigrator(conn).pending()
+                    if pending:
+                        logger.warning(f"Database has {len(pending)} pending migrations, "
+                                       f"auto-migration is disabled")
+                    else:
+                        self.schema_ready.set()
+
+                journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+                logger.info(f"Database initialized successfully "
+                            f"(profile: {Config.DB_PROFILE}, journal: {journal_mode})")
 
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             raise
 
+    def migrate(self, conn=None, dry_run=False):
+        """Применение миграций схемы. Возвращает отчет SchemaMigrator.run()"""
+        conn = conn or self.get_connection()
+        migrator = SchemaMigrator(conn)
+        report = migrator.run(dry_run=dry_run)
+        if not dry_run and not migrator.pending():
+            self.schema_ready.set()
+        return report
+
+    def get_schema_version(self):
+        """Текущая и последняя известная версии схемы"""
+        conn = self.get_connection()
+        current_version = SchemaMigrator(conn).current_version()
+        latest_version = max((m.version for m in MIGRATIONS), default=0)
+        return current_version, latest_version
+
+    # Permission resolver
+    PRINCIPAL_QUERY = '''
+        SELECT q.username AS username,
+               u.username AS user_username, u.user_id, u.first_name, u.rank, u.banned,
+               u.warns, u.created_at, u.updated_at,
+               b.username AS ban_username, b.banned_by, b.banned_at, b.ban_time, b.reason,
+               b.expires_at,
+               EXISTS (SELECT 1 FROM operators o WHERE o.username = q.username) AS is_operator,
+               EXISTS (SELECT 1 FROM global_admins g WHERE g.username = q.username) AS is_global_admin,
+               (SELECT group_concat(l.bot_name, char(31)) FROM bot_ladmins l
+                 WHERE l.username = q.username) AS ladmin_bots
+        FROM (SELECT ? AS username) AS q
+        LEFT JOIN users u ON u.username = q.username
+        LEFT JOIN bans b ON b.username = q.username
+    '''
+    USER_FIELDS = ('user_id', 'first_name', 'rank', 'banned', 'warns', 'created_at', 'updated_at')
+    BAN_FIELDS = ('banned_by', 'banned_at', 'ban_time', 'reason', 'expires_at')
+
+    def resolve_principal(self, username):
+        """Загрузка пользователя, бана и всех прав одним запросом"""
+        if isinstance(username, Principal):
+            return username
+        if not username:
+            return Principal()
+
+        username = username.lower()
+        cached = self.cache.get(username)
+        if cached is not None:
+            return cached
+
+        generation = self.cache.generation
+        try:
+            with self.get_connection() as conn:
+                row = conn.execute(self.PRINCIPAL_QUERY, (username,)).fetchone()
+        except Exception as e:
+            logger.error(f"Error resolving principal: {e}")
+            return Principal(username=username)
+
+        user = None
+        if row['user_username'] is not None:
+            user = {'username': row['user_username']}
+            user.update({key: row[key] for key in self.USER_FIELDS})
+            user = MappingProxyType(user)
+
+        ban = None
+        if row['ban_username'] is not None:
+            ban = {'username': row['ban_username']}
+            ban.update({key: row[key] for key in self.BAN_FIELDS})
+            ban = MappingProxyType(ban)
+
+        ladmin_bots = frozenset(row['ladmin_bots'].split('\x1f')) if row['ladmin_bots'] else frozenset()
+
+        principal = Principal(
+            username=username,
+            user=user,
+            ban=ban,
+            operator=username == Config.SUPER_OPERATOR or bool(row['is_operator']),
+            global_admin=bool(row['is_global_admin']),
+            ladmin_bots=ladmin_bots
+        )
+        self.cache.put(username, principal, generation)
+        return principal
+
     # User methods
     def add_user(self, user_id, username, first_name):
         """Добавление пользователя"""
@@ -111,6 +800,7 @@ class Database:
                     (user_id, username.lower(), first_name)
                 )
                 conn.commit()
+                self.cache.invalidate(username)
                 return True
         except Exception as e:
             logger.error(f"Error adding user: {e}")
@@ -118,17 +808,10 @@ class Database:
 
     def get_user(self, username):
         """Получение пользователя"""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.execute(
-                    'SELECT * FROM users WHERE username = ?',
-                    (username.lower(),)
-                )
-                result = cursor.fetchone()
-                return dict(result) if result else None
-        except Exception as e:
-            logger.error(f"Error getting user: {e}")
+        if not username:
             return None
+        principal = self.resolve_principal(username)
+        return dict(principal.user) if principal.user else None
 
     def update_user(self, username, updates):
         """Обновление пользователя"""
@@ -142,6 +825,7 @@ class Database:
                     values
                 )
                 conn.commit()
+                self.cache.invalidate(username)
                 return True
         except Exception as e:
             logger.error(f"Error updating user: {e}")
@@ -161,38 +845,151 @@ class Database:
             logger.error(f"Error getting all users: {e}")
             return []
 
-    # Ban methods
-    def is_banned(self, username):
-        """Проверка бана"""
+    # Broadcasts
+    def create_broadcast_job(self, text, created_by):
+        """Создание рассылки: получатели без действующего бана выбираются одним запросом.
+
+        Возвращает (id рассылки, число получателей) или (None, 0).
+        """
+        now = int(time.time())
         try:
             with self.get_connection() as conn:
                 cursor = conn.execute(
-                    'SELECT * FROM bans WHERE username = ?',
-                    (username.lower(),)
+                    'INSERT INTO broadcast_jobs (text, created_by, created_at) VALUES (?, ?, ?)',
+                    (text, created_by, now)
                 )
-                ban_info = cursor.fetchone()
+                job_id = cursor.lastrowid
+                cursor = conn.execute(
+                    'INSERT INTO broadcast_deliveries (job_id, username, user_id) '
+                    'SELECT ?, u.username, u.user_id FROM users u '
+                    'WHERE u.user_id IS NOT NULL AND NOT EXISTS ('
+                    '    SELECT 1 FROM bans b WHERE b.username = u.username '
+                    '    AND (b.expires_at IS NULL OR b.expires_at > ?)'
+                    ')',
+                    (job_id, now)
+                )
+                total = cursor.rowcount
+                conn.execute('UPDATE broadcast_jobs SET total = ? WHERE id = ?', (total, job_id))
+                conn.commit()
+                return job_id, total
+        except Exception as e:
+            logger.error(f"Error creating broadcast job: {e}")
+            return None, 0
 
-                if not ban_info:
-                    return False
+    def claim_broadcast_batch(self, job_id, size):
+        """Перевод следующих size получателей в состояние sending.
 
-                ban_info = dict(ban_info)
-                ban_time = ban_info.get('ban_time', 0)
-                banned_at = ban_info.get('banned_at', 0)
+        Возвращает их список (пустой, если получателей не осталось или рассылка уже
+        не в состоянии sending, например отменена) или None при ошибке базы.
+        """
+        try:
+            with self.get_connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                rows = [dict(row) for row in conn.execute(
+                    "SELECT d.username, d.user_id FROM broadcast_deliveries d "
+                    "JOIN broadcast_jobs j ON j.id = d.job_id AND j.status = 'sending' "
+                    "WHERE d.job_id = ? AND d.status = 'pending' ORDER BY d.username LIMIT ?",
+                    (job_id, size)
+                )]
+                conn.executemany(
+                    "UPDATE broadcast_deliveries SET status = 'sending', updated_at = ? WHERE job_id = ? AND username = ?",
+                    [(int(time.time()), job_id, row['username']) for row in rows]
+                )
+                conn.commit()
+                return rows
+        except Exception as e:
+            logger.error(f"Error claiming broadcast batch: {e}")
+            return None
 
-                # Проверяем временный бан
-                if ban_time > 0:
-                    current_time = int(time.time())
-                    if current_time - banned_at >= ban_time * 3600:
-                        # Время бана истекло, разбаниваем
-                        self.unban_user(username)
-                        return False
-                    return True
-                # Перманентный бан
+    def record_broadcast_results(self, job_id, results):
+        """Запись результатов доставки: [(username, status)], status - sent, failed или pending"""
+        if not results:
+            return True
+        now = int(time.time())
+        try:
+            with self.get_connection() as conn:
+                conn.executemany(
+                    'UPDATE broadcast_deliveries SET status = ?, updated_at = ? WHERE job_id = ? AND username = ?',
+                    [(status, now, job_id, username) for username, status in results]
+                )
+                conn.commit()
                 return True
         except Exception as e:
-            logger.error(f"Error checking ban: {e}")
+            logger.error(f"Error recording broadcast results: {e}")
+            return False
+
+    def mark_broadcast_unknown(self, job_id):
+        """Получатели, отправка которым прервалась перезапуском: результат неизвестен, повторно не отправляются"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(
+                    "UPDATE broadcast_deliveries SET status = 'unknown' WHERE job_id = ? AND status = 'sending'",
+                    (job_id,)
+                )
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error marking broadcast deliveries: {e}")
+            return 0
+
+    def finish_broadcast_job(self, job_id, status):
+        """Завершение рассылки со статусом done или cancelled. False, если она уже завершена"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(
+                    "UPDATE broadcast_jobs SET status = ?, finished_at = ? WHERE id = ? AND status = 'sending'",
+                    (status, int(time.time()), job_id)
+                )
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error finishing broadcast job: {e}")
             return False
 
+    def get_broadcast_job(self, job_id):
+        """Рассылка с числом получателей в каждом состоянии ('deliveries') или None"""
+        try:
+            with self.get_connection() as conn:
+                row = conn.execute('SELECT * FROM broadcast_jobs WHERE id = ?', (job_id,)).fetchone()
+                if not row:
+                    return None
+                job = dict(row)
+                job['deliveries'] = {
+                    status: count for status, count in conn.execute(
+                        'SELECT status, COUNT(*) FROM broadcast_deliveries WHERE job_id = ? GROUP BY status',
+                        (job_id,)
+                    )
+                }
+                return job
+        except Exception as e:
+            logger.error(f"Error getting broadcast job: {e}")
+            return None
+
+    def get_broadcast_jobs(self, status=None, limit=None):
+        """Рассылки, новые первыми (по статусу, если указан)"""
+        query = 'SELECT * FROM broadcast_jobs'
+        params = []
+        if status:
+            query += ' WHERE status = ?'
+            params.append(status)
+        query += ' ORDER BY id DESC'
+        if limit:
+            query += ' LIMIT ?'
+            params.append(limit)
+        try:
+            with self.get_connection() as conn:
+                return [dict(row) for row in conn.execute(query, params)]
+        except Exception as e:
+            logger.error(f"Error getting broadcast jobs: {e}")
+            return []
+
+    # Ban methods
+    def is_banned(self, username):
+        """Проверка бана (истекшие баны снимает BanExpiryScheduler)"""
+        if not username:
+            return False
+        return self.resolve_principal(username).banned
+
     def ban_user(self, username, banned_by, ban_time=0, reason=""):
         """Бан пользователя"""
         try:
@@ -208,13 +1005,21 @@ class Database:
                 conn.execute('DELETE FROM operators WHERE username = ?', (username.lower(),))
 
                 # Добавляем запись о бане
+                banned_at = int(time.time())
+                expires_at = banned_at + ban_time * 3600 if ban_time > 0 else None
                 conn.execute(
-                    'INSERT OR REPLACE INTO bans (username, banned_by, banned_at, ban_time, reason) VALUES (?, ?, ?, ?, ?)',
-                    (username.lower(), banned_by.lower(), int(time.time()), ban_time, reason)
+                    'INSERT OR REPLACE INTO bans (username, banned_by, banned_at, ban_time, reason, expires_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (username.lower(), banned_by.lower(), banned_at, ban_time, reason, expires_at)
                 )
 
                 conn.commit()
-                return True
+                self.cache.invalidate(username)
+
+            if expires_at is not None:
+                for listener in self.ban_listeners:
+                    listener(username.lower(), expires_at)
+            return True
         except Exception as e:
             logger.error(f"Error banning user: {e}")
             return False
@@ -236,11 +1041,55 @@ class Database:
                 )
 
                 conn.commit()
+                self.cache.invalidate(username)
                 return True
         except Exception as e:
             logger.error(f"Error unbanning user: {e}")
             return False
 
+    def add_ban_listener(self, callback):
+        """Подписка на временные баны: callback(username, expires_at)"""
+        self.ban_listeners.append(callback)
+
+    def get_next_ban_expiry(self):
+        """Ближайшее время окончания временного бана или None"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('SELECT MIN(expires_at) FROM bans WHERE expires_at IS NOT NULL')
+                return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error getting next ban expiry: {e}")
+            return None
+
+    def lift_expired_bans(self, now=None):
+        """Снятие всех истекших банов одной транзакцией. Возвращает список username"""
+        now = int(time.time()) if now is None else now
+        try:
+            with self.get_connection() as conn:
+                usernames = [row['username'] for row in conn.execute(
+                    'SELECT username FROM bans WHERE expires_at IS NOT NULL AND expires_at <= ?',
+                    (now,)
+                )]
+                if not usernames:
+                    return []
+
+                conn.execute(
+                    'UPDATE users SET banned = FALSE WHERE username IN '
+                    '(SELECT username FROM bans WHERE expires_at IS NOT NULL AND expires_at <= ?)',
+                    (now,)
+                )
+                conn.execute(
+                    'DELETE FROM bans WHERE expires_at IS NOT NULL AND expires_at <= ?',
+                    (now,)
+                )
+
+                conn.commit()
+                self.cache.invalidate(*usernames)
+                return usernames
+        except Exception as e:
+            logger.error(f"Error lifting expired bans: {e}")
+            return []
+
     def get_ban_info(self, username):
         """Получение информации о бане"""
         try:
@@ -258,58 +1107,23 @@ class Database:
     # Admin management
     def is_operator(self, username):
         """Проверка оператора"""
-        if not username or username.lower() == Config.SUPER_OPERATOR:
-            return username and username.lower() == Config.SUPER_OPERATOR
-
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.execute(
-                    'SELECT 1 FROM operators WHERE username = ?',
-                    (username.lower(),)
-                )
-                return cursor.fetchone() is not None
-        except Exception as e:
-            logger.error(f"Error checking operator: {e}")
+        if not username:
             return False
+        if username.lower() == Config.SUPER_OPERATOR:
+            return True
+        return self.resolve_principal(username).is_operator
 
     def is_global_admin(self, username):
         """Проверка глобального админа"""
         if not username:
             return False
-        if self.is_operator(username):
-            return True
-
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.execute(
-                    'SELECT 1 FROM global_admins WHERE username = ?',
-                    (username.lower(),)
-                )
-                return cursor.fetchone() is not None
-        except Exception as e:
-            logger.error(f"Error checking global admin: {e}")
-            return False
+        return self.resolve_principal(username).is_global_admin
 
     def is_local_admin(self, username, bot_name=None):
         """Проверка локального админа"""
         if not username:
             return False
-
-        if self.is_global_admin(username):
-            return True
-
-        if bot_name:
-            try:
-                with self.get_connection() as conn:
-                    cursor = conn.execute(
-                        'SELECT 1 FROM bot_ladmins WHERE bot_name = ? AND username = ?',
-                        (bot_name, username.lower())
-                    )
-                    return cursor.fetchone() is not None
-            except Exception as e:
-                logger.error(f"Error checking local admin: {e}")
-                return False
-        return False
+        return self.resolve_principal(username).is_local_admin(bot_name)
 
     def add_operator(self, username):
         """Добавление оператора"""
@@ -337,6 +1151,7 @@ class Database:
                 )
 
                 conn.commit()
+                self.cache.invalidate(username)
                 return True
         except Exception as e:
             logger.error(f"Error adding operator: {e}")
@@ -362,6 +1177,7 @@ class Database:
                 )
 
                 conn.commit()
+                self.cache.invalidate(username)
                 return True
         except Exception as e:
             logger.error(f"Error removing operator: {e}")
@@ -390,6 +1206,7 @@ class Database:
                 )
 
                 conn.commit()
+                self.cache.invalidate(username)
                 return True
         except Exception as e:
             logger.error(f"Error adding global admin: {e}")
@@ -415,6 +1232,7 @@ class Database:
                 )
 
                 conn.commit()
+                self.cache.invalidate(username)
                 return True
         except Exception as e:
             logger.error(f"Error removing global admin: {e}")
@@ -454,13 +1272,13 @@ class Database:
         return False
 
     # Bot management
-    def add_bot(self, bot_name, exe_path, bot_username, bot_type="Standard"):
+    def add_bot(self, bot_name, exe_path, bot_username, bot_type="Standard", restart_policy=None):
         """Добавление бота"""
         try:
             with self.get_connection() as conn:
                 conn.execute(
-                    'INSERT INTO bots (name, exe_path, username, type) VALUES (?, ?, ?, ?)',
-                    (bot_name, exe_path, bot_username, bot_type)
+                    'INSERT INTO bots (name, exe_path, username, type, restart_policy) VALUES (?, ?, ?, ?, ?)',
+                    (bot_name, exe_path, bot_username, bot_type, restart_policy or Config.BOT_RESTART_POLICY)
                 )
                 conn.commit()
                 return True
@@ -474,16 +1292,53 @@ class Database:
         """Удаление бота"""
         try:
             with self.get_connection() as conn:
+                ladmins = [row['username'] for row in conn.execute(
+                    'SELECT username FROM bot_ladmins WHERE bot_name = ?',
+                    (bot_name,)
+                )]
                 conn.execute(
                     'DELETE FROM bots WHERE name = ?',
                     (bot_name,)
                 )
+                conn.execute(
+                    'DELETE FROM bot_metrics WHERE bot_name = ?',
+                    (bot_name,)
+                )
                 conn.commit()
+                self.cache.invalidate(*ladmins)
                 return True
         except Exception as e:
             logger.error(f"Error removing bot: {e}")
             return False
 
+    def set_bot_restart_policy(self, bot_name, restart_policy):
+        """Установка политики перезапуска бота"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(
+                    'UPDATE bots SET restart_policy = ? WHERE name = ?',
+                    (restart_policy, bot_name)
+                )
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error setting bot restart policy: {e}")
+            return False
+
+    def set_bot_probe(self, bot_name, probe_type, probe_target):
+        """Установка пробы здоровья бота (None отключает пробу)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(
+                    'UPDATE bots SET probe_type = ?, probe_target = ? WHERE name = ?',
+                    (probe_type, probe_target, bot_name)
+                )
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error setting bot probe: {e}")
+            return False
+
     def get_bot(self, bot_name):
         """Получение бота"""
         try:
@@ -522,6 +1377,76 @@ class Database:
             logger.error(f"Error updating bot state: {e}")
             return False
 
+    def update_bot_process(self, bot_name, pid, create_time=None):
+        """Сохранение PID и времени создания процесса бота (pid=None - бот остановлен)"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute(
+                    'UPDATE bots SET pid = ?, pid_create_time = ?, state = ? WHERE name = ?',
+                    (pid, create_time if pid else None, pid is not None, bot_name)
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error updating bot process: {e}")
+            return False
+
+    def record_bot_exit(self, bot_name, pid, exit_code, exited_at):
+        """Запись завершения процесса бота (если бот не был перезапущен с другим PID)"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute(
+                    'UPDATE bots SET state = FALSE, pid = NULL, pid_create_time = NULL, '
+                    'exit_code = ?, exited_at = ? WHERE name = ? AND (pid = ? OR pid IS NULL)',
+                    (exit_code, exited_at, bot_name, pid)
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error recording bot exit: {e}")
+            return False
+
+    # Bot resource metrics
+    def save_bot_metrics(self, rows):
+        """Сохранение усредненных замеров ресурсов ботов"""
+        try:
+            with self.get_connection() as conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO bot_metrics '
+                    '(bot_name, ts, cpu_avg, cpu_max, rss_avg, rss_max, threads, fds, samples) '
+                    'VALUES (:bot_name, :ts, :cpu_avg, :cpu_max, :rss_avg, :rss_max, :threads, :fds, :samples)',
+                    rows
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error saving bot metrics: {e}")
+            return False
+
+    def get_bot_metrics(self, bot_name, since):
+        """Сохраненные замеры ресурсов бота начиная с момента since"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(
+                    'SELECT * FROM bot_metrics WHERE bot_name = ? AND ts >= ? ORDER BY ts',
+                    (bot_name, since)
+                )
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting bot metrics: {e}")
+            return []
+
+    def prune_bot_metrics(self, before):
+        """Удаление замеров старше before. Возвращает число удаленных строк"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('DELETE FROM bot_metrics WHERE ts < ?', (before,))
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error pruning bot metrics: {e}")
+            return 0
+
     # Local admin management
     def add_ladmin_to_bot(self, username, bot_name):
         """Добавление локального админа к боту"""
@@ -549,6 +1474,7 @@ class Database:
                 )
 
                 conn.commit()
+                self.cache.invalidate(username)
                 return True
         except Exception as e:
             logger.error(f"Error adding local admin: {e}")
@@ -591,6 +1517,7 @@ class Database:
                     )
 
                 conn.commit()
+                self.cache.invalidate(username)
                 return True
         except Exception as e:
             logger.error(f"Error removing local admin: {e}")
@@ -639,6 +1566,58 @@ class Database:
             logger.error(f"Error getting all ladmins: {e}")
             return []
 
+    # Statistics
+    def get_stats(self):
+        """Счетчики пользователей, администраторов и ботов из таблицы counters"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('SELECT name, value FROM counters')
+                stats = {name: 0 for name in COUNTER_QUERIES}
+                stats.update({row['name']: row['value'] for row in cursor.fetchall()})
+                return stats
+        except Exception as e:
+            logger.error(f"Error getting stats: {e}")
+            return None
+
+    def compute_stats(self, conn=None):
+        """Реальные значения счетчиков, посчитанные по таблицам одним запросом"""
+        columns = ', '.join(f'({query}) AS {name}' for name, query in COUNTER_QUERIES.items())
+        try:
+            conn = conn or self.get_connection()
+            return dict(conn.execute(f'SELECT {columns}').fetchone())
+        except Exception as e:
+            logger.error(f"Error computing stats: {e}")
+            return None
+
+    def reconcile_counters(self):
+        """Сверка счетчиков с таблицами. Возвращает расхождения {имя: (счетчик, реальное)}"""
+        try:
+            with self.get_connection() as conn:
+                # Блокировка записи на время сверки, чтобы счетчики не менялись между чтениями
+                conn.execute('BEGIN IMMEDIATE')
+                actual = self.compute_stats(conn)
+                if actual is None:
+                    conn.rollback()
+                    return {}
+
+                stored = {row['name']: row['value'] for row in conn.execute('SELECT name, value FROM counters')}
+                drift = {
+                    name: (stored.get(name), value)
+                    for name, value in actual.items()
+                    if stored.get(name) != value
+                }
+                for name, value in actual.items():
+                    if name in drift:
+                        conn.execute(
+                            'INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?)',
+                            (name, value)
+                        )
+                conn.commit()
+                return drift
+        except Exception as e:
+            logger.error(f"Error reconciling counters: {e}")
+            return {}
+
     # Auth codes
     def add_auth_code(self, code, username):
         """Добавление кода аутентификации"""
@@ -682,48 +1661,80 @@ class Database:
             logger.error(f"Error getting auth code: {e}")
             return None
 
-    def cleanup_expired_auth_codes(self):
-        """Очистка просроченных кодов"""
+    def cleanup_expired_auth_codes(self, batch_size=None):
+        """Очистка просроченных и использованных кодов.
+
+        Удаляет пачками по batch_size строк, каждая пачка - отдельная короткая
+        транзакция, чтобы не держать блокировку записи. Возвращает число удаленных строк.
+        """
+        batch_size = batch_size or Config.AUTH_CLEANUP_BATCH_SIZE
+        expire_time = int(time.time()) - Config.AUTH_CODE_EXPIRE_TIME
+        deleted = 0
+
         try:
-            with self.get_connection() as conn:
-                expire_time = int(time.time()) - Config.AUTH_CODE_EXPIRE_TIME
-                conn.execute(
-                    'DELETE FROM auth_codes WHERE created_at < ? OR used = TRUE',
-                    (expire_time,)
-                )
-                conn.commit()
-                return True
+            while True:
+                with self.get_connection() as conn:
+                    # UNION вместо OR: каждая ветка идет по своему индексу
+                    cursor = conn.execute(
+                        'DELETE FROM auth_codes WHERE rowid IN ('
+                        'SELECT rowid FROM auth_codes WHERE created_at < ? '
+                        'UNION SELECT rowid FROM auth_codes WHERE used = TRUE LIMIT ?)',
+                        (expire_time, batch_size)
+                    )
+                    conn.commit()
+
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    return deleted
         except Exception as e:
             logger.error(f"Error cleaning up auth codes: {e}")
+            return deleted
+
+    def optimize(self, incremental_vacuum_pages=0):
+        """PRAGMA optimize и, при необходимости, инкрементальная очистка страниц"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute('PRAGMA optimize')
+                if incremental_vacuum_pages > 0:
+                    # Действует только для баз с auto_vacuum = INCREMENTAL
+                    conn.execute(f'PRAGMA incremental_vacuum({int(incremental_vacuum_pages)})').fetchall()
+            return True
+        except Exception as e:
+            logger.error(f"Error optimizing database: {e}")
             return False
 
     # Utility methods
-    def can_ban_user(self, issuer_username, target_username):
-        """Проверка прав на бан"""
-        if not self.user_exists(target_username):
+    def can_ban_user(self, issuer, target):
+        """Проверка прав на бан (принимает username или Principal)"""
+        issuer = self.resolve_principal(issuer)
+        target = self.resolve_principal(target)
+
+        if not target.exists:
             return False, "User not found"
 
-        if self.is_operator(target_username):
+        if target.is_operator:
             return False, "Cannot ban operators"
 
-        if self.is_global_admin(target_username):
-            if not self.is_operator(issuer_username):
+        if target.is_global_admin:
+            if not issuer.is_operator:
                 return False, "Only operators can ban global admins"
 
-        issuer_rank = self.get_user(issuer_username).get('rank', 'user')
-        target_rank = self.get_user(target_username).get('rank', 'user')
+        issuer_rank = issuer.rank or 'user'
+        target_rank = target.rank or 'user'
 
         if issuer_rank == 'gadmin' and target_rank in ['gadmin', 'operator']:
             return False, "Insufficient permissions"
 
         return True, ""
 
-    def can_warn_user(self, issuer_username, target_username):
-        """Проверка прав на варн"""
-        if not self.user_exists(target_username):
+    def can_warn_user(self, issuer, target):
+        """Проверка прав на варн (принимает username или Principal)"""
+        target = self.resolve_principal(target)
+
+        if not target.exists:
             return False, "User not found"
 
-        if self.is_operator(target_username) or self.is_global_admin(target_username):
+        if target.is_global_admin:
             return False, "Cannot warn operators or global admins"
 
         return True, ""
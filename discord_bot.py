@@ -4,6 +4,10 @@ from discord import app_commands
 import asyncio
 from config import Config, logger
 from database import db_instance as Database
+from broadcast import broadcast_engine
+from progress import ProgressReporter
+from probes import PROBE_TYPES, validate_probe
+from supervisor import RESTART_POLICIES
 from utils import Utils
 import os
 
@@ -16,6 +20,21 @@ async def send_error(interaction: discord.Interaction, msg: str):
     await interaction.response.send_message(embed=embed)
 
 
+async def run_blocking(func, *args):
+    """Вызов func в пуле потоков: база, psutil и супервизор не должны блокировать цикл событий discord.py"""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+def html_embed(text: str, color: discord.Color):
+    """Embed из HTML-текста Utils: первая строка - заголовок, остальное - описание"""
+    title, _, description = text.replace('<b>', '**').replace('</b>', '**').partition('\n')
+    return discord.Embed(
+        title=title.replace('**', ''),
+        description=description,
+        color=color
+    )
+
+
 class DiscordBot:
     def __init__(self):
         intents = discord.Intents.default()
@@ -31,8 +50,10 @@ class DiscordBot:
         """Настройка слэш-команд Discord бота"""
 
         @self.bot.tree.command(name="addbot", description="Add new bot")
-        @app_commands.describe(name="Bot name", username="Bot username", bot_type="Bot type")
-        async def addbot(interaction: discord.Interaction, name: str, username: str, bot_type: str):
+        @app_commands.describe(name="Bot name", username="Bot username", bot_type="Bot type",
+                               restart_policy="Restart policy (never, on-failure, always)")
+        async def addbot(interaction: discord.Interaction, name: str, username: str, bot_type: str,
+                         restart_policy: str = ""):
             """Добавление нового бота"""
             if not await self.check_op_role(interaction):
                 return
@@ -42,6 +63,11 @@ class DiscordBot:
                 await send_error(interaction, "❌ Username должен начинаться с @")
                 return
 
+            restart_policy = restart_policy.lower() or Config.BOT_RESTART_POLICY
+            if restart_policy not in RESTART_POLICIES:
+                await send_error(interaction, f"❌ Restart policy: {', '.join(RESTART_POLICIES)}")
+                return
+
             exe_path = f"{Config.BOTS_DIR}/{name}.exe"
 
             # Проверяем существование файла
@@ -54,12 +80,13 @@ class DiscordBot:
                 return
 
             # Добавляем бота в базу
-            if Database.add_bot(name, exe_path, username, bot_type):
+            if Database.add_bot(name, exe_path, username, bot_type, restart_policy):
                 embed = discord.Embed(
                     title=f"✅ Бот '{name}' успешно добавлен!\n",
                     description=
                         f"🤖 Username: {username}\n"
                         f"🔧 Тип: {bot_type}\n"
+                        f"🔁 Перезапуск: {restart_policy}\n"
                         f"📁 Путь: {exe_path}",
                     color=discord.Color.orange()
                 )
@@ -75,37 +102,67 @@ class DiscordBot:
             if not await self.check_op_role(interaction):
                 return
 
-            users = Database.get_all_users()
-            total_count = len(users)
-            sent_count = 0
-
             embed = discord.Embed(
-                title=f"📨 Sending notifications: 0/{total_count}",
+                title="📨 Preparing notifications...",
                 color=discord.Color.brand_red()
             )
             await interaction.response.send_message(embed=embed)
             progress_msg = await interaction.original_response()
+            loop = asyncio.get_running_loop()
+
+            # Обработчики вызываются из потоков рассылки, правка сообщения передается в цикл событий
+            progress = ProgressReporter(lambda title: asyncio.run_coroutine_threadsafe(
+                progress_msg.edit(embed=discord.Embed(title=title, color=discord.Color.brand_red())), loop
+            ).result())
+
+            def on_progress(job):
+                progress.update(f"📨 Broadcast #{job.id}: {job.sent}/{job.total}")
+
+            def on_done(job):
+                if job.status == 'cancelled':
+                    progress.finish(f"🚫 Broadcast #{job.id} cancelled: {job.sent}/{job.total} sent")
+                else:
+                    progress.finish(f"✅ Notifications sent: {job.sent}/{job.total} users")
+                logger.info(f"DISCORD: {interaction.user.name} sent alarm to {job.sent} users")
 
-            for i, user in enumerate(users, 1):
-                username = user.get('username')
-                try:
-                    if not Database.is_banned(username):
-                        # Отправляем уведомление через Telegram бота
-                        full_message = f"🚨 <b>Важное уведомление от оператора!</b>\n\n{message}"
-                        Utils.send_message_to_user(None, username, full_message)
-                        sent_count += 1
-
-                        if sent_count % 10 == 0:
-                            embed.title = f"📨 Sending notifications: {sent_count}/{total_count}"
-                            await progress_msg.edit(embed=embed)
-                        await asyncio.sleep(0.1)
-                except Exception as e:
-                    logger.error(f"DISCORD: Error sending notification to {username}: {e}")
-                    continue
-
-            embed.title = f"✅ Notifications sent: {sent_count}/{total_count} users"
-            await progress_msg.edit(embed=embed)
-            logger.info(f"DISCORD: {interaction.user.name} sent alarm to {sent_count} users")
+            # Отправляем уведомление через Telegram бота
+            full_message = f"🚨 <b>Важное уведомление от оператора!</b>\n\n{message}"
+            job = await loop.run_in_executor(
+                None, broadcast_engine.submit, full_message, f"discord:{interaction.user.name}", on_progress, on_done
+            )
+            if job is None:
+                await progress_msg.edit(embed=discord.Embed(title="❌ Failed to create broadcast",
+                                                            color=discord.Color.dark_red()))
+
+        @self.bot.tree.command(name="alarmcancel", description="Cancel a broadcast")
+        @app_commands.describe(job_id="Broadcast number")
+        async def alarmcancel(interaction: discord.Interaction, job_id: int):
+            """Отмена рассылки"""
+            if not await self.check_op_role(interaction):
+                return
+
+            if await run_blocking(broadcast_engine.cancel, job_id):
+                embed = discord.Embed(
+                    title=f"🚫 Broadcast #{job_id} is being cancelled",
+                    color=discord.Color.dark_gray()
+                )
+                await interaction.response.send_message(embed=embed)
+                logger.info(f"DISCORD: {interaction.user.name} cancelled broadcast #{job_id}")
+            else:
+                await send_error(interaction, f"❌ Broadcast #{job_id} not found or already finished")
+
+        @self.bot.tree.command(name="alarmstatus", description="Show broadcast status")
+        @app_commands.describe(job_id="Broadcast number (latest broadcasts if omitted)")
+        async def alarmstatus(interaction: discord.Interaction, job_id: int = None):
+            """Состояние рассылки"""
+            if not await self.check_op_role(interaction):
+                return
+
+            status = await run_blocking(broadcast_engine.status_text, job_id)
+            if status is None:
+                await send_error(interaction, f"❌ Broadcast #{job_id} not found")
+                return
+            await interaction.response.send_message(embed=html_embed(status, discord.Color.brand_red()))
 
         @self.bot.tree.command(name="bantg", description="Ban user in Telegram")
         @app_commands.describe(username="Telegram username", ban_time="Ban duration in hours", reason="Ban reason")
@@ -119,13 +176,15 @@ class DiscordBot:
                 await send_error(interaction, "❌ Invalid username!")
                 return
 
+            target = Database.resolve_principal(target_username)
+
             # Проверяем существование пользователя
-            if not Database.user_exists(target_username):
+            if not target.exists:
                 await send_error(interaction, "❌ User not found in system!")
                 return
 
             # Проверяем права на бан
-            can_ban, error_msg = Database.can_ban_user(interaction.user.name, target_username)
+            can_ban, error_msg = Database.can_ban_user(interaction.user.name, target)
             if not can_ban:
                 await send_error(interaction,f"❌ {error_msg}")
                 return
@@ -153,6 +212,41 @@ class DiscordBot:
             else:
                 await send_error(interaction,f"❌ Failed to ban @{target_username}")
 
+        @self.bot.tree.command(name="botinfo", description="Show bot state and resource usage")
+        @app_commands.describe(name="Bot name")
+        async def botinfo(interaction: discord.Interaction, name: str):
+            """Состояние и ресурсы бота"""
+            if not await self.check_op_role(interaction):
+                return
+
+            bot_info = await run_blocking(Utils.get_bot_info, name)
+            if bot_info is None:
+                await send_error(interaction, f"❌ Bot '{name}' not found!")
+                return
+
+            await interaction.response.send_message(embed=html_embed(bot_info, discord.Color.blue()))
+
+        @self.bot.tree.command(name="botlogs", description="Show recent bot output")
+        @app_commands.describe(name="Bot name", lines="Number of lines")
+        async def botlogs(interaction: discord.Interaction, name: str, lines: int = Config.BOT_LOGS_DEFAULT_LINES):
+            """Последние строки вывода бота"""
+            if not await self.check_op_role(interaction):
+                return
+
+            logs = await run_blocking(lambda: Utils.get_bot_logs(name, lines, limit=4000))
+            if logs is None:
+                await send_error(interaction, f"❌ Bot '{name}' not found!")
+                return
+
+            # Обратные кавычки в выводе сломали бы блок кода
+            logs = logs.replace('`', "'")
+            embed = discord.Embed(
+                title=f"📜 Bot '{name}' output",
+                description=f"```\n{logs}\n```" if logs else "No output captured",
+                color=discord.Color.dark_gray()
+            )
+            await interaction.response.send_message(embed=embed)
+
         @self.bot.tree.command(name="botlist", description="Show list of all bots")
         async def botlist(interaction: discord.Interaction):
             """Список всех ботов"""
@@ -164,10 +258,11 @@ class DiscordBot:
                 await send_error(interaction, "❌ No bots added!")
                 return
 
+            statuses = await run_blocking(Utils.get_bots_status, bots)
             bot_list = ''
             for i, bot in enumerate(bots, 1):
-                status = Utils.get_bot_status(bot)
-                status_emoji = "🟢" if status == "running" else "🔴" if status == "stopped" else "⚫"
+                status = statuses[bot.get('name')]
+                status_emoji = Utils.format_bot_status(bot, status)
                 bot_list += f"{i}. {bot.get('name')} ({bot.get('username')}) {status_emoji}\n"
 
             embed = discord.Embed(
@@ -215,15 +310,14 @@ class DiscordBot:
                 await send_error(interaction, "❌ Invalid username!")
                 return
 
+            target = Database.resolve_principal(target_username)
+
             # Проверяем существование пользователя
-            if not Database.user_exists(target_username):
+            if not target.exists:
                 await send_error(interaction, "❌ User not found in system!")
                 return
 
-            user_data = Database.get_user(target_username)
-            if not user_data:
-                await send_error(interaction, "❌ Error getting user data!")
-                return
+            user_data = target.user
 
             rank_text = {
                 'operator': '⚡ Operator',
@@ -232,7 +326,7 @@ class DiscordBot:
                 'user': '👤 User'
             }.get(user_data.get('rank', 'user'), '👤 User')
 
-            banned_status = "🚫 Banned" if Database.is_banned(target_username) else "✅ Active"
+            banned_status = "🚫 Banned" if target.banned else "✅ Active"
             info_text = (
                 f"📧 Username: @{target_username}\n"
                 f"👨‍💼 Rank: {rank_text}\n"
@@ -268,15 +362,21 @@ class DiscordBot:
 
 **Operators Commands:**
 `/alarm <message>` - Mass notification
+`/alarmstatus [id]` - Broadcast status
+`/alarmcancel <id>` - Cancel broadcast
 `/stats` - Show system statistics
 `/list <type>` - Show user lists (ladmin, gadmin, operator)
 `/getinfo <@username>` - Get user info
 `/promote <@username>` - Promote user
 `/demote <@username>` - Demote user
-`/addbot <name> <@username> <type>` - Add new bot
+`/addbot <name> <@username> <type> [policy]` - Add new bot
 `/removebot <name>` - Remove bot
-`/startbot <name>` - Start bot
-`/stopbot <name>` - Stop bot
+`/restartpolicy <name> <never|on-failure|always>` - Set restart policy
+`/setprobe <name> <type|none> [target]` - Set health probe
+`/startbot <name|all> [type]` - Start bot (or all bots)
+`/stopbot <name|all> [type]` - Stop bot (or all bots)
+`/botinfo <name>` - Bot state and resource usage
+`/botlogs <name> [lines]` - Recent bot output
 
 **Utilities:**
 `/brbhelp` - Show this help
@@ -337,13 +437,15 @@ class DiscordBot:
                 await send_error(interaction, "❌ Invalid username!")
                 return
 
+            target = Database.resolve_principal(target_username)
+
             # Проверяем существование пользователя
-            if not Database.user_exists(target_username):
+            if not target.exists:
                 await send_error(interaction, "❌ User not found in system!")
                 return
 
             # Проверяем бан целевого пользователя
-            if Database.is_banned(target_username):
+            if target.banned:
                 await send_error(interaction, "❌ Cannot promote banned user!")
                 return
 
@@ -374,14 +476,71 @@ class DiscordBot:
             else:
                 await send_error(interaction,f"❌ Bot '{name}' not found!")
 
+        @self.bot.tree.command(name="restartpolicy", description="Set bot restart policy")
+        @app_commands.describe(name="Bot name", restart_policy="Restart policy (never, on-failure, always)")
+        async def restartpolicy(interaction: discord.Interaction, name: str, restart_policy: str):
+            """Изменение политики перезапуска бота"""
+            if not await self.check_op_role(interaction):
+                return
+
+            restart_policy = restart_policy.lower()
+            if restart_policy not in RESTART_POLICIES:
+                await send_error(interaction, f"❌ Restart policy: {', '.join(RESTART_POLICIES)}")
+                return
+
+            if await run_blocking(Database.set_bot_restart_policy, name, restart_policy):
+                embed = discord.Embed(
+                    title=f"✅ Bot '{name}' restart policy: {restart_policy}",
+                    color=discord.Color.orange()
+                )
+                await interaction.response.send_message(embed=embed)
+                logger.info(f"DISCORD: {interaction.user.name} set restart policy of bot {name} to {restart_policy}")
+            else:
+                await send_error(interaction, f"❌ Bot '{name}' not found!")
+
+        @self.bot.tree.command(name="setprobe", description="Set bot health probe")
+        @app_commands.describe(name="Bot name", probe_type="Probe type (tcp, http, unix, heartbeat, cmd, none)",
+                               target="host:port, URL, socket path, heartbeat file or command from the bots folder")
+        async def setprobe(interaction: discord.Interaction, name: str, probe_type: str, target: str = ""):
+            """Установка пробы здоровья бота"""
+            if not await self.check_op_role(interaction):
+                return
+
+            probe_type = probe_type.lower()
+            if probe_type == 'none':
+                probe_type, target = None, None
+            elif probe_type not in PROBE_TYPES or not target:
+                await send_error(interaction, f"❌ Probe: {', '.join(PROBE_TYPES)} with a target, or none")
+                return
+
+            error = await run_blocking(validate_probe, probe_type, target)
+            if error:
+                await send_error(interaction, f"❌ {error}")
+                return
+
+            if await run_blocking(Database.set_bot_probe, name, probe_type, target):
+                embed = discord.Embed(
+                    title=f"✅ Bot '{name}' probe: {probe_type} {target}" if probe_type
+                    else f"✅ Bot '{name}' probe disabled",
+                    color=discord.Color.orange()
+                )
+                await interaction.response.send_message(embed=embed)
+                logger.info(f"DISCORD: {interaction.user.name} set probe of bot {name} to {probe_type} {target}")
+            else:
+                await send_error(interaction, f"❌ Bot '{name}' not found!")
+
         @self.bot.tree.command(name="startbot", description="Start bot")
-        @app_commands.describe(name="Bot name")
-        async def startbot(interaction: discord.Interaction, name: str):
+        @app_commands.describe(name="Bot name or 'all'", bot_type="Bot type (only with 'all')")
+        async def startbot(interaction: discord.Interaction, name: str, bot_type: str = ""):
             """Запуск бота"""
             if not await self.check_op_role(interaction):
                 return
 
-            result = Utils.start_bot(name)
+            if name.lower() == 'all':
+                await self.run_bulk(interaction, Utils.start_all_bots, bot_type, discord.Color.orange())
+                return
+
+            result = await run_blocking(Utils.start_bot, name)
 
             embed = discord.Embed(
                 title=result,
@@ -405,18 +564,26 @@ class DiscordBot:
             await interaction.response.send_message(embed=embed)
 
         @self.bot.tree.command(name="stopbot", description="Stop bot")
-        @app_commands.describe(name="Bot name")
-        async def stopbot(interaction: discord.Interaction, name: str):
+        @app_commands.describe(name="Bot name or 'all'", bot_type="Bot type (only with 'all')")
+        async def stopbot(interaction: discord.Interaction, name: str, bot_type: str = ""):
             """Остановка бота"""
             if not await self.check_op_role(interaction):
                 return
 
-            result = Utils.stop_bot(name)
+            if name.lower() == 'all':
+                await self.run_bulk(interaction, Utils.stop_all_bots, bot_type, discord.Color.dark_gray())
+                return
+
             embed = discord.Embed(
-                title=result,
+                title=f"⏳ Stopping bot '{name}'...",
                 color=discord.Color.dark_gray()
             )
             await interaction.response.send_message(embed=embed)
+
+            # Ожидание завершения процесса выполняется в пуле потоков, ответ редактируется по результату
+            result = await run_blocking(Utils.stop_bot, name)
+            embed.title = result
+            await interaction.edit_original_response(embed=embed)
             logger.info(f"DISCORD: {interaction.user.name} stopped bot {name} - {result}")
 
         @self.bot.tree.command(name="unban", description="Unban user")
@@ -498,13 +665,15 @@ class DiscordBot:
                 await send_error(interaction, "❌ Invalid username!")
                 return
 
+            target = Database.resolve_principal(target_username)
+
             # Проверяем существование пользователя
-            if not Database.user_exists(target_username):
+            if not target.exists:
                 await send_error(interaction, "❌ User not found in system!")
                 return
 
             # Проверяем права на варн
-            can_warn, error_msg = Database.can_warn_user(interaction.user.name, target_username)
+            can_warn, error_msg = Database.can_warn_user(interaction.user.name, target)
             if not can_warn:
                 await send_error(interaction,f"❌ {error_msg}")
                 return
@@ -576,6 +745,21 @@ class DiscordBot:
                 await ctx.send(embed=embed)
                 logger.error(f"DISCORD: Command error: {error}")
 
+    async def run_bulk(self, interaction: discord.Interaction, operation, bot_type: str, color: discord.Color):
+        """Массовый запуск/остановка ботов в пуле потоков, чтобы не блокировать цикл событий"""
+        await interaction.response.defer()
+        loop = asyncio.get_running_loop()
+        # Ход операции и результат показываются в ответе на команду, правки передаются в цикл событий
+        progress = ProgressReporter(lambda text: asyncio.run_coroutine_threadsafe(
+            interaction.edit_original_response(embed=html_embed(text, color)), loop
+        ).result())
+
+        result = await loop.run_in_executor(None, operation, bot_type or None, progress.update)
+        if result is None:
+            result = "❌ No bots" + (f" of type '{bot_type}'" if bot_type else "") + "!"
+        await loop.run_in_executor(None, progress.finish, result)
+        logger.info(f"DISCORD: {interaction.user.name} ran {operation.__name__} for type {bot_type or 'all'}")
+
     async def check_op_role(self, interaction: discord.Interaction):
         """Проверка роли Operator у пользователя"""
         # Проверяем, есть ли у пользователя роль Operator
@@ -1,183 +1,277 @@
 import os
+import html
+import threading
 from telebot import *
 from telebot.types import Message, CallbackQuery
+from telebot.handler_backends import BaseMiddleware
 from config import Config, logger
 from database import db_instance
+from broadcast import broadcast_engine
 from keyboards import Keyboards
+from outbound import outbound_queue
+from progress import ProgressReporter
+from probes import PROBE_TYPES, validate_probe
+from supervisor import RESTART_POLICIES
 from utils import Utils
 
 
+class CallerMiddleware(BaseMiddleware):
+    """Загрузка отправителя апдейта один раз: пользователь, бан и права"""
+
+    def __init__(self):
+        super().__init__()
+        self.update_types = ['message', 'callback_query']
+
+    def pre_process(self, update, data):
+        username = update.from_user.username if update.from_user else None
+        data['caller'] = db_instance.resolve_principal(username)
+
+    def post_process(self, update, data, exception):
+        pass
+
+
 class Handlers:
     def __init__(self, bot):
         self.bot = bot
+        if bot.use_class_middlewares:
+            bot.setup_middleware(CallerMiddleware())
         self.setup_handlers()
 
+    @staticmethod
+    def get_caller(update, caller=None):
+        """Отправитель апдейта: из CallerMiddleware или загруженный из базы"""
+        if caller is not None:
+            return caller
+        return db_instance.resolve_principal(update.from_user.username)
+
     def setup_handlers(self):
         """Настройка всех обработчиков"""
 
         # Команды
         @self.bot.message_handler(commands=['start', 'help'])
-        def handle_start_help(message: Message):
-            self.handle_start(message)
+        def handle_start_help(message: Message, caller=None):
+            self.handle_start(message, caller)
 
         @self.bot.message_handler(commands=['me'])
-        def handle_me(message: Message):
-            self.handle_me(message)
+        def handle_me(message: Message, caller=None):
+            self.handle_me(message, caller)
 
         @self.bot.message_handler(commands=['promote', 'demote'])
-        def handle_promote_demote(message: Message):
-            self.handle_promote_demote(message)
+        def handle_promote_demote(message: Message, caller=None):
+            self.handle_promote_demote(message, caller)
 
         @self.bot.message_handler(commands=['ban', 'unban'])
-        def handle_ban_unban(message: Message):
-            self.handle_ban_unban(message)
+        def handle_ban_unban(message: Message, caller=None):
+            self.handle_ban_unban(message, caller)
 
         @self.bot.message_handler(commands=['warn', 'unwarn'])
-        def handle_warn_unwarn(message: Message):
-            self.handle_warn_unwarn(message)
+        def handle_warn_unwarn(message: Message, caller=None):
+            self.handle_warn_unwarn(message, caller)
 
         @self.bot.message_handler(commands=['list'])
-        def handle_list(message: Message):
-            self.handle_list(message)
+        def handle_list(message: Message, caller=None):
+            self.handle_list(message, caller)
 
         @self.bot.message_handler(commands=['getinfo'])
-        def handle_getinfo(message: Message):
-            self.handle_getinfo(message)
+        def handle_getinfo(message: Message, caller=None):
+            self.handle_getinfo(message, caller)
 
         @self.bot.message_handler(commands=['reguser'])
-        def handle_reguser(message: Message):
-            self.handle_reguser(message)
+        def handle_reguser(message: Message, caller=None):
+            self.handle_reguser(message, caller)
 
         @self.bot.message_handler(commands=['op', 'unop'])
         def handle_op_unop(message: Message):
             self.handle_op_unop(message)
 
         @self.bot.message_handler(commands=['stats'])
-        def handle_stats(message: Message):
-            self.handle_stats(message)
+        def handle_stats(message: Message, caller=None):
+            self.handle_stats(message, caller)
 
         @self.bot.message_handler(commands=['alarm'])
-        def handle_alarm(message: Message):
-            self.handle_alarm(message)
+        def handle_alarm(message: Message, caller=None):
+            self.handle_alarm(message, caller)
+
+        @self.bot.message_handler(commands=['alarmstatus', 'alarmcancel'])
+        def handle_alarm_control(message: Message, caller=None):
+            self.handle_alarm_control(message, caller)
+
+        @self.bot.message_handler(commands=['botinfo'])
+        def handle_botinfo(message: Message, caller=None):
+            self.handle_botinfo(message, caller)
+
+        @self.bot.message_handler(commands=['botlogs'])
+        def handle_botlogs(message: Message, caller=None):
+            self.handle_botlogs(message, caller)
 
         @self.bot.message_handler(commands=['chatid'])
         def handle_chatid(message: Message):
             """Обработка команды /chatid"""
-            self.bot.send_message(message.chat.id, f"🔐 CHAT ID 🔐\n\n"
-                                                   f"<code>{message.chat.id}</code>",
-                                  parse_mode='HTML')
+            outbound_queue.enqueue(message.chat.id, f"🔐 CHAT ID 🔐\n\n"
+                                                    f"<code>{message.chat.id}</code>",
+                                   parse_mode='HTML')
 
         # Бот-менеджмент команды
-        @self.bot.message_handler(commands=['startbot', 'stopbot', 'addbot', 'removebot'])
-        def handle_bot_management(message: Message):
-            self.handle_bot_management(message)
+        @self.bot.message_handler(commands=['startbot', 'stopbot', 'addbot', 'removebot', 'restartpolicy', 'setprobe'])
+        def handle_bot_management(message: Message, caller=None):
+            self.handle_bot_management(message, caller)
 
         # Текстовые сообщения (обработка кнопок меню)
         @self.bot.message_handler(content_types=['text'])
-        def handle_text_messages(message: Message):
-            self.handle_text_messages(message)
+        def handle_text_messages(message: Message, caller=None):
+            self.handle_text_messages(message, caller)
 
         # Callback queries
         @self.bot.callback_query_handler(func=lambda call: True)
-        def handle_callback(call: CallbackQuery):
-            self.handle_callback_query(call)
+        def handle_callback(call: CallbackQuery, caller=None):
+            self.handle_callback_query(call, caller)
 
-    def handle_text_messages(self, message: Message):
+    def handle_text_messages(self, message: Message, caller=None):
         """Обработка текстовых сообщений (кнопок меню)"""
-        username = message.from_user.username
-        if not username:
-            self.bot.reply_to(message, "❌ У вас не установлен username! Установите его в настройках Telegram.")
+        caller = self.get_caller(message, caller)
+        if not caller.username:
+            outbound_queue.reply(message, "❌ У вас не установлен username! Установите его в настройках Telegram.")
             return
 
         # Проверяем, есть ли пользователь в системе
-        if not db_instance.user_exists(username):
-            self.bot.reply_to(message, "❌ Вы не зарегистрированы в системе! Обратитесь к администратору.")
+        if not caller.exists:
+            outbound_queue.reply(message, "❌ Вы не зарегистрированы в системе! Обратитесь к администратору.")
             return
 
         # Проверяем бан
-        if db_instance.is_banned(username):
-            self.bot.reply_to(message, "🚫 Вы забанены и не можете использовать бота.")
+        if caller.banned:
+            outbound_queue.reply(message, "🚫 Вы забанены и не можете использовать бота.")
             return
 
         text = message.text.lower()
 
         # Обработка текстовых команд через меню
         if text == "📊 статистика":
-            self.handle_stats(message)
+            self.handle_stats(message, caller)
         elif text == "📋 список ботов":
-            self.show_bot_list(message)
+            self.show_bot_list(message, caller)
         elif text == "🔙 назад":
-            self.show_main_menu(message, username)
+            self.show_main_menu(message, caller)
 
-    def show_main_menu(self, message: Message, username: str):
+    def show_main_menu(self, message: Message, caller):
         """Показать главное меню"""
-        self.bot.send_message(
+        outbound_queue.enqueue(
             message.chat.id,
             "Главное меню:",
-            reply_markup=Keyboards.main_menu(username)
+            reply_markup=Keyboards.main_menu(caller.username, caller.rank)
         )
 
-    def show_user_list_menu(self, message: Message):
+    def show_user_list_menu(self, message: Message, caller=None):
         """Показать меню списков пользователей"""
-        username = message.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
             return
 
-        if not db_instance.is_local_admin(username):
-            self.bot.reply_to(message, "❌ Недостаточно прав!")
+        if not caller.is_local_admin():
+            outbound_queue.reply(message, "❌ Недостаточно прав!")
             return
 
-        self.bot.send_message(
+        outbound_queue.enqueue(
             message.chat.id,
             "📋 Выберите список для просмотра:",
             reply_markup=Keyboards.user_list_menu()
         )
 
-    def show_bot_list(self, message: Message):
+    def show_bot_list(self, message: Message, caller=None):
         """Показать список ботов"""
-        username = message.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
             return
 
-        if not db_instance.is_operator(username):
-            self.bot.reply_to(message, "❌ Только операторы могут просматривать список ботов!")
+        if not caller.is_operator:
+            outbound_queue.reply(message, "❌ Только операторы могут просматривать список ботов!")
             return
 
         bots = db_instance.get_all_bots()
         if not bots:
-            self.bot.reply_to(message, "❌ Нет добавленных ботов!")
+            outbound_queue.reply(message, "❌ Нет добавленных ботов!")
             return
 
+        statuses = Utils.get_bots_status(bots)
         bot_list = "🤖 <b>Список ботов:</b>\n\n"
         for i, bot in enumerate(bots, 1):
-            status = Utils.get_bot_status(bot)
-            status_emoji = "🟢" if status == "running" else "🔴" if status == "stopped" else "⚫"
+            status = statuses[bot.get('name')]
+            status_emoji = Utils.format_bot_status(bot, status)
             bot_list += f"{i}. {bot.get('name')} ({bot.get('username')}) {status_emoji}\n"
 
-        self.bot.reply_to(message, bot_list, parse_mode='HTML')
+        outbound_queue.reply(message, bot_list, parse_mode='HTML')
 
-    def handle_start(self, message: Message):
+    def handle_botinfo(self, message: Message, caller=None):
+        """Обработка команды /botinfo - состояние и ресурсы бота"""
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
+            return
+
+        if not caller.is_operator:
+            outbound_queue.reply(message, "❌ Только операторы могут просматривать информацию о ботах!")
+            return
+
+        parts = message.text.split()
+        if len(parts) < 2:
+            outbound_queue.reply(message, "❌ Использование: /botinfo <имя_бота>")
+            return
+
+        bot_info = Utils.get_bot_info(parts[1].strip())
+        if bot_info is None:
+            outbound_queue.reply(message, f"❌ Бот '{parts[1].strip()}' не найден!")
+            return
+
+        outbound_queue.reply(message, bot_info, parse_mode='HTML')
+
+    def handle_botlogs(self, message: Message, caller=None):
+        """Обработка команды /botlogs - последние строки вывода бота"""
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
+            return
+
+        if not caller.is_operator:
+            outbound_queue.reply(message, "❌ Только операторы могут просматривать вывод ботов!")
+            return
+
+        parts = message.text.split()
+        if len(parts) < 2 or (len(parts) > 2 and not parts[2].isdigit()):
+            outbound_queue.reply(message, "❌ Использование: /botlogs <имя_бота> [количество_строк]")
+            return
+
+        bot_name = parts[1].strip()
+        count = int(parts[2]) if len(parts) > 2 else None
+        logs = Utils.get_bot_logs(bot_name, count, limit=3900, escape_html=True)
+        if logs is None:
+            outbound_queue.reply(message, f"❌ Бот '{bot_name}' не найден!")
+        elif not logs:
+            outbound_queue.reply(message, f"ℹ️ Бот '{bot_name}' ничего не выводил")
+        else:
+            outbound_queue.reply(message, f"<pre>{logs}</pre>", parse_mode='HTML')
+
+    def handle_start(self, message: Message, caller=None):
         """Обработка команды /start"""
 
-        username = message.from_user.username
+        caller = self.get_caller(message, caller)
+        username = caller.username
         user_id = message.from_user.id
         first_name = message.from_user.first_name
 
         if not username:
-            self.bot.reply_to(message, "❌ У вас не установлен username! Установите его в настройках Telegram.")
+            outbound_queue.reply(message, "❌ У вас не установлен username! Установите его в настройках Telegram.")
             return
 
         # Проверяем бан
-        if db_instance.is_banned(username):
-            self.bot.reply_to(message, "🚫 Вы забанены и не можете использовать бота.")
+        if caller.banned:
+            outbound_queue.reply(message, "🚫 Вы забанены и не можете использовать бота.")
             return
 
-        if not db_instance.user_exists(username):
+        if not caller.exists:
             db_instance.add_user(user_id, username, first_name)
             logger.info(f"New user @{username}")
+            caller = db_instance.resolve_principal(username)
 
         # Отправляем приветствие в зависимости от роли
-        rank = db_instance.get_user_rank(username)
+        rank = caller.rank
         welcome_text = f"👋 Добро пожаловать, {first_name}!\n"
 
         if rank == 'operator':
@@ -189,33 +283,31 @@ class Handlers:
         else:
             welcome_text += "👤 Вы обычный пользователь"
 
-        self.bot.send_message(
+        outbound_queue.enqueue(
             message.chat.id,
             welcome_text,
-            reply_markup=Keyboards.main_menu(username)
+            reply_markup=Keyboards.main_menu(username, rank)
         )
 
-    def handle_me(self, message: Message):
+    def handle_me(self, message: Message, caller=None):
         """Обработка команды /me - информация о себе"""
-        username = message.from_user.username
+        caller = self.get_caller(message, caller)
+        username = caller.username
         if not username:
-            self.bot.reply_to(message, "❌ У вас не установлен username!")
+            outbound_queue.reply(message, "❌ У вас не установлен username!")
             return
 
         # Проверяем, есть ли пользователь в системе
-        if not db_instance.user_exists(username):
-            self.bot.reply_to(message, "❌ Вы не зарегистрированы в системе!")
+        if not caller.exists:
+            outbound_queue.reply(message, "❌ Вы не зарегистрированы в системе!")
             return
 
         # Проверяем бан
-        if db_instance.is_banned(username):
-            self.bot.reply_to(message, "🚫 Вы забанены и не можете использовать бота.")
+        if caller.banned:
+            outbound_queue.reply(message, "🚫 Вы забанены и не можете использовать бота.")
             return
 
-        user_data = db_instance.get_user(username)
-        if not user_data:
-            self.bot.reply_to(message, "❌ Ошибка получения данных!")
-            return
+        user_data = caller.user
 
         rank_text = {
             'operator': '⚡ Оператор',
@@ -224,7 +316,7 @@ class Handlers:
             'user': '👤 Пользователь'
         }.get(user_data.get('rank', 'user'), '👤 Пользователь')
 
-        banned_status = "🚫 Забанен" if db_instance.is_banned(username) else "✅ Отсутствуют"
+        banned_status = "🚫 Забанен" if caller.banned else "✅ Отсутствуют"
         info_text = (
             "👤 <b>Информация о пользователе</b>\n\n"
             f"📧 Username: @{username}\n"
@@ -238,88 +330,91 @@ class Handlers:
                 f"💢 Предупреждения: {user_data['warns']}/{Config.MAX_WARN}"
             )
 
-        self.bot.reply_to(message, info_text, parse_mode='HTML')
+        outbound_queue.reply(message, info_text, parse_mode='HTML')
 
-    def handle_promote_demote(self, message: Message):
+    def handle_promote_demote(self, message: Message, caller=None):
         """Обработка повышения/понижения"""
-        username = message.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
             return
 
-        if not db_instance.is_global_admin(username):
-            self.bot.reply_to(message, "❌ Недостаточно прав!")
+        if not caller.is_global_admin:
+            outbound_queue.reply(message, "❌ Недостаточно прав!")
             return
 
         parts = message.text.split()
         if len(parts) < 2:
-            self.bot.reply_to(message, "❌ Использование: /promote @username или /demote @username")
+            outbound_queue.reply(message, "❌ Использование: /promote @username или /demote @username")
             return
 
         target_username = Utils.extract_username(parts[1])
         if not target_username:
-            self.bot.reply_to(message, "❌ Неверный username!")
+            outbound_queue.reply(message, "❌ Неверный username!")
             return
 
+        target = db_instance.resolve_principal(target_username)
+
         # Проверяем, есть ли целевой пользователь в системе
-        if not db_instance.user_exists(target_username):
-            self.bot.reply_to(message, "❌ Пользователь не найден в системе!")
+        if not target.exists:
+            outbound_queue.reply(message, "❌ Пользователь не найден в системе!")
             return
 
         # Проверяем бан целевого пользователя
-        if db_instance.is_banned(target_username):
-            self.bot.reply_to(message, "❌ Нельзя работать с забаненными пользователями!")
+        if target.banned:
+            outbound_queue.reply(message, "❌ Нельзя работать с забаненными пользователями!")
             return
 
         if parts[0].startswith('/promote'):
             # Повышение
-            if not db_instance.is_operator(username):
-                self.bot.reply_to(message, "❌ Только операторы могут повышать!")
+            if not caller.is_operator:
+                outbound_queue.reply(message, "❌ Только операторы могут повышать!")
                 return
 
-            self.bot.send_message(
+            outbound_queue.enqueue(
                 message.chat.id,
                 f"Выберите ранг для @{target_username}:",
                 reply_markup=Keyboards.rank_selection(target_username)
             )
         else:
             # Понижение
-            target_rank = db_instance.get_user_rank(target_username)
-
-            if target_rank == 'operator' and not db_instance.is_operator(username):
-                self.bot.reply_to(message, "❌ Только операторы могут понижать операторов!")
+            if target.rank == 'operator' and not caller.is_operator:
+                outbound_queue.reply(message, "❌ Только операторы могут понижать операторов!")
                 return
 
             db_instance.update_user(target_username, {'rank': 'user'})
-            self.bot.reply_to(message, f"✅ @{target_username} понижен до пользователя")
+            outbound_queue.reply(message, f"✅ @{target_username} понижен до пользователя")
 
-    def handle_ban_unban(self, message: Message):
+    def handle_ban_unban(self, message: Message, caller=None):
         """Обработка бана/разбана"""
-        username = message.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
             return
+        username = caller.username
 
         parts = message.text.split()
         if len(parts) < 2:
-            self.bot.reply_to(message, "❌ Использование: /ban @username [время_часы] [причина] или /unban @username")
+            outbound_queue.reply(message, "❌ Использование: /ban @username [время_часы] [причина] или /unban @username")
             return
 
         target_username = Utils.extract_username(parts[1])
         if not target_username:
-            self.bot.reply_to(message, "❌ Неверный username!")
+            outbound_queue.reply(message, "❌ Неверный username!")
             return
 
+        target = db_instance.resolve_principal(target_username)
+
         # Проверяем, есть ли целевой пользователь в системе
-        if not db_instance.user_exists(target_username):
-            self.bot.reply_to(message, "❌ Пользователь не найден в системе!")
+        if not target.exists:
+            outbound_queue.reply(message, "❌ Пользователь не найден в системе!")
             return
 
         action = "ban" if parts[0].startswith('/ban') else "unban"
 
         if action == "ban":
             # Проверяем права на бан
-            can_ban, error_msg = db_instance.can_ban_user(username, target_username)
+            can_ban, error_msg = db_instance.can_ban_user(caller, target)
             if not can_ban:
-                self.bot.reply_to(message, f"❌ {error_msg}")
+                outbound_queue.reply(message, f"❌ {error_msg}")
                 return
 
             # Получаем время бана и причину
@@ -350,14 +445,14 @@ class Handlers:
 
                 Utils.send_message_to_user(self.bot, target_username, ban_message)
 
-                self.bot.reply_to(message, f"✅ @{target_username} забанен на {ban_duration}")
+                outbound_queue.reply(message, f"✅ @{target_username} забанен на {ban_duration}")
             else:
-                self.bot.reply_to(message, f"❌ Не удалось забанить @{target_username}")
+                outbound_queue.reply(message, f"❌ Не удалось забанить @{target_username}")
 
         else:
             # Разбан
-            if not db_instance.is_global_admin(username):
-                self.bot.reply_to(message, "❌ Недостаточно прав для разбана!")
+            if not caller.is_global_admin:
+                outbound_queue.reply(message, "❌ Недостаточно прав для разбана!")
                 return
 
             if db_instance.unban_user(target_username):
@@ -365,39 +460,42 @@ class Handlers:
                 unban_message = "✅ <b>Вы разблокированы в нашей сетке ботов!</b>"
                 Utils.send_message_to_user(self.bot, target_username, unban_message)
 
-                self.bot.reply_to(message, f"✅ @{target_username} разбанен")
+                outbound_queue.reply(message, f"✅ @{target_username} разбанен")
             else:
-                self.bot.reply_to(message, f"❌ Не удалось разбанить @{target_username}")
+                outbound_queue.reply(message, f"❌ Не удалось разбанить @{target_username}")
 
-    def handle_warn_unwarn(self, message: Message):
+    def handle_warn_unwarn(self, message: Message, caller=None):
         """Обработка выдачи/снятия предупреждений"""
-        username = message.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
             return
+        username = caller.username
 
-        if not db_instance.is_global_admin(username):
-            self.bot.reply_to(message, "❌ Недостаточно прав!")
+        if not caller.is_global_admin:
+            outbound_queue.reply(message, "❌ Недостаточно прав!")
             return
 
         parts = message.text.split()
         if len(parts) < 2:
-            self.bot.reply_to(message, "❌ Использование: /warn @username [причина] или /unwarn @username")
+            outbound_queue.reply(message, "❌ Использование: /warn @username [причина] или /unwarn @username")
             return
 
         target_username = Utils.extract_username(parts[1])
         if not target_username:
-            self.bot.reply_to(message, "❌ Неверный username!")
+            outbound_queue.reply(message, "❌ Неверный username!")
             return
 
+        target = db_instance.resolve_principal(target_username)
+
         # Проверяем, есть ли целевой пользователь в системе
-        if not db_instance.user_exists(target_username):
-            self.bot.reply_to(message, "❌ Пользователь не найден в системе!")
+        if not target.exists:
+            outbound_queue.reply(message, "❌ Пользователь не найден в системе!")
             return
 
         # Проверяем права на варн
-        can_warn, error_msg = db_instance.can_warn_user(username, target_username)
+        can_warn, error_msg = db_instance.can_warn_user(caller, target)
         if not can_warn:
-            self.bot.reply_to(message, f"❌ {error_msg}")
+            outbound_queue.reply(message, f"❌ {error_msg}")
             return
 
         action = "warn" if parts[0].startswith('/warn') else "unwarn"
@@ -408,7 +506,7 @@ class Handlers:
             success, result = db_instance.add_warn(target_username, username, reason)
             if success:
                 if result == "banned":
-                    self.bot.reply_to(message, f"✅ @{target_username} получил предупреждение и автоматически забанен за достижение лимита")
+                    outbound_queue.reply(message, f"✅ @{target_username} получил предупреждение и автоматически забанен за достижение лимита")
                 else:
                     # Отправляем уведомление пользователю
                     user_data = db_instance.get_user(target_username)
@@ -422,9 +520,9 @@ class Handlers:
 
                     Utils.send_message_to_user(self.bot, target_username, warn_message)
 
-                    self.bot.reply_to(message, f"✅ @{target_username} получил предупреждение ({user_data['warns']}/{Config.MAX_WARN})")
+                    outbound_queue.reply(message, f"✅ @{target_username} получил предупреждение ({user_data['warns']}/{Config.MAX_WARN})")
             else:
-                self.bot.reply_to(message, f"❌ {result}")
+                outbound_queue.reply(message, f"❌ {result}")
 
         else:
             # Снятие варна
@@ -437,55 +535,54 @@ class Handlers:
                 )
                 Utils.send_message_to_user(self.bot, target_username, unwarn_message)
 
-                self.bot.reply_to(message, f"✅ С @{target_username} снято предупреждение ({user_data['warns']}/{Config.MAX_WARN})")
+                outbound_queue.reply(message, f"✅ С @{target_username} снято предупреждение ({user_data['warns']}/{Config.MAX_WARN})")
             else:
-                self.bot.reply_to(message, f"❌ Не удалось снять предупреждение с @{target_username}")
+                outbound_queue.reply(message, f"❌ Не удалось снять предупреждение с @{target_username}")
 
-    def handle_list(self, message: Message):
+    def handle_list(self, message: Message, caller=None):
         """Обработка команды /list"""
-        username = message.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
             return
 
-        if not db_instance.is_local_admin(username):
-            self.bot.reply_to(message, "❌ Недостаточно прав!")
+        if not caller.is_local_admin():
+            outbound_queue.reply(message, "❌ Недостаточно прав!")
             return
 
-        self.bot.send_message(
+        outbound_queue.enqueue(
             message.chat.id,
             "📋 Выберите список для просмотра:",
             reply_markup=Keyboards.user_list_menu()
         )
 
-    def handle_getinfo(self, message: Message):
+    def handle_getinfo(self, message: Message, caller=None):
         """Обработка команды /getinfo"""
-        username = message.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
             return
 
-        if not db_instance.is_global_admin(username):
-            self.bot.reply_to(message, "❌ Недостаточно прав!")
+        if not caller.is_global_admin:
+            outbound_queue.reply(message, "❌ Недостаточно прав!")
             return
 
         parts = message.text.split()
         if len(parts) < 2:
-            self.bot.reply_to(message, "❌ Использование: /getinfo @username")
+            outbound_queue.reply(message, "❌ Использование: /getinfo @username")
             return
 
         target_username = Utils.extract_username(parts[1])
         if not target_username:
-            self.bot.reply_to(message, "❌ Неверный username!")
+            outbound_queue.reply(message, "❌ Неверный username!")
             return
 
+        target = db_instance.resolve_principal(target_username)
+
         # Проверяем, есть ли целевой пользователь в системе
-        if not db_instance.user_exists(target_username):
-            self.bot.reply_to(message, "❌ Пользователь не найден в системе!")
+        if not target.exists:
+            outbound_queue.reply(message, "❌ Пользователь не найден в системе!")
             return
 
-        user_data = db_instance.get_user(target_username)
-        if not user_data:
-            self.bot.reply_to(message, "❌ Ошибка получения данных!")
-            return
+        user_data = target.user
 
         rank_text = {
             'operator': '⚡ Оператор',
@@ -494,7 +591,7 @@ class Handlers:
             'user': '👤 Пользователь'
         }.get(user_data.get('rank', 'user'), '👤 Пользователь')
 
-        banned_status = "🚫 Забанен" if db_instance.is_banned(target_username) else "✅ Активен"
+        banned_status = "🚫 Забанен" if target.banned else "✅ Активен"
 
         info_text = (
             "👤 <b>Информация о пользователе</b>\n\n"
@@ -509,25 +606,25 @@ class Handlers:
                 f"💢 Предупреждения: {user_data['warns']}/{Config.MAX_WARN}"
             )
 
-        self.bot.reply_to(message, info_text, parse_mode='HTML')
+        outbound_queue.reply(message, info_text, parse_mode='HTML')
 
-    def handle_reguser(self, message: Message):
+    def handle_reguser(self, message: Message, caller=None):
         """Обработка команды /reguser - регистрация пользователя"""
-        username = message.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
             return
 
-        if not db_instance.is_global_admin(username):
-            self.bot.reply_to(message, "❌ Недостаточно прав!")
+        if not caller.is_global_admin:
+            outbound_queue.reply(message, "❌ Недостаточно прав!")
             return
 
         if not message.reply_to_message:
-            self.bot.reply_to(message, "❌ Ответьте на сообщение пользователя!")
+            outbound_queue.reply(message, "❌ Ответьте на сообщение пользователя!")
             return
 
         reply_username = message.reply_to_message.from_user.username
         if not reply_username:
-            self.bot.reply_to(message, "❌ У пользователя нет username!")
+            outbound_queue.reply(message, "❌ У пользователя нет username!")
             return
 
         # Добавляем пользователя в систему
@@ -536,99 +633,118 @@ class Handlers:
             reply_username,
             message.reply_to_message.from_user.first_name
         ):
-            self.bot.reply_to(message, f"✅ Пользователь @{reply_username} зарегистрирован в системе")
+            outbound_queue.reply(message, f"✅ Пользователь @{reply_username} зарегистрирован в системе")
         else:
-            self.bot.reply_to(message, f"ℹ️ Пользователь @{reply_username} уже существует в системе")
+            outbound_queue.reply(message, f"ℹ️ Пользователь @{reply_username} уже существует в системе")
 
-    def handle_stats(self, message: Message):
+    def handle_stats(self, message: Message, caller=None):
         """Обработка команды /stats"""
-        username = message.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
             return
 
-        if not db_instance.is_operator(username):
-            self.bot.reply_to(message, "❌ Только операторы могут просматривать статистику!")
+        if not caller.is_operator:
+            outbound_queue.reply(message, "❌ Только операторы могут просматривать статистику!")
             return
 
         stats_text = Utils.get_stats()
-        self.bot.reply_to(message, stats_text, parse_mode='HTML')
+        outbound_queue.reply(message, stats_text, parse_mode='HTML')
 
-    def handle_alarm(self, message: Message):
+    def handle_alarm(self, message: Message, caller=None):
         """Обработка команды /alarm - уведомление всех пользователей"""
-        username = message.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
             return
 
-        if not db_instance.is_operator(username):
-            self.bot.reply_to(message, "❌ Только операторы могут отправлять уведомления!")
+        if not caller.is_operator:
+            outbound_queue.reply(message, "❌ Только операторы могут отправлять уведомления!")
             return
 
         parts = message.text.split(maxsplit=1)
         if len(parts) < 2:
-            self.bot.reply_to(message, "❌ Использование: /alarm <сообщение>")
+            outbound_queue.reply(message, "❌ Использование: /alarm <сообщение>")
             return
 
         alarm_message = parts[1]
-        users = db_instance.get_all_users()
+        full_message = f"🚨 <b>Важное уведомление от оператора!</b>\n\n{alarm_message}"
+        progress_reply = outbound_queue.reply(message, "📨 Подготовка рассылки...")
+        progress = ProgressReporter(lambda text: self.edit_reply(progress_reply, text))
 
-        sent_count = 0
-        total_count = len(users)
+        def on_progress(job):
+            progress.update(f"📨 Рассылка #{job.id}: {job.sent}/{job.total}")
 
-        progress_msg = self.bot.reply_to(message, f"📨 Отправка уведомлений: 0/{total_count}")
+        def on_done(job):
+            if job.status == 'cancelled':
+                progress.finish(f"🚫 Рассылка #{job.id} отменена: отправлено {job.sent}/{job.total}")
+            else:
+                progress.finish(f"✅ Уведомления отправлены: {job.sent}/{job.total} пользователей")
 
-        for i, user in enumerate(users, 1):
-            try:
-                if not db_instance.is_banned(user.get('username')):
-                    full_message = f"🚨 <b>Важное уведомление от оператора!</b>\n\n{alarm_message}"
-                    self.bot.send_message(user.get('user_id'), full_message, parse_mode='HTML')
-                    sent_count += 1
-
-                    # Обновляем прогресс каждые 10 отправок
-                    if sent_count % 10 == 0:
-                        self.bot.edit_message_text(
-                            f"📨 Отправка уведомлений: {sent_count}/{total_count}",
-                            progress_msg.chat.id,
-                            progress_msg.message_id
-                        )
-                    time.sleep(0.1)  # Задержка чтобы не спамить
+        # Рассылка выполняется движком в фоне, поток обработчика сразу освобождается
+        job = broadcast_engine.submit(full_message, caller.username, on_progress, on_done)
+        if job is None:
+            progress.finish("❌ Не удалось создать рассылку")
 
-            except Exception as e:
-                logger.error(f"Ошибка отправки уведомления @{user.get('username')}: {e}")
-                continue
+    def handle_alarm_control(self, message: Message, caller=None):
+        """Обработка команд /alarmstatus [номер] и /alarmcancel <номер>"""
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
+            return
 
-        self.bot.edit_message_text(
-            f"✅ Уведомления отправлены: {sent_count}/{total_count} пользователей",
-            progress_msg.chat.id,
-            progress_msg.message_id
-        )
+        if not caller.is_operator:
+            outbound_queue.reply(message, "❌ Только операторы могут управлять рассылками!")
+            return
+
+        parts = message.text.split()
+        command = parts[0].lower().split('@')[0]
+        job_id = parts[1].lstrip('#') if len(parts) > 1 else None
+        if job_id is not None and not job_id.isdigit():
+            outbound_queue.reply(message, "❌ Номер рассылки должен быть числом!")
+            return
+        job_id = int(job_id) if job_id else None
+
+        if command == '/alarmcancel':
+            if job_id is None:
+                outbound_queue.reply(message, "❌ Использование: /alarmcancel <номер_рассылки>")
+            elif broadcast_engine.cancel(job_id):
+                outbound_queue.reply(message, f"🚫 Рассылка #{job_id} отменяется")
+                logger.info(f"@{caller.username} cancelled broadcast #{job_id}")
+            else:
+                outbound_queue.reply(message, f"❌ Рассылка #{job_id} не найдена или уже завершена")
+            return
+
+        status = broadcast_engine.status_text(job_id)
+        if status is None:
+            outbound_queue.reply(message, f"❌ Рассылка #{job_id} не найдена")
+        else:
+            outbound_queue.reply(message, status, parse_mode='HTML')
 
-    def handle_all_messages(self, message: Message):
+    def handle_all_messages(self, message: Message, caller=None):
         """Обработка всех текстовых сообщений"""
-        username = message.from_user.username
-        if not username:
-            self.bot.reply_to(message, "❌ У вас не установлен username! Установите его в настройках Telegram.")
+        caller = self.get_caller(message, caller)
+        if not caller.username:
+            outbound_queue.reply(message, "❌ У вас не установлен username! Установите его в настройках Telegram.")
             return
 
         # Проверяем, есть ли пользователь в системе
-        if not db_instance.user_exists(username):
-            self.bot.reply_to(message, "❌ Вы не зарегистрированы в системе! Обратитесь к администратору.")
+        if not caller.exists:
+            outbound_queue.reply(message, "❌ Вы не зарегистрированы в системе! Обратитесь к администратору.")
             return
 
         # Проверяем бан
-        if db_instance.is_banned(username):
-            self.bot.reply_to(message, "🚫 Вы забанены и не можете использовать бота.")
+        if caller.banned:
+            outbound_queue.reply(message, "🚫 Вы забанены и не можете использовать бота.")
             return
 
         # Обычные пользователи в ЛС не могут ничего делать
         if (message.chat.type == 'private' and
-            db_instance.get_user_rank(username) == 'user'):
-            self.bot.reply_to(message, "❌ У вас нет доступа к функциям бота.")
+            caller.rank == 'user'):
+            outbound_queue.reply(message, "❌ У вас нет доступа к функциям бота.")
             return
 
-    def handle_callback_query(self, call: CallbackQuery):
+    def handle_callback_query(self, call: CallbackQuery, caller=None):
         """Обработка callback запросов"""
-        username = call.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(call, caller)
+        if not caller.username or caller.banned:
             return
 
         if call.data.startswith('list_'):
@@ -637,14 +753,14 @@ class Handlers:
 
         elif call.data.startswith('promote_'):
             rank = call.data.split('_')[1]
-            self.handle_promote_callback(call, rank)
+            self.handle_promote_callback(call, rank, caller)
 
         elif call.data.startswith('ladmin_bot_'):
             bot_name = call.data.split('ladmin_bot_')[1]
-            self.handle_ladmin_bot_selection(call, bot_name)
+            self.handle_ladmin_bot_selection(call, bot_name, caller)
 
         elif call.data == 'cancel_action':
-            self.bot.delete_message(call.message.chat.id, call.message.message_id)
+            outbound_queue.call(call.message.chat.id, 'delete_message', call.message.chat.id, call.message.message_id)
             self.bot.answer_callback_query(call.id, "❌ Действие отменено")
 
     def handle_list_callback(self, call: CallbackQuery, list_type):
@@ -662,21 +778,22 @@ class Handlers:
         else:
             text = "❌ Неизвестный тип списка"
 
-        self.bot.edit_message_text(
-            text,
+        outbound_queue.edit(
             call.message.chat.id,
             call.message.message_id,
+            text,
             parse_mode='HTML'
         )
 
-    def handle_promote_callback(self, call: CallbackQuery, rank):
+    def handle_promote_callback(self, call: CallbackQuery, rank, caller=None):
         """Обработка callback для повышения пользователя"""
-        username = call.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(call, caller)
+        username = caller.username
+        if not username or caller.banned:
             self.bot.answer_callback_query(call.id, "❌ Доступ запрещен")
             return
 
-        if not db_instance.is_operator(username):
+        if not caller.is_operator:
             self.bot.answer_callback_query(call.id, "❌ Только операторы могут повышать!")
             return
 
@@ -692,13 +809,15 @@ class Handlers:
             self.bot.answer_callback_query(call.id, "❌ Неверный username!")
             return
 
+        target = db_instance.resolve_principal(target_username)
+
         # Проверяем, есть ли целевой пользователь в системе
-        if not db_instance.user_exists(target_username):
+        if not target.exists:
             self.bot.answer_callback_query(call.id, "❌ Пользователь не найден в системе!")
             return
 
         # Проверяем бан целевого пользователя
-        if db_instance.is_banned(target_username):
+        if target.banned:
             self.bot.answer_callback_query(call.id, "❌ Нельзя повысить забаненного!")
             return
 
@@ -709,10 +828,10 @@ class Handlers:
                 self.bot.answer_callback_query(call.id, "❌ Нет доступных ботов!")
                 return
 
-            self.bot.edit_message_text(
-                f"🤖 Выберите бота для назначения @{target_username} локальным администратором:",
+            outbound_queue.edit(
                 call.message.chat.id,
                 call.message.message_id,
+                f"🤖 Выберите бота для назначения @{target_username} локальным администратором:",
                 reply_markup=self.get_bot_selection_keyboard()
             )
             return
@@ -740,10 +859,10 @@ class Handlers:
             logger.info(f"@{username} повысил @{target_username} до {rank}")
 
         # Обновляем сообщение
-        self.bot.edit_message_text(
-            message,
+        outbound_queue.edit(
             call.message.chat.id,
-            call.message.message_id
+            call.message.message_id,
+            message
         )
 
         self.bot.answer_callback_query(call.id)
@@ -752,9 +871,9 @@ class Handlers:
         """Обработка команд op/unop (только через консоль)"""
         # Эти команды обрабатываются только через консоль
         if message.chat.type != 'private':
-            self.bot.reply_to(message, "❌ Команды /op и /unop доступны только через консоль!")
+            outbound_queue.reply(message, "❌ Команды /op и /unop доступны только через консоль!")
         else:
-            self.bot.reply_to(message, "❌ Эти команды работают только в консольном режиме!")
+            outbound_queue.reply(message, "❌ Эти команды работают только в консольном режиме!")
 
     @staticmethod
     def get_bot_selection_keyboard():
@@ -775,14 +894,15 @@ class Handlers:
         )
         return keyboard
 
-    def handle_ladmin_bot_selection(self, call: CallbackQuery, bot_name):
+    def handle_ladmin_bot_selection(self, call: CallbackQuery, bot_name, caller=None):
         """Обработка выбора бота для локального админа"""
-        username = call.from_user.username
-        if not username or db_instance.is_banned(username):
+        caller = self.get_caller(call, caller)
+        username = caller.username
+        if not username or caller.banned:
             self.bot.answer_callback_query(call.id, "❌ Доступ запрещен")
             return
 
-        if not db_instance.is_operator(username):
+        if not caller.is_operator:
             self.bot.answer_callback_query(call.id, "❌ Только операторы могут назначать локальных админов!")
             return
 
@@ -808,28 +928,28 @@ class Handlers:
         else:
             message = f"ℹ️ @{target_username} уже локальный администратор для {bot_name}"
 
-        self.bot.edit_message_text(
-            message,
+        outbound_queue.edit(
             call.message.chat.id,
-            call.message.message_id
+            call.message.message_id,
+            message
         )
 
         self.bot.answer_callback_query(call.id)
 
-    def handle_bot_management(self, message: Message):
-        """Обработка управления ботами: addbot, removebot, startbot, stopbot"""
-        username = message.from_user.username
-        if not username or db_instance.is_banned(username):
+    def handle_bot_management(self, message: Message, caller=None):
+        """Обработка управления ботами: addbot, removebot, startbot, stopbot, restartpolicy, setprobe"""
+        caller = self.get_caller(message, caller)
+        if not caller.username or caller.banned:
             return
 
         # Проверяем права - только операторы могут управлять ботами
-        if not db_instance.is_operator(username):
-            self.bot.reply_to(message, "❌ Только операторы могут управлять ботами!")
+        if not caller.is_operator:
+            outbound_queue.reply(message, "❌ Только операторы могут управлять ботами!")
             return
 
         parts = message.text.split()
         if len(parts) < 2:
-            self.bot.reply_to(message, "❌ Неверный формат команды!")
+            outbound_queue.reply(message, "❌ Неверный формат команды!")
             return
 
         command = parts[0].lower()
@@ -839,94 +959,185 @@ class Handlers:
             self.handle_add_bot(message, bot_name, parts)
         elif command == '/removebot':
             self.handle_remove_bot(message, bot_name)
+        elif command in ('/startbot', '/stopbot') and bot_name.lower() == 'all':
+            self.handle_bulk_bots(message, command, parts)
         elif command == '/startbot':
             self.handle_start_bot(message, bot_name)
         elif command == '/stopbot':
             self.handle_stop_bot(message, bot_name)
+        elif command == '/restartpolicy':
+            self.handle_restart_policy(message, bot_name, parts)
+        elif command == '/setprobe':
+            self.handle_set_probe(message, bot_name)
         else:
-            self.bot.reply_to(message, "❌ Неизвестная команда!")
+            outbound_queue.reply(message, "❌ Неизвестная команда!")
 
     def handle_add_bot(self, message: Message, bot_name: str, parts: list):
         """Обработка добавления бота"""
         if len(parts) < 4:
-            self.bot.reply_to(message, "❌ Использование: /addbot <имя_бота> <@юзернейм_бота> <тип>")
+            outbound_queue.reply(message, "❌ Использование: /addbot <имя_бота> <@юзернейм_бота> <тип> [политика_перезапуска]")
             return
 
         bot_username = parts[2]
         bot_type = parts[3]
+        restart_policy = parts[4].lower() if len(parts) > 4 else Config.BOT_RESTART_POLICY
+
+        if restart_policy not in RESTART_POLICIES:
+            outbound_queue.reply(message, f"❌ Политика перезапуска: {', '.join(RESTART_POLICIES)}")
+            return
 
         exe_path = os.path.join(Config.BOTS_DIR, f'{bot_name}.exe')
 
         # Проверяем валидность пути
         if not os.path.exists(exe_path):
-            self.bot.reply_to(message, f"❌ Файл не найден: {exe_path}")
+            outbound_queue.reply(message, f"❌ Файл не найден: {exe_path}")
             return
 
         if not exe_path.lower().endswith('.exe'):
-            self.bot.reply_to(message, "❌ Укажите путь к .exe файлу!")
+            outbound_queue.reply(message, "❌ Укажите путь к .exe файлу!")
             return
 
         # Добавляем бота в базу
-        if db_instance.add_bot(bot_name, exe_path, bot_username, bot_type):
-            self.bot.reply_to(message, f"✅ Бот '{bot_name}' успешно добавлен!\n"
-                                       f"🤖 Username: {bot_username}\n"
-                                       f"🔧 Тип: {bot_type}\n"
-                                       f"📁 Путь: {exe_path}")
+        if db_instance.add_bot(bot_name, exe_path, bot_username, bot_type, restart_policy):
+            outbound_queue.reply(message, f"✅ Бот '{bot_name}' успешно добавлен!\n"
+                                          f"🤖 Username: {bot_username}\n"
+                                          f"🔧 Тип: {bot_type}\n"
+                                          f"🔁 Перезапуск: {restart_policy}\n"
+                                          f"📁 Путь: {exe_path}")
         else:
-            self.bot.reply_to(message, f"❌ Бот '{bot_name}' уже существует!")
+            outbound_queue.reply(message, f"❌ Бот '{bot_name}' уже существует!")
+
+    def handle_restart_policy(self, message: Message, bot_name: str, parts: list):
+        """Обработка изменения политики перезапуска бота"""
+        if len(parts) < 3 or parts[2].lower() not in RESTART_POLICIES:
+            outbound_queue.reply(message, f"❌ Использование: /restartpolicy <имя_бота> <{'|'.join(RESTART_POLICIES)}>")
+            return
+
+        restart_policy = parts[2].lower()
+        if db_instance.set_bot_restart_policy(bot_name, restart_policy):
+            outbound_queue.reply(message, f"✅ Политика перезапуска бота '{bot_name}': {restart_policy}")
+        else:
+            outbound_queue.reply(message, f"❌ Бот '{bot_name}' не найден!")
+
+    def handle_set_probe(self, message: Message, bot_name: str):
+        """Обработка установки пробы здоровья бота"""
+        # Цель пробы типа cmd может содержать пробелы
+        parts = message.text.split(maxsplit=3)
+        probe_type = parts[2].lower() if len(parts) > 2 else None
+
+        if probe_type == 'none':
+            probe_target = None
+            probe_type = None
+        elif probe_type in PROBE_TYPES and len(parts) > 3:
+            probe_target = parts[3].strip()
+        else:
+            outbound_queue.reply(message, f"❌ Использование: /setprobe <имя_бота> <{'|'.join(PROBE_TYPES)}> <цель>\n"
+                                          f"или /setprobe <имя_бота> none")
+            return
+
+        error = validate_probe(probe_type, probe_target)
+        if error:
+            outbound_queue.reply(message, f"❌ {error}")
+            return
+
+        if db_instance.set_bot_probe(bot_name, probe_type, probe_target):
+            if probe_type:
+                outbound_queue.reply(message, f"✅ Проба бота '{bot_name}': {probe_type} {probe_target}")
+            else:
+                outbound_queue.reply(message, f"✅ Проба бота '{bot_name}' отключена")
+        else:
+            outbound_queue.reply(message, f"❌ Бот '{bot_name}' не найден!")
 
     def handle_remove_bot(self, message: Message, bot_name: str):
         """Обработка удаления бота"""
         if db_instance.remove_bot(bot_name):
-            self.bot.reply_to(message, f"✅ Бот '{bot_name}' успешно удален!")
+            outbound_queue.reply(message, f"✅ Бот '{bot_name}' успешно удален!")
+        else:
+            outbound_queue.reply(message, f"❌ Бот '{bot_name}' не найден!")
+
+    def handle_bulk_bots(self, message: Message, command: str, parts: list):
+        """Обработка /startbot all [тип] и /stopbot all [тип]"""
+        bot_type = parts[2] if len(parts) > 2 else None
+        if command == '/startbot':
+            operation, placeholder = Utils.start_all_bots, "⏳ Запускаю ботов..."
         else:
-            self.bot.reply_to(message, f"❌ Бот '{bot_name}' не найден!")
+            operation, placeholder = Utils.stop_all_bots, "⏳ Останавливаю ботов..."
+
+        def run(progress):
+            result = operation(bot_type, progress)
+            if result is None:
+                return "❌ Нет ботов" + (f" типа '{bot_type}'" if bot_type else "") + "!"
+            return result
+
+        self.reply_later(message, placeholder, run, parse_mode='HTML', progress=True)
+
+    def reply_later(self, message: Message, placeholder: str, func, *args, parse_mode=None, progress=False):
+        """Мгновенный ответ-заглушка, который заменяется результатом func, выполненной в фоновом потоке.
+
+        При progress=True func получает последним аргументом функцию для промежуточных состояний.
+        """
+        reply = outbound_queue.reply(message, placeholder)
+        reporter = ProgressReporter(lambda text: self.edit_reply(reply, text, parse_mode=parse_mode))
+
+        def run():
+            try:
+                result = func(*args, reporter.update) if progress else func(*args)
+            except Exception as e:
+                logger.error(f"Background command error: {e}")
+                result = f"❌ Ошибка: {html.escape(str(e)) if parse_mode == 'HTML' else e}"
+            reporter.finish(result)
+
+        threading.Thread(target=run, name="reply-later", daemon=True).start()
+
+    @staticmethod
+    def edit_reply(reply, text, **kwargs):
+        """Правка ответа, отправленного через очередь, после его доставки"""
+        if reply.wait():
+            outbound_queue.edit(reply.result.chat.id, reply.result.message_id, text, **kwargs)
 
     def handle_start_bot(self, message: Message, bot_name: str):
         """Обработка запуска бота"""
         bot = db_instance.get_bot(bot_name)
 
         if not bot:
-            self.bot.reply_to(message, f"❌ Бот '{bot_name}' не найден!")
+            outbound_queue.reply(message, f"❌ Бот '{bot_name}' не найден!")
             return
 
 
         if not bot.get('exe_path'):
-            self.bot.reply_to(message, f"❌ Для бота '{bot_name}' не указан путь к exe!")
+            outbound_queue.reply(message, f"❌ Для бота '{bot_name}' не указан путь к exe!")
             return
 
         # Проверяем статус бота
         status = Utils.get_bot_status(bot)
         if status == "running":
-            self.bot.reply_to(message, f"✅ Бот '{bot_name}' уже запущен!")
+            outbound_queue.reply(message, f"✅ Бот '{bot_name}' уже запущен!")
             return
         elif status == "error":
-            self.bot.reply_to(message, f"❌ Ошибка проверки статуса бота '{bot_name}'!")
+            outbound_queue.reply(message, f"❌ Ошибка проверки статуса бота '{bot_name}'!")
             return
 
         # Запускаем бота
         result = Utils.start_bot(bot_name)
 
-        self.bot.reply_to(message, result)
+        outbound_queue.reply(message, result)
 
     def handle_stop_bot(self, message: Message, bot_name: str):
         """Обработка остановки бота"""
         bot = db_instance.get_bot(bot_name)
 
         if not bot:
-            self.bot.reply_to(message, f"❌ Бот '{bot_name}' не найден!")
+            outbound_queue.reply(message, f"❌ Бот '{bot_name}' не найден!")
             return
 
         # Проверяем статус бота
         status = Utils.get_bot_status(bot)
         if status == "stopped":
-            self.bot.reply_to(message, f"✅ Бот '{bot_name}' уже остановлен!")
+            outbound_queue.reply(message, f"✅ Бот '{bot_name}' уже остановлен!")
             return
         elif status == "error":
-            self.bot.reply_to(message, f"❌ Ошибка проверки статуса бота '{bot_name}'!")
+            outbound_queue.reply(message, f"❌ Ошибка проверки статуса бота '{bot_name}'!")
             return
 
-        # Останавливаем бота
-        result = Utils.stop_bot(bot)
-
-        self.bot.reply_to(message, result)
\ No newline at end of file
+        # Останавливаем бота в фоне: ожидание завершения не занимает поток обработчика
+        self.reply_later(message, f"⏳ Останавливаю бота '{bot_name}'...", Utils.stop_bot, bot_name)
\ No newline at end of file
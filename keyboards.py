@@ -4,11 +4,12 @@ from database import db_instance as Database
 
 class Keyboards:
     @staticmethod
-    def main_menu(username):
+    def main_menu(username, rank=None):
         """Главное меню в зависимости от роли"""
         keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
 
-        rank = Database.get_user_rank(username)
+        if rank is None:
+            rank = Database.get_user_rank(username)
 
         if rank == 'operator':
             buttons = [
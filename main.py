@@ -1,17 +1,43 @@
 import telebot
 import threading
 from config import Config, logger
+from database import db_instance
 from handlers import Handlers
 from console import ConsoleHandler
 from discord_bot import start_discord_bot
 from utils import Utils
+from scheduler import ban_scheduler, auth_janitor, counter_reconciler, resource_sampler, health_prober, \
+    output_follower
+from supervisor import bot_supervisor
+from broadcast import broadcast_engine
+from outbound import outbound_queue
+from webhook import WebhookServer
 
 
 def main():
     """Основная функция запуска бота"""
+    webhook_server = None
     try:
-        # Инициализация бота
-        bot = telebot.TeleBot(Config.BRB_TOKEN)
+        # Запуск консольного обработчика: через него применяются миграции, пока боты не запущены
+        ConsoleHandler.start_console_listener()
+
+        # Код рассчитан на последнюю версию схемы: со старой боты не запускаются
+        if not db_instance.schema_ready.is_set():
+            current_version, latest_version = db_instance.get_schema_version()
+            logger.error(f"Database schema version {current_version} is older than {latest_version}, "
+                         f"bots are not started until migrations are applied")
+            print(f"⚠️ Версия схемы базы {current_version}, требуется {latest_version}. "
+                  f"Боты не запущены, примените миграции командой /migrate apply")
+            while not db_instance.schema_ready.wait(1):
+                pass
+
+        # Инициализация бота. В режиме webhook обработчики выполняют потоки WebhookServer,
+        # чтобы его ограниченная очередь создавала обратное давление
+        bot = telebot.TeleBot(
+            Config.BRB_TOKEN,
+            use_class_middlewares=True,
+            threaded=Config.TELEGRAM_MODE != 'webhook'
+        )
 
         # Устанавливаем экземпляр бота в Utils для отправки сообщений
         Utils.set_telegram_bot(bot)
@@ -19,8 +45,20 @@ def main():
         # Инициализация обработчиков
         handlers = Handlers(bot)
 
-        # Запуск консольного обработчика
-        ConsoleHandler.start_console_listener()
+        # Поиск ботов, запущенных до перезапуска менеджера
+        bot_supervisor.adopt_running()
+
+        # Продолжение рассылок, прерванных перезапуском
+        broadcast_engine.resume()
+
+        # Запуск фоновых задач: снятие истекших банов, очистка кодов, сверка счетчиков,
+        # замеры ресурсов, пробы здоровья и чтение вывода ботов
+        ban_scheduler.start()
+        auth_janitor.start()
+        counter_reconciler.start()
+        resource_sampler.start()
+        health_prober.start()
+        output_follower.start()
 
         # Запуск Discord бота в отдельном потоке
         discord_thread = threading.Thread(target=start_discord_bot, daemon=True)
@@ -34,11 +72,37 @@ def main():
         print("🎮 Консольные команды доступны в отдельном потоке")
 
         # Запуск бота
-        bot.infinity_polling()
+        if Config.TELEGRAM_MODE == 'webhook':
+            webhook_server = WebhookServer.from_config(bot)
+            webhook_server.start()
+            # При остановке webhook не удаляется: Telegram хранит обновления до следующего запуска
+            bot.set_webhook(
+                url=Config.WEBHOOK_URL,
+                secret_token=Config.WEBHOOK_SECRET,
+                max_connections=Config.WEBHOOK_MAX_CONNECTIONS
+            )
+            logger.info(f"Telegram webhook set to {Config.WEBHOOK_URL}")
+            webhook_server.serve_forever()
+        else:
+            # При установленном webhook getUpdates не работает
+            bot.remove_webhook()
+            bot.infinity_polling()
 
     except Exception as e:
         logger.error(f"Ошибка запуска бота: {e}")
         print(f"❌ Ошибка запуска: {e}")
+    finally:
+        if webhook_server is not None:
+            webhook_server.stop()
+        ban_scheduler.stop()
+        auth_janitor.stop()
+        counter_reconciler.stop()
+        resource_sampler.stop()
+        health_prober.stop()
+        output_follower.stop()
+        # Отправка сообщений, оставшихся в очереди
+        outbound_queue.stop()
+        db_instance.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,341 @@
+import time
+import heapq
+import random
+import threading
+from collections import deque
+from telebot.apihelper import ApiTelegramException
+from config import Config, logger
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, не более capacity подряд (rate 0 - без ограничения)"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens=1):
+        """Взять токены без ожидания. Возвращает 0 или сколько секунд ждать до их появления"""
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def refund(self, tokens=1):
+        """Возврат неиспользованных токенов"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+    def acquire(self, tokens=1, stop_event=None):
+        """Ожидание токенов. False, если ожидание прервано событием stop_event"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return True
+            if stop_event is None:
+                time.sleep(wait)
+            elif stop_event.wait(wait):
+                return False
+
+
+class OutboundMessage:
+    """Вызов Bot API для одного чата в очереди: отправка, ответ, правка или удаление сообщения"""
+
+    def __init__(self, chat_id, method, args, kwargs):
+        self.chat_id = chat_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.attempts = 0
+        self.rate_limited = 0  # ответов 429, они не расходуют попытки attempts
+        self.enqueued_at = time.monotonic()
+        self.ok = None  # True - доставлено, False - не доставлено
+        self.result = None  # значение, возвращенное Bot API (например, отправленное Message)
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Ожидание результата отправки. None, если он еще не известен"""
+        self.done.wait(timeout)
+        return self.ok
+
+
+class OutboundQueue:
+    """Очередь исходящих сообщений Telegram.
+
+    Через нее идут все отправки, ответы, правки и удаления сообщений; мимо
+    очереди выполняются только answer_callback_query (это не сообщение в чат,
+    и Telegram ждет ответа на нажатие кнопки сразу) и прием обновлений.
+    Вызовы одного чата выполняются по порядку и не чаще OUTBOUND_CHAT_RATE,
+    все вместе - не чаще OUTBOUND_GLOBAL_RATE. На 429 Too Many Requests отправка
+    приостанавливается на retry_after, временные ошибки (сеть, 5xx) повторяются
+    с экспоненциальной задержкой и разбросом, остальные ошибки Telegram окончательны.
+    """
+
+    def __init__(self, workers, global_rate, chat_rate, chat_burst, max_size):
+        self.bot = None
+        self.workers = workers
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_size = max_size
+        self._chats = {}  # chat_id -> deque сообщений
+        self._buckets = {}  # chat_id -> TokenBucket
+        self._ready = []  # куча (время готовности, порядковый номер, chat_id)
+        self._seq = 0
+        self._size = 0
+        self._in_flight = 0
+        self._busy = set()  # чаты, сообщение которых сейчас отправляется
+        self._paused_until = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._stats = {'sent': 0, 'failed': 0, 'retried': 0, 'rate_limited': 0, 'dropped': 0}
+        self._latencies = deque(maxlen=1000)
+
+    def set_bot(self, bot):
+        """Экземпляр TeleBot, через который отправляются сообщения"""
+        self.bot = bot
+
+    def start(self):
+        """Запуск потоков отправки (повторный вызов ничего не делает)"""
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"outbound-{i}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def stop(self, timeout=10):
+        """Отправка оставшихся сообщений (не дольше timeout секунд) и остановка потоков"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._size and self._threads:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Outbound queue stopped with {self._size} undelivered messages")
+                    break
+                self._cond.wait(remaining)
+            self._stopping = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+
+        with self._cond:
+            # Ожидающие результата не должны ждать вечно. Сообщение, которое еще
+            # отправляет не успевший завершиться поток, остается ему: он сам запишет результат
+            for chat_id, chat in list(self._chats.items()):
+                keep = chat.popleft() if chat_id in self._busy else None
+                for message in chat:
+                    self._finish(message, False, "очередь остановлена")
+                chat.clear()
+                if keep is None:
+                    del self._chats[chat_id]
+                else:
+                    chat.append(keep)
+            self._ready.clear()
+            self._size = len(self._chats)
+
+    def enqueue(self, chat_id, text, **kwargs):
+        """Отправка сообщения через очередь. Возвращает OutboundMessage, не дожидаясь отправки"""
+        return self.call(chat_id, 'send_message', chat_id, text, **kwargs)
+
+    def reply(self, message, text, **kwargs):
+        """Ответ на сообщение (TeleBot.reply_to) через очередь"""
+        return self.call(message.chat.id, 'reply_to', message, text, **kwargs)
+
+    def edit(self, chat_id, message_id, text, **kwargs):
+        """Правка текста сообщения через очередь"""
+        return self.call(chat_id, 'edit_message_text', text, chat_id, message_id, **kwargs)
+
+    def call(self, chat_id, method, *args, **kwargs):
+        """Постановка вызова метода TeleBot для чата chat_id в очередь. Возвращает OutboundMessage"""
+        message = OutboundMessage(chat_id, method, args, kwargs)
+        self.start()
+
+        with self._cond:
+            deadline = time.monotonic() + Config.OUTBOUND_ENQUEUE_TIMEOUT
+            while self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['dropped'] += 1
+                    logger.error(f"Outbound queue is full ({self._size}), {method} for chat {chat_id} dropped")
+                    self._finish(message, False, "очередь переполнена")
+                    return message
+                self._cond.wait(remaining)
+
+            self._size += 1
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                self._chats[chat_id] = deque([message])
+                self._push(chat_id, time.monotonic())
+            else:
+                chat.append(message)
+        return message
+
+    def send(self, chat_id, text, timeout=None, **kwargs):
+        """Отправка с ожиданием результата. True, если сообщение доставлено"""
+        return bool(self.enqueue(chat_id, text, **kwargs).wait(timeout))
+
+    def stats(self):
+        """Глубина очереди, счетчики и задержка доставки (p50/p95, секунд)"""
+        with self._cond:
+            result = dict(self._stats, depth=self._size, in_flight=self._in_flight,
+                          paused=max(0, self._paused_until - time.monotonic()))
+            latencies = sorted(self._latencies)
+
+        result['p50'] = latencies[len(latencies) // 2] if latencies else None
+        result['p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None
+        return result
+
+    def _push(self, chat_id, ready_at):
+        self._seq += 1
+        heapq.heappush(self._ready, (ready_at, self._seq, chat_id))
+        self._cond.notify()
+
+    def _take(self):
+        """Ожидание чата, сообщение которого можно отправить. None при остановке"""
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                now = time.monotonic()
+                if not self._ready:
+                    self._cond.wait()
+                    continue
+                wait = max(self._ready[0][0], self._paused_until) - now
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                _, _, chat_id = heapq.heappop(self._ready)
+                bucket = self._buckets.get(chat_id)
+                if bucket is None:
+                    bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+
+                wait = bucket.try_acquire()
+                if not wait:
+                    wait = self.global_bucket.try_acquire()
+                    if wait:
+                        bucket.refund()
+                if wait:
+                    self._push(chat_id, now + wait)
+                    continue
+
+                # Пока сообщение отправляется, чата нет в куче: порядок внутри чата сохраняется
+                self._in_flight += 1
+                self._busy.add(chat_id)
+                return chat_id, self._chats[chat_id][0]
+
+    def _run(self):
+        """Поток отправки"""
+        while True:
+            taken = self._take()
+            if taken is None:
+                return
+            chat_id, message = taken
+            retry_at = self._deliver(message)
+
+            with self._cond:
+                self._in_flight -= 1
+                self._busy.discard(chat_id)
+                chat = self._chats[chat_id]
+                if retry_at is not None:
+                    if not self._stopping:
+                        self._push(chat_id, retry_at)
+                        continue
+                    self._finish(message, False, "очередь остановлена")
+
+                chat.popleft()
+                self._size -= 1
+                if chat:
+                    self._push(chat_id, time.monotonic())
+                else:
+                    del self._chats[chat_id]
+                    if self._buckets[chat_id].try_acquire(self.chat_burst) == 0:
+                        # Восстановившийся ограничитель не нужен: новый будет таким же
+                        del self._buckets[chat_id]
+                self._cond.notify_all()
+
+    def _deliver(self, message):
+        """Одна попытка отправки. Возвращает время повтора или None, если с сообщением покончено"""
+        if self.bot is None:
+            self._finish(message, False, "бот не инициализирован")
+            return None
+
+        message.attempts += 1
+        try:
+            message.result = getattr(self.bot, message.method)(*message.args, **message.kwargs)
+            self._finish(message, True)
+            return None
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                with self._cond:
+                    self._stats['rate_limited'] += 1
+                    # Ограничение действует на весь бот: приостанавливаются все потоки
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                message.attempts -= 1
+                message.rate_limited += 1
+                if message.rate_limited > Config.OUTBOUND_MAX_RATE_LIMITED:
+                    # Иначе постоянно ограничиваемый чат повторял бы сообщение вечно, задерживая свою очередь
+                    logger.error(f"Error in {message.method} for chat {message.chat_id}: "
+                                 f"rate limited {message.rate_limited} times, giving up")
+                    self._finish(message, False, e.description)
+                    return None
+                logger.warning(f"Telegram rate limit on {message.method} for chat {message.chat_id}, "
+                               f"retry after {retry_after}s")
+                return time.monotonic() + retry_after
+            if e.error_code == 400 and 'message is not modified' in str(e.description):
+                # Правка тем же текстом: сообщение уже в нужном состоянии
+                self._finish(message, True)
+                return None
+            if e.error_code < 500:
+                logger.error(f"Error in {message.method} for chat {message.chat_id}: {e}")
+                self._finish(message, False, e.description)
+                return None
+            error = e
+        except Exception as e:
+            # Сетевые ошибки считаются временными
+            error = e
+
+        if message.attempts > Config.OUTBOUND_MAX_RETRIES:
+            logger.error(f"Error in {message.method} for chat {message.chat_id} "
+                         f"after {message.attempts} attempts: {error}")
+            self._finish(message, False, str(error))
+            return None
+
+        delay = min(Config.OUTBOUND_BACKOFF_MAX, Config.OUTBOUND_BACKOFF_BASE * 2 ** (message.attempts - 1))
+        delay *= random.uniform(0.5, 1.5)
+        with self._cond:
+            self._stats['retried'] += 1
+        logger.warning(f"Temporary error in {message.method} for chat {message.chat_id}, "
+                       f"retry in {delay:.1f}s: {error}")
+        return time.monotonic() + delay
+
+    def _finish(self, message, ok, error=None):
+        message.ok = ok
+        message.error = error
+        with self._cond:
+            self._stats['sent' if ok else 'failed'] += 1
+            if ok:
+                self._latencies.append(time.monotonic() - message.enqueued_at)
+        message.done.set()
+
+
+# Глобальная очередь исходящих сообщений Telegram
+outbound_queue = OutboundQueue(Config.OUTBOUND_WORKERS, Config.OUTBOUND_GLOBAL_RATE, Config.OUTBOUND_CHAT_RATE,
+                               Config.OUTBOUND_CHAT_BURST, Config.OUTBOUND_QUEUE_SIZE)
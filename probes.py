@@ -0,0 +1,160 @@
+import os
+import shlex
+import socket
+import subprocess
+import time
+import ipaddress
+import urllib.error
+import urllib.parse
+import urllib.request
+from config import Config
+
+# Типы проб здоровья ботов
+PROBE_TYPES = ('tcp', 'http', 'unix', 'heartbeat', 'cmd')
+
+
+def check_probe_host(host):
+    """Хост пробы tcp или http должен быть loopback или из HEALTH_PROBE_ALLOWED_HOSTS, иначе ValueError.
+
+    Имена, кроме localhost и перечисленных в настройке, не разрешаются через DNS:
+    иначе через пробы можно было бы обращаться к внутренним сервисам сети.
+    """
+    host = (host or '').strip('[]').lower()
+    if host == 'localhost' or host in Config.HEALTH_PROBE_ALLOWED_HOSTS:
+        return host
+    try:
+        if ipaddress.ip_address(host).is_loopback:
+            return host
+    except ValueError:
+        pass
+    raise ValueError(f"хост пробы {host or '(пустой)'} не разрешен: допустимы loopback и HEALTH_PROBE_ALLOWED_HOSTS")
+
+
+def resolve_tcp(target):
+    """Адрес пробы tcp: (host, port) из host:port или просто port"""
+    host, _, port = target.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"неверный порт пробы: {port}")
+    return check_probe_host(host or '127.0.0.1'), port
+
+
+def resolve_http(target):
+    """URL пробы http (без схемы - http://) с проверкой хоста"""
+    url = target if target.startswith(('http://', 'https://')) else f'http://{target}'
+    try:
+        host = urllib.parse.urlsplit(url).hostname
+    except ValueError as e:
+        raise ValueError(f"неверный URL пробы: {e}")
+    check_probe_host(host)
+    return url
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Перенаправления не выполняются: они могли бы увести пробу на запрещенный хост"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_http_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def probe_tcp(target, timeout):
+    """Подключение к TCP-порту (host:port или просто port)"""
+    with socket.create_connection(resolve_tcp(target), timeout=timeout):
+        return True, f"порт {target} открыт"
+
+
+def probe_http(target, timeout):
+    """HTTP-запрос, успешен при коде ответа ниже 400"""
+    try:
+        with _http_opener.open(resolve_http(target), timeout=timeout) as response:
+            return response.status < 400, f"HTTP {response.status}"
+    except urllib.error.HTTPError as e:
+        # Сюда попадают и неисполненные перенаправления 3xx
+        return e.code < 400, f"HTTP {e.code}"
+
+
+def probe_unix(target, timeout):
+    """Подключение к unix-сокету"""
+    if not hasattr(socket, 'AF_UNIX'):
+        return False, "unix-сокеты не поддерживаются"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(target)
+        return True, "сокет доступен"
+
+
+def probe_heartbeat(target, timeout):
+    """Файл-пульс должен обновляться не реже HEALTH_HEARTBEAT_MAX_AGE секунд"""
+    age = time.time() - os.path.getmtime(target)
+    return age <= Config.HEALTH_HEARTBEAT_MAX_AGE, f"пульс {age:.0f} с назад"
+
+
+def resolve_cmd(target):
+    """Команда пробы cmd в виде списка аргументов.
+
+    Исполняемый файл должен лежать внутри BOTS_DIR (относительный путь
+    считается от нее), иначе ValueError: операторы не должны получать через
+    пробы запуск произвольных команд на сервере.
+    """
+    argv = shlex.split(target, posix=os.name != 'nt')
+    if not argv:
+        raise ValueError("пустая команда пробы")
+    bots_dir = os.path.realpath(Config.BOTS_DIR)
+    exe = os.path.realpath(os.path.join(bots_dir, argv[0]))
+    if os.path.commonpath([bots_dir, exe]) != bots_dir:
+        raise ValueError(f"команда пробы должна быть файлом из папки {Config.BOTS_DIR}")
+    if not os.path.isfile(exe):
+        raise ValueError(f"файл пробы {argv[0]} не найден в папке {Config.BOTS_DIR}")
+    return [exe] + argv[1:]
+
+
+def validate_probe(probe_type, target):
+    """Проверка цели пробы перед сохранением. Возвращает текст ошибки или None"""
+    resolve = {'tcp': resolve_tcp, 'http': resolve_http, 'cmd': resolve_cmd}.get(probe_type)
+    if resolve is not None:
+        try:
+            resolve(target)
+        except ValueError as e:
+            return str(e)
+    return None
+
+
+def probe_cmd(target, timeout):
+    """Команда из BOTS_DIR, успешна при нулевом коде выхода"""
+    result = subprocess.run(
+        resolve_cmd(target),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        timeout=timeout
+    )
+    return result.returncode == 0, f"код выхода {result.returncode}"
+
+
+PROBES = {
+    'tcp': probe_tcp,
+    'http': probe_http,
+    'unix': probe_unix,
+    'heartbeat': probe_heartbeat,
+    'cmd': probe_cmd,
+}
+
+
+def run_probe(probe_type, target, timeout=None):
+    """Выполнение пробы. Возвращает (успех, описание результата)"""
+    probe = PROBES.get(probe_type)
+    if probe is None:
+        return False, f"неизвестный тип пробы {probe_type}"
+
+    timeout = Config.HEALTH_PROBE_TIMEOUT if timeout is None else timeout
+    try:
+        return probe(target, timeout)
+    except subprocess.TimeoutExpired:
+        return False, f"таймаут {timeout} с"
+    except socket.timeout:
+        return False, f"таймаут {timeout} с"
+    except Exception as e:
+        return False, str(e) or type(e).__name__
@@ -0,0 +1,74 @@
+import time
+import threading
+from config import Config, logger
+
+
+class ProgressReporter:
+    """Обновление сообщения о ходе долгой операции.
+
+    Правки объединяются по времени: не чаще одной за interval секунд, последняя
+    промежуточная отправляется по таймеру. Правка тем же текстом не выполняется,
+    итоговое состояние после finish отправляется всегда и последним.
+    """
+
+    def __init__(self, edit, interval=None):
+        self.edit = edit  # edit(text), может выбрасывать исключения
+        self.interval = Config.PROGRESS_UPDATE_INTERVAL if interval is None else interval
+        self.edits = 0
+        self._last_text = None
+        self._last_at = 0
+        self._pending = None
+        self._timer = None
+        self._finished = False
+        self._lock = threading.Lock()
+        self._emit_lock = threading.Lock()  # правки выполняются по одной и по порядку
+
+    def update(self, text):
+        """Новое промежуточное состояние"""
+        with self._lock:
+            if self._finished:
+                return
+            self._pending = text
+            if self._timer is not None:
+                # Отложенная правка уже запланирована и возьмет последний текст
+                return
+            wait = self._last_at + self.interval - time.monotonic()
+            if wait > 0:
+                self._timer = threading.Timer(wait, self._on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+        self._flush()
+
+    def finish(self, text):
+        """Итоговое состояние: отправляется сразу, последующие update игнорируются"""
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+            self._pending = text
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self._flush()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+        self._flush()
+
+    def _flush(self):
+        """Отправка ожидающего текста, если он отличается от показанного"""
+        with self._emit_lock:
+            with self._lock:
+                text, self._pending = self._pending, None
+                if text is None or text == self._last_text:
+                    return
+                self._last_text = text
+                self._last_at = time.monotonic()
+
+            try:
+                self.edit(text)
+                self.edits += 1
+            except Exception as e:
+                logger.error(f"Error updating progress message: {e}")
@@ -0,0 +1,210 @@
+import threading
+import time
+from database import db_instance
+from supervisor import bot_supervisor
+from utils import Utils
+from config import Config, logger
+
+
+class PeriodicTask:
+    """Фоновая задача, выполняемая в отдельном потоке с заданным интервалом"""
+
+    name = "periodic-task"
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запуск задачи (интервал 0 отключает ее)"""
+        if self.interval <= 0:
+            logger.info(f"{self.name} is disabled")
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка задачи"""
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"{self.name} error: {e}")
+            self._stopped.wait(self.interval)
+
+    def run_once(self):
+        """Один проход задачи"""
+        raise NotImplementedError
+
+
+class AuthCodeJanitor(PeriodicTask):
+    """Периодическая очистка просроченных кодов аутентификации"""
+
+    name = "auth-code-janitor"
+
+    def __init__(self, database, interval):
+        super().__init__(interval)
+        self.database = database
+        self.last_run = None
+
+    def run_once(self):
+        started = time.perf_counter()
+        deleted = self.database.cleanup_expired_auth_codes()
+
+        if deleted and Config.DB_OPTIMIZE_AFTER_CLEANUP:
+            self.database.optimize(Config.DB_INCREMENTAL_VACUUM_PAGES)
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        self.last_run = {
+            'deleted': deleted,
+            'duration_ms': duration_ms,
+            'finished_at': int(time.time()),
+        }
+        if deleted:
+            logger.info(f"Auth code cleanup removed {deleted} rows in {duration_ms:.1f} ms")
+
+
+class CounterReconciler(PeriodicTask):
+    """Периодическая сверка материализованных счетчиков с таблицами"""
+
+    name = "counter-reconciler"
+
+    def __init__(self, database, interval):
+        super().__init__(interval)
+        self.database = database
+
+    def run_once(self):
+        drift = self.database.reconcile_counters()
+        for name, (stored, actual) in drift.items():
+            logger.warning(f"Counter '{name}' drifted: {stored} -> {actual}, fixed")
+
+
+class ResourceSampler(PeriodicTask):
+    """Периодический замер ресурсов ботов и сохранение усредненных замеров в базу"""
+
+    name = "resource-sampler"
+
+    def __init__(self, supervisor, database, interval):
+        super().__init__(interval)
+        self.supervisor = supervisor
+        self.database = database
+        self._last_flush = time.monotonic()
+
+    def stop(self):
+        super().stop()
+        self.flush()
+
+    def run_once(self):
+        self.supervisor.sample_resources()
+        if time.monotonic() - self._last_flush >= Config.METRICS_PERSIST_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Сохранение накопленных замеров и удаление устаревших"""
+        self._last_flush = time.monotonic()
+        self.supervisor.flush_metrics()
+        self.database.prune_bot_metrics(int(time.time()) - Config.METRICS_RETENTION_DAYS * 86400)
+
+
+class HealthProber(PeriodicTask):
+    """Периодический запуск проб здоровья ботов"""
+
+    name = "health-prober"
+
+    def __init__(self, supervisor, interval):
+        super().__init__(interval)
+        self.supervisor = supervisor
+
+    def run_once(self):
+        self.supervisor.check_health()
+
+
+class BotOutputFollower(PeriodicTask):
+    """Периодическое чтение файлов вывода ботов в буферы /botlogs"""
+
+    name = "bot-output-follower"
+
+    def __init__(self, supervisor, interval):
+        super().__init__(interval)
+        self.supervisor = supervisor
+
+    def run_once(self):
+        self.supervisor.poll_outputs()
+
+
+class BanExpiryScheduler:
+    """Снятие временных банов точно в момент их окончания"""
+
+    # Задержка повтора, если истекший бан не удалось снять (секунд)
+    MIN_RETRY_DELAY = 1
+    MAX_RETRY_DELAY = 60
+
+    def __init__(self, database):
+        self.database = database
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        # Новый временный бан может закончиться раньше текущего ожидания
+        database.add_ban_listener(lambda username, expires_at: self._wakeup.set())
+
+    def start(self):
+        """Запуск планировщика в отдельном потоке"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="ban-expiry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка планировщика"""
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _run(self):
+        retry_delay = self.MIN_RETRY_DELAY
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            try:
+                self.lift_expired()
+                next_expiry = self.database.get_next_ban_expiry()
+            except Exception as e:
+                logger.error(f"Ban expiry scheduler error: {e}")
+                next_expiry = time.time() + 60
+
+            # Спим до ближайшего окончания бана или до нового бана
+            timeout = None if next_expiry is None else next_expiry - time.time()
+            if timeout is not None and timeout <= 0:
+                # Истекший бан не снялся (ошибка базы): повтор с растущей задержкой вместо цикла без ожидания
+                timeout = retry_delay
+                retry_delay = min(retry_delay * 2, self.MAX_RETRY_DELAY)
+            else:
+                retry_delay = self.MIN_RETRY_DELAY
+            self._wakeup.wait(timeout)
+
+    def lift_expired(self):
+        """Снятие истекших банов и уведомление пользователей"""
+        usernames = self.database.lift_expired_bans()
+        if not usernames:
+            return
+
+        logger.info(f"Lifted {len(usernames)} expired bans: {', '.join('@' + u for u in usernames)}")
+        message = "✅ <b>Срок вашего бана истек, вы разблокированы в нашей сетке ботов!</b>"
+        for username in usernames:
+            Utils.send_message_to_user(None, username, message)
+
+
+# Глобальные фоновые задачи
+ban_scheduler = BanExpiryScheduler(db_instance)
+auth_janitor = AuthCodeJanitor(db_instance, Config.AUTH_CLEANUP_INTERVAL)
+counter_reconciler = CounterReconciler(db_instance, Config.COUNTERS_RECONCILE_INTERVAL)
+resource_sampler = ResourceSampler(bot_supervisor, db_instance, Config.METRICS_SAMPLE_INTERVAL)
+health_prober = HealthProber(bot_supervisor, Config.HEALTH_PROBE_INTERVAL)
+output_follower = BotOutputFollower(bot_supervisor, Config.BOT_LOG_POLL_INTERVAL)
@@ -0,0 +1,728 @@
+import os
+import select
+import shutil
+import subprocess
+import threading
+import time
+import psutil
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from database import db_instance
+from probes import run_probe
+from config import Config, logger
+
+
+# Политики автоматического перезапуска ботов
+RESTART_POLICIES = ('never', 'on-failure', 'always')
+
+
+# Один замер ресурсов процесса бота (rss в байтах, fds - дескрипторы файлов или handles в Windows)
+ResourceSample = namedtuple('ResourceSample', 'ts cpu rss threads fds')
+
+
+def summarize_samples(samples):
+    """Среднее и максимум по списку замеров"""
+    return {
+        'cpu_avg': sum(s.cpu for s in samples) / len(samples),
+        'cpu_max': max(s.cpu for s in samples),
+        'rss_avg': sum(s.rss for s in samples) // len(samples),
+        'rss_max': max(s.rss for s in samples),
+        'threads': max(s.threads for s in samples),
+        'fds': max(s.fds for s in samples),
+        'samples': len(samples),
+    }
+
+
+class ProcessSnapshot:
+    """Снимок таблицы процессов: имя exe -> список PID (один проход по процессам)"""
+
+    def __init__(self):
+        self.pids_by_exe = defaultdict(list)
+
+        for process in psutil.process_iter(['pid', 'exe']):
+            exe = process.info['exe']
+            if exe:
+                self.pids_by_exe[os.path.basename(exe).lower()].append(process.info['pid'])
+
+    def pids(self, exe_path):
+        """PID процессов, запущенных из exe с тем же именем файла"""
+        return self.pids_by_exe.get(os.path.basename(exe_path).lower(), [])
+
+
+class BotOutput:
+    """Вывод бота: файл LOGS_DIR/<бот>.log и последние строки из него в памяти.
+
+    Процесс бота пишет stdout и stderr прямо в файл, менеджер только читает его,
+    поэтому бот не зависит от процесса менеджера и продолжает работать после
+    его перезапуска. Файл дописывается в режиме append, поэтому при ротации он
+    копируется и обрезается на месте (строки, записанные между копированием
+    и обрезкой, теряются).
+    """
+
+    # Сколько последних байт непрочитанного вывода читается за проход (более ранние в буфер не попадут)
+    READ_LIMIT = 256 * 1024
+    # Размер одного чтения и предел незавершенной строки (байт)
+    READ_CHUNK = 64 * 1024
+
+    def __init__(self, name):
+        self.name = name
+        self.path = os.path.join(Config.LOGS_DIR, f'{name}.log')
+        self.lines = deque(maxlen=Config.BOT_LOG_BUFFER_LINES)
+        self._offset = 0
+        self._partial = b''
+        self._skip_line = False  # чтение начато с середины строки
+        self._lock = threading.Lock()
+        # Заполнение буфера последними строками существующего файла
+        self._read()
+
+    def open_for_child(self):
+        """Файл для stdout и stderr нового процесса бота"""
+        with self._lock:
+            self._read()
+            self._rotate_if_needed()
+        return open(self.path, 'ab')
+
+    def poll(self):
+        """Чтение строк, дописанных ботом с прошлого вызова, и ротация файла (вызывается потоком чтения)"""
+        with self._lock:
+            self._read()
+            self._rotate_if_needed()
+
+    def tail(self, count):
+        """Последние count строк из буфера (файл не читается)"""
+        with self._lock:
+            return list(self.lines)[-count:] if count > 0 else []
+
+    def _read(self):
+        """Чтение нового вывода частями по READ_CHUNK, не больше READ_LIMIT последних байт"""
+        try:
+            with open(self.path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < self._offset:
+                    # Файл обрезан или заменен
+                    self._offset, self._partial, self._skip_line = 0, b'', False
+                if size - self._offset > self.READ_LIMIT:
+                    # После всплеска вывода в буфер попадут только последние строки
+                    self._offset, self._partial, self._skip_line = size - self.READ_LIMIT, b'', True
+                f.seek(self._offset)
+                while self._offset < size:
+                    data = f.read(min(self.READ_CHUNK, size - self._offset))
+                    if not data:
+                        break
+                    self._offset += len(data)
+                    self._add(data)
+        except OSError:
+            return
+
+    def _add(self, data):
+        if self._skip_line:
+            _, newline, data = data.partition(b'\n')
+            if not newline:
+                return
+            self._skip_line = False
+        *lines, self._partial = (self._partial + data).split(b'\n')
+        if len(self._partial) > self.READ_CHUNK:
+            # Слишком длинная строка без перевода строки выводится частями
+            lines.append(self._partial)
+            self._partial = b''
+        for raw in lines:
+            self.lines.append(raw.decode('utf-8', errors='replace').rstrip('\r'))
+
+    def _rotate_if_needed(self):
+        """Копирование в <бот>.log.1 (со сдвигом старых копий) и обрезка, если файл больше BOT_LOG_MAX_BYTES"""
+        if Config.BOT_LOG_MAX_BYTES <= 0 or self._offset < Config.BOT_LOG_MAX_BYTES:
+            return
+        try:
+            for i in range(Config.BOT_LOG_BACKUP_COUNT - 1, 0, -1):
+                if os.path.exists(f'{self.path}.{i}'):
+                    os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+            if Config.BOT_LOG_BACKUP_COUNT > 0:
+                shutil.copyfile(self.path, f'{self.path}.1')
+            os.truncate(self.path, 0)
+        except OSError as e:
+            logger.error(f"Error rotating output log of bot {self.name}: {e}")
+            return
+        self._offset, self._partial, self._skip_line = 0, b'', False
+
+
+class ManagedBot:
+    """Процесс бота под управлением супервизора"""
+
+    def __init__(self, name, process, popen=None):
+        self.name = name
+        self.process = process
+        self.popen = popen
+        self.pid = process.pid
+        self.create_time = process.create_time()
+        self.started_at = time.monotonic()
+        self.exit_code = None
+        self.stopping = False
+        self.exited = threading.Event()
+        self.probe_failures = 0      # неудачные пробы здоровья подряд
+        self.probe_detail = None     # результат последней пробы
+        self.probe_checked_at = None
+        try:
+            # Первый вызов cpu_percent только запоминает точку отсчета
+            process.cpu_percent(None)
+        except psutil.Error:
+            pass
+
+    def wait(self):
+        """Блокирующее ожидание завершения процесса. Возвращает код выхода (None для чужого процесса)"""
+        if self.popen is not None:
+            return self.popen.wait()
+
+        pidfd = self._open_pidfd()
+        if pidfd is None:
+            # Без pidfd (не Linux или старое ядро) psutil опрашивает чужой процесс с паузами
+            return self.process.wait()
+        try:
+            # PID мог достаться другому процессу до открытия pidfd: psutil сверяет время создания
+            if self.process.is_running():
+                # pidfd становится читаемым при завершении процесса, ожидание без опроса
+                select.select([pidfd], [], [])
+        finally:
+            os.close(pidfd)
+        return None
+
+    def _open_pidfd(self):
+        """Дескриптор процесса (Linux 5.3+) или None, если он недоступен"""
+        if not hasattr(os, 'pidfd_open'):
+            return None
+        try:
+            return os.pidfd_open(self.pid)
+        except OSError:
+            # Процесс уже завершился (его ожидание через psutil вернется сразу) или pidfd не поддерживается
+            return None
+
+    def sample(self):
+        """Замер CPU, памяти, потоков и дескрипторов процесса"""
+        process = self.process
+        with process.oneshot():
+            fds = process.num_handles() if psutil.WINDOWS else process.num_fds()
+            return ResourceSample(
+                time.time(),
+                process.cpu_percent(None),
+                process.memory_info().rss,
+                process.num_threads(),
+                fds
+            )
+
+    @property
+    def unhealthy(self):
+        """Процесс жив, но не проходит пробы здоровья"""
+        return self.probe_failures >= Config.HEALTH_PROBE_FAILURES
+
+    def is_running(self):
+        """Проверка процесса через дескриптор, без обхода таблицы процессов"""
+        if self.popen is not None:
+            return self.popen.poll() is None
+        try:
+            # psutil сверяет время создания, поэтому переиспользованный PID не считается живым
+            return self.process.is_running() and self.process.status() != psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            return False
+
+
+class RestartState:
+    """Состояние автоматических перезапусков бота"""
+
+    def __init__(self):
+        self.attempts = 0          # подряд идущие перезапуски (определяют задержку)
+        self.history = deque()     # время перезапусков в окне BOT_RESTART_WINDOW
+        self.crash_loop = False
+        self.timer = None          # ожидающий перезапуск
+
+
+class BotSupervisor:
+    """Запуск, остановка и статус ботов по сохраненным дескрипторам процессов"""
+
+    def __init__(self, database):
+        self.database = database
+        self._bots = {}  # имя бота -> ManagedBot
+        self._restarts = {}  # имя бота -> RestartState
+        self._metrics = {}  # имя бота -> deque последних ResourceSample
+        self._pending_metrics = defaultdict(list)  # замеры, еще не сохраненные в bot_metrics
+        self._outputs = {}  # имя бота -> BotOutput (сохраняется между перезапусками)
+        self._starting = set()  # боты, процесс которых сейчас создается
+        self._lock = threading.RLock()
+        self._adopted = False
+
+    def adopt_running(self):
+        """Поиск процессов ботов после перезапуска менеджера.
+
+        Сначала проверяется сохраненный в bots PID вместе со временем создания
+        процесса; обход таблицы процессов выполняется только для ботов,
+        у которых сохраненный PID не подошел.
+        """
+        with self._lock:
+            if self._adopted:
+                return
+            self._adopted = True
+
+            snapshot = None
+            for bot in self.database.get_all_bots():
+                name = bot['name']
+                if name in self._bots:
+                    continue
+
+                process = self._find_saved_process(bot)
+                if process is None and bot.get('state'):
+                    try:
+                        # Один обход таблицы процессов на все такие боты
+                        snapshot = snapshot or ProcessSnapshot()
+                        pids = snapshot.pids(bot['exe_path'])
+                        process = psutil.Process(pids[0]) if pids else None
+                    except psutil.Error:
+                        process = None
+
+                managed = None
+                if process is not None:
+                    try:
+                        managed = ManagedBot(name, process)
+                    except psutil.Error:
+                        pass
+
+                if managed is not None:
+                    self._bots[name] = managed
+                    self.database.update_bot_process(name, managed.pid, managed.create_time)
+                    self._watch(managed)
+                    # Бот продолжает писать в свой файл вывода, чтение возобновляется
+                    self._output(name)
+                    logger.info(f"Supervisor adopted bot {name} (pid {managed.pid})")
+                elif bot.get('state') or bot.get('pid'):
+                    self.database.update_bot_process(name, None)
+
+    @staticmethod
+    def _find_saved_process(bot):
+        """Процесс по сохраненным PID и времени создания"""
+        if not bot.get('pid'):
+            return None
+        try:
+            process = psutil.Process(bot['pid'])
+            if abs(process.create_time() - (bot.get('pid_create_time') or 0)) < 0.01:
+                return process
+        except psutil.Error:
+            pass
+        return None
+
+    def _get_running(self, name):
+        """Запущенный бот или None"""
+        self.adopt_running()
+        managed = self._bots.get(name)
+        if managed and managed.is_running():
+            return managed
+        return None
+
+    def status(self, bot):
+        """Статус бота: running, unhealthy, restarting, stopped или not_found.
+
+        Завершение процессов отслеживает _wait_for_exit, поэтому статус -
+        это просто наличие бота среди управляемых и результат проб здоровья.
+        """
+        self.adopt_running()
+        return self._status(bot)
+
+    def statuses(self, bots):
+        """Статусы списка ботов: {имя: статус} (поиск ботов и блокировка - один раз на весь список)"""
+        self.adopt_running()
+        with self._lock:
+            return {bot.get('name'): self._status(bot) for bot in bots}
+
+    def _status(self, bot):
+        if not bot or not bot.get('exe_path'):
+            return "not_found"
+        managed = self._bots.get(bot['name'])
+        if managed:
+            return "unhealthy" if managed.unhealthy else "running"
+        state = self._restarts.get(bot['name'])
+        return "restarting" if state and state.timer else "stopped"
+
+    def is_crash_looping(self, bot_name):
+        """Автоперезапуск бота остановлен из-за слишком частых падений"""
+        state = self._restarts.get(bot_name)
+        return bool(state and state.crash_loop)
+
+    def health(self, bot_name):
+        """Результат последней пробы запущенного бота или None"""
+        managed = self._bots.get(bot_name)
+        if managed is None or managed.probe_checked_at is None:
+            return None
+        return {
+            'failures': managed.probe_failures,
+            'detail': managed.probe_detail,
+            'checked_at': managed.probe_checked_at,
+        }
+
+    def check_health(self):
+        """Параллельный запуск проб здоровья запущенных ботов. Возвращает число проверенных"""
+        bots = {bot['name']: bot for bot in self.database.get_all_bots() if bot.get('probe_type')}
+        now = time.monotonic()
+        with self._lock:
+            # Сразу после запуска бот может еще не отвечать
+            targets = [
+                managed for name, managed in self._bots.items()
+                if name in bots and now - managed.started_at >= Config.HEALTH_PROBE_START_GRACE
+            ]
+        if not targets:
+            return 0
+
+        def probe(managed):
+            bot = bots[managed.name]
+            return run_probe(bot['probe_type'], bot['probe_target'])
+
+        with ThreadPoolExecutor(max_workers=Config.HEALTH_PROBE_WORKERS, thread_name_prefix="bot-probe") as pool:
+            for managed, (healthy, detail) in zip(targets, pool.map(probe, targets)):
+                self._record_health(managed, healthy, detail, bots[managed.name])
+        return len(targets)
+
+    def _record_health(self, managed, healthy, detail, bot):
+        """Учет результата пробы; зависший бот с политикой перезапуска завершается принудительно"""
+        managed.probe_checked_at = time.time()
+        managed.probe_detail = detail
+        if healthy:
+            if managed.unhealthy:
+                logger.info(f"Bot {managed.name} is healthy again: {detail}")
+            managed.probe_failures = 0
+            return
+
+        managed.probe_failures += 1
+        if managed.probe_failures != Config.HEALTH_PROBE_FAILURES:
+            return
+
+        logger.warning(f"Bot {managed.name} is unhealthy after {managed.probe_failures} failed probes: {detail}")
+        if bot.get('restart_policy') in ('on-failure', 'always') and not managed.stopping:
+            # Завершение обработает _wait_for_exit и перезапустит бота по его политике
+            logger.warning(f"Killing unhealthy bot {managed.name} (pid {managed.pid}) for restart")
+            try:
+                managed.process.kill()
+            except psutil.Error:
+                pass
+
+    def sample_resources(self):
+        """Замер ресурсов всех запущенных ботов. Возвращает число замеров"""
+        with self._lock:
+            running = list(self._bots.values())
+
+        count = 0
+        for managed in running:
+            try:
+                sample = managed.sample()
+            except psutil.Error:
+                continue
+            with self._lock:
+                if managed.name not in self._metrics:
+                    self._metrics[managed.name] = deque(maxlen=Config.METRICS_BUFFER_SIZE)
+                self._metrics[managed.name].append(sample)
+                self._pending_metrics[managed.name].append(sample)
+            count += 1
+        return count
+
+    def flush_metrics(self):
+        """Сохранение накопленных замеров в базу: одна усредненная строка на бота"""
+        with self._lock:
+            pending, self._pending_metrics = self._pending_metrics, defaultdict(list)
+
+        rows = []
+        for name, samples in pending.items():
+            row = summarize_samples(samples)
+            row.update(bot_name=name, ts=int(samples[-1].ts))
+            rows.append(row)
+
+        if rows:
+            self.database.save_bot_metrics(rows)
+        return len(rows)
+
+    def latest_sample(self, bot_name):
+        """Последний замер запущенного бота или None"""
+        buffer = self._metrics.get(bot_name)
+        if buffer and bot_name in self._bots:
+            return buffer[-1]
+        return None
+
+    def latest_samples(self):
+        """Последние замеры всех запущенных ботов: {имя: ResourceSample}"""
+        with self._lock:
+            return {name: self._metrics[name][-1] for name in self._bots if self._metrics.get(name)}
+
+    def resource_summary(self, bot_name):
+        """Среднее и максимум по замерам бота в памяти или None"""
+        with self._lock:
+            samples = list(self._metrics.get(bot_name) or ())
+        if not samples:
+            return None
+        summary = summarize_samples(samples)
+        summary['since'] = samples[0].ts
+        return summary
+
+    def start(self, bot_name, automatic=False):
+        """Запуск бота. Возвращает (успех, сообщение)"""
+        bot = self.database.get_bot(bot_name)
+        if not bot or not bot.get('exe_path'):
+            return False, "❌ Бот не найден"
+
+        with self._lock:
+            if not automatic:
+                # Ручной запуск сбрасывает задержку и признак цикла падений
+                self._reset_restarts(bot_name)
+
+            if self._get_running(bot_name):
+                return False, "❌ Бот уже запущен"
+            if bot_name in self._starting:
+                return False, "❌ Бот уже запускается"
+            self._starting.add(bot_name)
+
+        # Процесс создается без блокировки, чтобы боты могли запускаться параллельно.
+        # Вывод идет прямо в файл: каналы к менеджеру оборвались бы при его перезапуске
+        popen = None
+        try:
+            with self._output(bot_name).open_for_child() as log:
+                popen = subprocess.Popen([bot['exe_path']], stdout=log, stderr=subprocess.STDOUT)
+            managed = ManagedBot(bot_name, psutil.Process(popen.pid), popen)
+        except Exception as e:
+            if popen is not None:
+                # Процесс создан, но не взят под наблюдение: он не должен остаться без присмотра
+                self._discard_process(bot_name, popen)
+            with self._lock:
+                self._starting.discard(bot_name)
+            return False, f"❌ Ошибка запуска: {e}"
+
+        with self._lock:
+            self._starting.discard(bot_name)
+            self._bots[bot_name] = managed
+            self.database.update_bot_process(bot_name, managed.pid, managed.create_time)
+            self._watch(managed)
+            logger.info(f"Supervisor started bot {bot_name} (pid {managed.pid})")
+            return True, "✅ Бот запущен"
+
+    @staticmethod
+    def _discard_process(bot_name, popen):
+        """Принудительное завершение и ожидание процесса, который не удалось взять под наблюдение"""
+        try:
+            popen.kill()
+        except OSError:
+            pass
+        try:
+            popen.wait(timeout=Config.BOT_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logger.error(f"Bot {bot_name} (pid {popen.pid}) did not exit after kill")
+
+    def start_many(self, bot_names, on_done=None):
+        """Параллельный запуск ботов. Возвращает {имя: (успех, сообщение)}.
+
+        on_done(имя) вызывается по окончании запуска каждого бота.
+        """
+        if not bot_names:
+            return {}
+        self.adopt_running()
+
+        def start(bot_name):
+            result = self.start(bot_name)
+            if on_done is not None:
+                on_done(bot_name)
+            return result
+
+        with ThreadPoolExecutor(max_workers=Config.BOT_BULK_WORKERS, thread_name_prefix="bot-start") as pool:
+            return dict(zip(bot_names, pool.map(start, bot_names)))
+
+    def stop_many(self, bot_names, timeout=None, on_done=None):
+        """Остановка ботов: SIGTERM всем сразу, ожидание до timeout секунд, затем kill.
+
+        Возвращает {имя: (успех, сообщение)}. on_done(имя) вызывается, когда бот
+        завершился или его остановка закончилась ошибкой.
+        """
+        timeout = Config.BOT_STOP_TIMEOUT if timeout is None else timeout
+        results = {}
+        stopping = []
+
+        with self._lock:
+            for bot_name in bot_names:
+                restart_pending = self._reset_restarts(bot_name)
+                managed = self._get_running(bot_name)
+                if not managed:
+                    results[bot_name] = (True, "✅ Автоматический перезапуск отменен") if restart_pending \
+                        else (False, "❌ Бот не был запущен")
+                    continue
+
+                managed.stopping = True
+                try:
+                    managed.process.terminate()
+                except psutil.NoSuchProcess:
+                    pass
+                except Exception as e:
+                    results[bot_name] = (False, f"❌ Ошибка остановки: {e}")
+                    continue
+                stopping.append(managed)
+
+        if on_done is not None:
+            for bot_name in results:
+                on_done(bot_name)
+
+        # Завершение фиксируют потоки _wait_for_exit, поэтому процессы здесь не ожидаются повторно
+        killed = self._wait_exited(stopping, timeout, on_done)
+        for managed in killed:
+            try:
+                managed.process.kill()
+            except psutil.NoSuchProcess:
+                pass
+        stuck = self._wait_exited(killed, timeout, on_done)
+        if on_done is not None:
+            # Остановка зависших ботов тоже закончена, хоть и неудачно
+            for managed in stuck:
+                on_done(managed.name)
+
+        with self._lock:
+            for managed in stopping:
+                if managed in stuck:
+                    # Процесс не завершился даже после kill: он остается под наблюдением
+                    results[managed.name] = (False, "❌ Бот не завершился после принудительной остановки")
+                    logger.error(f"Bot {managed.name} (pid {managed.pid}) did not exit after kill")
+                    continue
+
+                if self._bots.get(managed.name) is managed:
+                    del self._bots[managed.name]
+                self.database.update_bot_process(managed.name, None)
+                if managed in killed:
+                    results[managed.name] = (True, "⚠️ Бот остановлен принудительно")
+                    logger.warning(f"Supervisor killed bot {managed.name} (pid {managed.pid}) after {timeout}s")
+                else:
+                    results[managed.name] = (True, "✅ Бот остановлен")
+                    logger.info(f"Supervisor stopped bot {managed.name} (pid {managed.pid})")
+        return {bot_name: results[bot_name] for bot_name in bot_names}
+
+    @staticmethod
+    def _wait_exited(bots, timeout, on_exit=None):
+        """Ожидание завершения процессов с общим сроком. Возвращает еще работающие"""
+        deadline = time.monotonic() + timeout
+        for managed in bots:
+            if managed.exited.wait(max(0, deadline - time.monotonic())) and on_exit is not None:
+                on_exit(managed.name)
+        return [managed for managed in bots if not managed.exited.is_set()]
+
+    def stop(self, bot_name, timeout=None):
+        """Остановка бота с ожиданием завершения (блокирует до timeout секунд). Возвращает (успех, сообщение)"""
+        if not self.database.get_bot(bot_name):
+            return False, "❌ Бот не найден"
+        return self.stop_many([bot_name], timeout)[bot_name]
+
+    def _output(self, bot_name):
+        """BotOutput бота (создается при первом обращении)"""
+        with self._lock:
+            output = self._outputs.get(bot_name)
+            if output is None:
+                output = self._outputs[bot_name] = BotOutput(bot_name)
+            return output
+
+    def poll_outputs(self):
+        """Чтение файлов вывода ботов в буферы и их ротация (выполняет BotOutputFollower)"""
+        with self._lock:
+            outputs = list(self._outputs.values())
+        for output in outputs:
+            output.poll()
+
+    def output_tail(self, bot_name, count):
+        """Последние строки вывода бота из буфера (пустой список, если файла вывода нет)"""
+        return self._output(bot_name).tail(count)
+
+    def _watch(self, managed):
+        """Запуск потока, ожидающего завершения процесса бота"""
+        thread = threading.Thread(
+            target=self._wait_for_exit,
+            args=(managed,),
+            name=f"bot-exit-{managed.name}",
+            daemon=True
+        )
+        thread.start()
+
+    def _wait_for_exit(self, managed):
+        """Ожидание завершения процесса (см. ManagedBot.wait) и запись результата"""
+        try:
+            exit_code = managed.wait()
+        except psutil.Error:
+            exit_code = None
+        except Exception as e:
+            logger.error(f"Error waiting for bot {managed.name}: {e}")
+            managed.exited.set()
+            return
+        self._on_exit(managed, exit_code)
+
+    def _on_exit(self, managed, exit_code):
+        """Обработка завершения процесса бота"""
+        managed.exit_code = exit_code
+        with self._lock:
+            if self._bots.get(managed.name) is managed:
+                del self._bots[managed.name]
+
+        self.database.record_bot_exit(managed.name, managed.pid, exit_code, int(time.time()))
+        if exit_code:
+            logger.warning(f"Bot {managed.name} (pid {managed.pid}) exited with code {exit_code}")
+        else:
+            logger.info(f"Bot {managed.name} (pid {managed.pid}) exited with code {exit_code}")
+        managed.exited.set()
+
+        if not managed.stopping:
+            self._schedule_restart(managed.name, exit_code, time.monotonic() - managed.started_at)
+
+    def _reset_restarts(self, bot_name):
+        """Сброс состояния перезапусков. Возвращает True, если был отменен ожидающий перезапуск"""
+        with self._lock:
+            state = self._restarts.pop(bot_name, None)
+        if state and state.timer:
+            state.timer.cancel()
+            return True
+        return False
+
+    def _schedule_restart(self, bot_name, exit_code, uptime):
+        """Планирование перезапуска по политике бота с экспоненциальной задержкой.
+
+        Код выхода None (процесс не был дочерним) считается падением.
+        """
+        bot = self.database.get_bot(bot_name)
+        policy = bot.get('restart_policy') if bot else None
+        if policy not in ('on-failure', 'always') or (policy == 'on-failure' and exit_code == 0):
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            state = self._restarts.setdefault(bot_name, RestartState())
+            if uptime >= Config.BOT_RESTART_STABLE_TIME:
+                state.attempts = 0
+            while state.history and now - state.history[0] > Config.BOT_RESTART_WINDOW:
+                state.history.popleft()
+
+            if len(state.history) >= Config.BOT_RESTART_MAX:
+                state.crash_loop = True
+                logger.error(
+                    f"Bot {bot_name} is crash looping ({len(state.history)} restarts in "
+                    f"{Config.BOT_RESTART_WINDOW}s), automatic restarts disabled until a manual start"
+                )
+                return
+
+            delay = min(Config.BOT_RESTART_BACKOFF_BASE * 2 ** state.attempts, Config.BOT_RESTART_BACKOFF_MAX)
+            state.attempts += 1
+            state.history.append(now)
+            state.timer = threading.Timer(delay, self._restart, args=(bot_name,))
+            state.timer.daemon = True
+            state.timer.start()
+
+        logger.warning(f"Bot {bot_name} will be restarted in {delay:.1f}s (policy {policy}, attempt {state.attempts})")
+
+    def _restart(self, bot_name):
+        """Автоматический перезапуск бота (выполняется в потоке таймера)"""
+        with self._lock:
+            state = self._restarts.get(bot_name)
+            # Перезапуск мог быть отменен остановкой или ручным запуском
+            if state is None or state.timer is not threading.current_thread():
+                return
+            state.timer = None
+
+        success, message = self.start(bot_name, automatic=True)
+        if success:
+            logger.info(f"Bot {bot_name} restarted automatically")
+        elif bot_name not in self._bots and bot_name not in self._starting:
+            logger.warning(f"Automatic restart of bot {bot_name} failed: {message}")
+            self._schedule_restart(bot_name, None, 0)
+
+
+# Глобальный супервизор ботов
+bot_supervisor = BotSupervisor(db_instance)
@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# config создает каталоги и лог при импорте, поэтому они переносятся во временный каталог заранее
+_TEST_ROOT = tempfile.mkdtemp(prefix='brb-tests-')
+for _name in ('DATA_DIR', 'LOGS_DIR', 'BOTS_DIR'):
+    os.environ[_name] = os.path.join(_TEST_ROOT, _name.lower())
+os.environ['DB_AUTO_MIGRATE'] = 'true'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from database import Database  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Отдельная база с примененными миграциями для каждого теста"""
+    monkeypatch.setattr(Config, 'DB_FILE', str(tmp_path / 'test.db'))
+    db = Database()
+    yield db
+    db.close()
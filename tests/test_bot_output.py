@@ -0,0 +1,76 @@
+import pytest
+from config import Config
+from supervisor import BotOutput, BotSupervisor
+
+
+@pytest.fixture
+def logs_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'LOGS_DIR', str(tmp_path))
+    return tmp_path
+
+
+def write(path, data):
+    with open(path, 'ab') as f:
+        f.write(data)
+
+
+def test_existing_file_is_loaded_and_new_lines_are_followed(logs_dir):
+    write(logs_dir / 'bot.log', b'one\ntwo\n')
+    output = BotOutput('bot')
+    assert output.tail(10) == ['one', 'two']
+
+    write(logs_dir / 'bot.log', b'three\r\nfour')
+    output.poll()
+    assert output.tail(10) == ['one', 'two', 'three']
+
+    write(logs_dir / 'bot.log', b'\n')
+    output.poll()
+    assert output.tail(2) == ['three', 'four']
+
+
+def test_burst_is_read_in_bounded_chunks(logs_dir, monkeypatch):
+    monkeypatch.setattr(Config, 'BOT_LOG_BUFFER_LINES', 5)
+    monkeypatch.setattr(Config, 'BOT_LOG_MAX_BYTES', 0)
+    output = BotOutput('bot')
+    reads = []
+
+    class CountingBotOutput(BotOutput):
+        def _add(self, data):
+            reads.append(len(data))
+            super()._add(data)
+
+    output.__class__ = CountingBotOutput
+    write(logs_dir / 'bot.log', b''.join(b'line %07d\n' % i for i in range(200000)))
+
+    output.poll()
+
+    assert sum(reads) <= BotOutput.READ_LIMIT
+    assert max(reads) <= BotOutput.READ_CHUNK
+    assert output.tail(10) == ['line %07d' % i for i in range(199995, 200000)]
+
+
+def test_tail_is_served_from_the_buffer(logs_dir):
+    supervisor = BotSupervisor(database=None)
+    write(logs_dir / 'bot.log', b'one\n')
+    assert supervisor.output_tail('bot', 10) == ['one']
+
+    write(logs_dir / 'bot.log', b'two\n')
+    assert supervisor.output_tail('bot', 10) == ['one']
+
+    supervisor.poll_outputs()
+    assert supervisor.output_tail('bot', 10) == ['one', 'two']
+
+
+def test_file_is_rotated_by_copy_and_truncate(logs_dir, monkeypatch):
+    monkeypatch.setattr(Config, 'BOT_LOG_MAX_BYTES', 10)
+    monkeypatch.setattr(Config, 'BOT_LOG_BACKUP_COUNT', 2)
+    output = BotOutput('bot')
+
+    write(logs_dir / 'bot.log', b'0123456789\n')
+    output.poll()
+    write(logs_dir / 'bot.log', b'after\n')
+    output.poll()
+
+    assert (logs_dir / 'bot.log.1').read_bytes() == b'0123456789\n'
+    assert (logs_dir / 'bot.log').read_bytes() == b'after\n'
+    assert output.tail(10) == ['0123456789', 'after']
@@ -0,0 +1,131 @@
+import threading
+import time
+from broadcast import BroadcastEngine
+from config import Config
+
+
+def add_users(database, count):
+    for i in range(count):
+        database.add_user(1000 + i, f'user{i:02}', 'User')
+
+
+def wait_finished(database, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = database.get_broadcast_job(job_id)
+        if job['status'] != 'sending':
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"broadcast #{job_id} did not finish")
+
+
+class Recorder:
+    """Функция отправки, запоминающая получателей"""
+
+    def __init__(self):
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def __call__(self, chat_id, text):
+        with self.lock:
+            self.sent.append(chat_id)
+        return True
+
+
+def test_submit_delivers_to_everyone_except_banned(database):
+    add_users(database, 5)
+    database.ban_user('user00', 'admin')
+    send = Recorder()
+    engine = BroadcastEngine(database, send, 0, 2)
+    done = threading.Event()
+
+    job = engine.submit('hello', 'admin', on_done=lambda job: done.set())
+
+    assert done.wait(10)
+    assert job.total == 4
+    assert sorted(send.sent) == [1001, 1002, 1003, 1004]
+    assert wait_finished(database, job.id)['deliveries'] == {'sent': 4}
+    assert engine.get_job(job.id) is None
+
+
+def test_resume_skips_interrupted_and_sends_the_rest_once(database):
+    add_users(database, 10)
+    job_id, total = database.create_broadcast_job('hello', 'admin')
+    assert total == 10
+
+    # Процесс упал посреди пачки: двое доставлены, трое в sending без результата
+    claimed = database.claim_broadcast_batch(job_id, 5)
+    database.record_broadcast_results(job_id, [(row['username'], 'sent') for row in claimed[:2]])
+
+    send = Recorder()
+    engine = BroadcastEngine(database, send, 0, 4)
+    assert engine.resume() == 1
+
+    job = wait_finished(database, job_id)
+    assert job['status'] == 'done'
+    assert job['deliveries'] == {'sent': 7, 'unknown': 3}
+    claimed_ids = {row['user_id'] for row in claimed}
+    assert sorted(send.sent) == sorted({1000 + i for i in range(10)} - claimed_ids)
+    assert engine._jobs == {}
+
+    # Завершенная рассылка повторно не возобновляется
+    assert engine.resume() == 0
+
+
+def test_claim_errors_are_retried(database):
+    add_users(database, 3)
+
+    class FlakyDatabase:
+        """Первые две выборки получателей завершаются ошибкой базы"""
+
+        def __init__(self, database):
+            self.database = database
+            self.failures = 2
+
+        def claim_broadcast_batch(self, job_id, size):
+            if self.failures:
+                self.failures -= 1
+                return None
+            return self.database.claim_broadcast_batch(job_id, size)
+
+        def __getattr__(self, name):
+            return getattr(self.database, name)
+
+    send = Recorder()
+    engine = BroadcastEngine(FlakyDatabase(database), send, 0, 2)
+    engine.MIN_RETRY_DELAY = 0.01
+    done = threading.Event()
+
+    job = engine.submit('hello', 'admin', on_done=lambda job: done.set())
+
+    assert done.wait(10)
+    assert job.status == 'done'
+    assert sorted(send.sent) == [1000, 1001, 1002]
+    assert engine._jobs == {}
+
+
+def test_job_cancelled_in_database_stops_sending(database, monkeypatch):
+    monkeypatch.setattr(Config, 'BROADCAST_BATCH_SIZE', 2)
+    add_users(database, 20)
+    first_batch = threading.Event()
+    release = threading.Event()
+
+    def send(chat_id, text):
+        first_batch.set()
+        release.wait(5)
+        return True
+
+    engine = BroadcastEngine(database, send, 0, 1)
+    done = threading.Event()
+    job = engine.submit('hello', 'admin', on_done=lambda job: done.set())
+    assert first_batch.wait(5)
+
+    # Отмена из другого процесса: в памяти этого движка рассылка не отмечена
+    assert BroadcastEngine(database, send, 0, 1).cancel(job.id)
+    release.set()
+
+    assert done.wait(10)
+    assert job.status == 'cancelled'
+    row = database.get_broadcast_job(job.id)
+    assert row['status'] == 'cancelled'
+    assert row['deliveries'].get('pending', 0) >= 16
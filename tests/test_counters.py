@@ -0,0 +1,61 @@
+def assert_counters_match(database):
+    stats = database.get_stats()
+    assert stats == database.compute_stats()
+    return stats
+
+
+def test_triggers_track_users_bans_and_roles(database):
+    for i in range(3):
+        database.add_user(100 + i, f'user{i}', 'User')
+    database.ban_user('user0', 'admin')
+    database.add_operator('user1')
+    database.add_global_admin('user2')
+
+    stats = assert_counters_match(database)
+    assert stats['total_users'] == 3
+    assert stats['banned_users'] == 1
+    assert stats['operators'] == 1
+    assert stats['global_admins'] == 1
+
+    database.unban_user('user0')
+    assert assert_counters_match(database)['banned_users'] == 0
+
+
+def test_local_admin_is_counted_once_for_several_bots(database):
+    database.add_user(100, 'ladmin', 'User')
+    database.add_bot('a', '/bin/a', 'a_bot')
+    database.add_bot('b', '/bin/b', 'b_bot')
+
+    database.add_ladmin_to_bot('ladmin', 'a')
+    database.add_ladmin_to_bot('ladmin', 'b')
+    assert assert_counters_match(database)['local_admins'] == 1
+
+    database.remove_ladmin_from_bot('ladmin', 'a')
+    assert assert_counters_match(database)['local_admins'] == 1
+    database.remove_ladmin_from_bot('ladmin', 'b')
+    assert assert_counters_match(database)['local_admins'] == 0
+
+
+def test_triggers_track_bots_and_running_state(database):
+    database.add_bot('a', '/bin/a', 'a_bot')
+    database.add_bot('b', '/bin/b', 'b_bot')
+    database.update_bot_state('a', True)
+
+    stats = assert_counters_match(database)
+    assert (stats['total_bots'], stats['running_bots']) == (2, 1)
+
+    database.remove_bot('a')
+    stats = assert_counters_match(database)
+    assert (stats['total_bots'], stats['running_bots']) == (1, 0)
+
+
+def test_reconcile_fixes_drift(database):
+    database.add_user(100, 'user0', 'User')
+    assert database.reconcile_counters() == {}
+
+    conn = database.get_connection()
+    conn.execute("UPDATE counters SET value = 42 WHERE name = 'total_users'")
+    conn.commit()
+
+    assert database.reconcile_counters() == {'total_users': (42, 1)}
+    assert database.get_stats()['total_users'] == 1
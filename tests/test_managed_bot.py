@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import psutil
+import pytest
+from supervisor import ManagedBot
+
+
+def spawn(seconds):
+    return subprocess.Popen([sys.executable, '-c', f'import time; time.sleep({seconds})'])
+
+
+def test_child_exit_code_is_returned():
+    popen = subprocess.Popen([sys.executable, '-c', 'raise SystemExit(3)'])
+    managed = ManagedBot('bot', psutil.Process(popen.pid), popen)
+
+    assert managed.wait() == 3
+
+
+def test_adopted_process_is_waited_for():
+    popen = spawn(0.3)
+    managed = ManagedBot('bot', psutil.Process(popen.pid))
+    started = time.monotonic()
+
+    assert managed.wait() is None
+    assert time.monotonic() - started >= 0.2
+    popen.wait()
+
+
+@pytest.mark.skipif(not hasattr(os, 'pidfd_open'), reason="pidfd is Linux-only")
+def test_adopted_process_wait_blocks_on_pidfd(monkeypatch):
+    popen = spawn(0.3)
+    managed = ManagedBot('bot', psutil.Process(popen.pid))
+    # Ожидание через pidfd не должно опрашивать процесс через psutil
+    monkeypatch.setattr(managed.process, 'wait', lambda *args: pytest.fail("psutil polling used"))
+    done = threading.Event()
+
+    threading.Thread(target=lambda: (managed.wait(), done.set()), daemon=True).start()
+
+    assert not done.wait(0.1)
+    assert done.wait(5)
+    popen.wait()
@@ -0,0 +1,115 @@
+import sqlite3
+import pytest
+from database import MIGRATIONS, Migration, SchemaMigrator
+
+
+def make_migrations():
+    return [
+        Migration(1, "table", ['CREATE TABLE t (id INTEGER PRIMARY KEY)']),
+        Migration(2, "column", ['ALTER TABLE t ADD COLUMN name TEXT']),
+    ]
+
+
+def columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def test_run_applies_pending_in_order():
+    conn = sqlite3.connect(':memory:')
+    migrator = SchemaMigrator(conn, list(reversed(make_migrations())))
+
+    report = migrator.run()
+
+    assert [(entry['version'], entry['status']) for entry in report] == [(1, 'applied'), (2, 'applied')]
+    assert migrator.current_version() == 2
+    assert columns(conn, 't') == ['id', 'name']
+    assert migrator.pending() == []
+    assert migrator.run() == []
+
+
+def test_run_only_applies_newer_versions():
+    conn = sqlite3.connect(':memory:')
+    SchemaMigrator(conn, make_migrations()[:1]).run()
+
+    report = SchemaMigrator(conn, make_migrations()).run()
+
+    assert [entry['version'] for entry in report] == [2]
+
+
+def test_dry_run_rolls_back():
+    conn = sqlite3.connect(':memory:')
+    migrator = SchemaMigrator(conn, make_migrations())
+
+    report = migrator.run(dry_run=True)
+
+    assert [entry['status'] for entry in report] == ['ok (dry-run)', 'ok (dry-run)']
+    assert migrator.current_version() == 0
+    assert columns(conn, 't') == []
+
+
+def test_failed_migration_stops_and_keeps_previous_version():
+    conn = sqlite3.connect(':memory:')
+    migrations = make_migrations()
+    migrations[1] = Migration(2, "broken", ['ALTER TABLE missing ADD COLUMN name TEXT'])
+    migrations.append(Migration(3, "never runs", ['CREATE TABLE other (id INTEGER)']))
+    migrator = SchemaMigrator(conn, migrations)
+
+    report = migrator.run()
+
+    assert report[0]['status'] == 'applied'
+    assert report[1]['status'].startswith('failed')
+    assert len(report) == 2
+    assert migrator.current_version() == 1
+    assert columns(conn, 'other') == []
+
+
+def test_func_migration_receives_connection():
+    conn = sqlite3.connect(':memory:')
+    migrations = make_migrations() + [
+        Migration(3, "data", func=lambda c: c.execute("INSERT INTO t (name) VALUES ('x')")),
+    ]
+
+    SchemaMigrator(conn, migrations).run()
+
+    assert conn.execute('SELECT name FROM t').fetchall() == [('x',)]
+
+
+def test_duplicate_versions_are_rejected():
+    with pytest.raises(ValueError):
+        SchemaMigrator(sqlite3.connect(':memory:'), make_migrations() + [Migration(2, "dup", [])])
+
+
+def test_new_database_is_at_latest_version(database):
+    current_version, latest_version = database.get_schema_version()
+
+    assert current_version == latest_version == max(m.version for m in MIGRATIONS)
+    assert database.schema_ready.is_set()
+
+
+def test_foreign_keys_cascade_on_bot_removal(database):
+    database.add_user(100, 'ladmin', 'User')
+    database.add_bot('a', '/bin/a', 'a_bot')
+    database.add_ladmin_to_bot('ladmin', 'a')
+
+    database.remove_bot('a')
+
+    assert database.get_bot_ladmins('a') == []
+    assert database.get_stats()['local_admins'] == 0
+    assert database.get_stats() == database.compute_stats()
+
+
+def test_orphaned_local_admins_are_removed_by_migration():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript('''
+        CREATE TABLE bots (name TEXT PRIMARY KEY);
+        CREATE TABLE bot_ladmins (bot_name TEXT, username TEXT);
+        CREATE TABLE broadcast_jobs (id INTEGER PRIMARY KEY);
+        CREATE TABLE broadcast_deliveries (job_id INTEGER, username TEXT);
+        INSERT INTO bots VALUES ('kept');
+        INSERT INTO bot_ladmins VALUES ('kept', 'a'), ('removed', 'b');
+        PRAGMA user_version = 10;
+    ''')
+
+    SchemaMigrator(conn, [m for m in MIGRATIONS if m.version == 11]).run()
+
+    assert conn.execute('SELECT bot_name FROM bot_ladmins').fetchall() == [('kept',)]
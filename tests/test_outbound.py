@@ -0,0 +1,210 @@
+import threading
+import time
+import pytest
+from telebot.apihelper import ApiTelegramException
+from config import Config
+from outbound import OutboundQueue, TokenBucket
+
+
+def api_error(code, description='error', retry_after=None):
+    result = {'ok': False, 'error_code': code, 'description': description}
+    if retry_after is not None:
+        result['parameters'] = {'retry_after': retry_after}
+    return ApiTelegramException('sendMessage', None, result)
+
+
+class FakeBot:
+    """send_message, выбрасывающий заданные ошибки перед успешной отправкой"""
+
+    def __init__(self, errors=None):
+        self.errors = dict(errors or {})  # chat_id -> список исключений
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self.lock:
+            self.calls.append((time.monotonic(), chat_id, text))
+            errors = self.errors.get(chat_id)
+            if errors:
+                raise errors.pop(0)
+        return text
+
+
+@pytest.fixture
+def make_queue():
+    queues = []
+
+    def make(bot, global_rate=0, chat_rate=0, chat_burst=1):
+        outbound = OutboundQueue(2, global_rate, chat_rate, chat_burst, 100)
+        outbound.set_bot(bot)
+        queues.append(outbound)
+        return outbound
+
+    yield make
+    for outbound in queues:
+        outbound.stop(timeout=1)
+
+
+def test_token_bucket_limits_and_refunds():
+    bucket = TokenBucket(10, 2)
+
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert 0 < bucket.try_acquire() <= 0.1
+
+    bucket.refund()
+    assert bucket.try_acquire() == 0
+
+
+def test_token_bucket_without_rate_never_waits():
+    bucket = TokenBucket(0)
+
+    assert all(bucket.try_acquire() == 0 for _ in range(100))
+
+
+def test_token_bucket_acquire_is_interrupted_by_stop_event():
+    bucket = TokenBucket(0.1, 1)
+    bucket.try_acquire()
+    stop_event = threading.Event()
+    stop_event.set()
+
+    assert bucket.acquire(stop_event=stop_event) is False
+
+
+def test_429_pauses_and_retries_after_retry_after(make_queue):
+    bot = FakeBot({1: [api_error(429, 'Too Many Requests', retry_after=0.3)]})
+    outbound = make_queue(bot)
+
+    started = time.monotonic()
+    message = outbound.enqueue(1, 'hello')
+
+    assert message.wait(5) is True
+    assert message.result == 'hello'
+    assert len(bot.calls) == 2
+    assert bot.calls[1][0] - started >= 0.3
+    stats = outbound.stats()
+    assert stats['rate_limited'] == 1
+    assert stats['sent'] == 1 and stats['failed'] == 0
+
+
+def test_429_pauses_other_chats(make_queue):
+    bot = FakeBot({1: [api_error(429, 'Too Many Requests', retry_after=0.3)]})
+    outbound = make_queue(bot)
+
+    first = outbound.enqueue(1, 'first')
+    time.sleep(0.05)
+    second = outbound.enqueue(2, 'second')
+
+    assert first.wait(5) and second.wait(5)
+    rate_limited_at = bot.calls[0][0]
+    other_chat_at = next(at for at, chat_id, _ in bot.calls if chat_id == 2)
+    assert other_chat_at - rate_limited_at >= 0.3
+
+
+def test_messages_of_one_chat_keep_order_across_retries(make_queue):
+    bot = FakeBot({1: [api_error(429, 'Too Many Requests', retry_after=0.1)]})
+    outbound = make_queue(bot)
+
+    messages = [outbound.enqueue(1, str(i)) for i in range(5)]
+
+    assert all(message.wait(5) for message in messages)
+    delivered = [text for _, chat_id, text in bot.calls if chat_id == 1]
+    assert delivered == ['0', '0', '1', '2', '3', '4']
+
+
+def test_client_error_fails_without_retry(make_queue):
+    bot = FakeBot({1: [api_error(403, 'Forbidden: bot was blocked by the user')]})
+    outbound = make_queue(bot)
+
+    message = outbound.enqueue(1, 'hello')
+
+    assert message.wait(5) is False
+    assert 'blocked' in message.error
+    assert len(bot.calls) == 1
+
+
+def test_server_error_is_retried(make_queue, monkeypatch):
+    monkeypatch.setattr(Config, 'OUTBOUND_BACKOFF_BASE', 0.01)
+    bot = FakeBot({1: [api_error(502, 'Bad Gateway'), ConnectionError('reset')]})
+    outbound = make_queue(bot)
+
+    message = outbound.enqueue(1, 'hello')
+
+    assert message.wait(5) is True
+    assert len(bot.calls) == 3
+    assert outbound.stats()['retried'] == 2
+
+
+def test_server_error_gives_up_after_max_retries(make_queue, monkeypatch):
+    monkeypatch.setattr(Config, 'OUTBOUND_BACKOFF_BASE', 0.01)
+    monkeypatch.setattr(Config, 'OUTBOUND_MAX_RETRIES', 2)
+    bot = FakeBot({1: [api_error(500, 'Internal Server Error') for _ in range(5)]})
+    outbound = make_queue(bot)
+
+    message = outbound.enqueue(1, 'hello')
+
+    assert message.wait(5) is False
+    assert len(bot.calls) == 3
+
+
+def test_not_modified_edit_counts_as_delivered(make_queue):
+    class EditBot(FakeBot):
+        def edit_message_text(self, text, chat_id, message_id, **kwargs):
+            raise api_error(400, 'Bad Request: message is not modified')
+
+    outbound = make_queue(EditBot())
+
+    assert outbound.edit(1, 10, 'same').wait(5) is True
+
+
+def test_stop_resolves_waiters(make_queue):
+    bot = FakeBot({1: [api_error(429, 'Too Many Requests', retry_after=30)]})
+    outbound = make_queue(bot)
+    message = outbound.enqueue(1, 'hello')
+    time.sleep(0.1)
+
+    outbound.stop(timeout=0.2)
+
+    assert message.wait(1) is False
+    assert outbound.stats()['depth'] == 0
+
+
+def test_stop_lets_in_flight_delivery_finish(make_queue):
+    class SlowBot(FakeBot):
+        def __init__(self):
+            super().__init__()
+            self.entered = threading.Event()
+            self.release = threading.Event()
+
+        def send_message(self, chat_id, text, **kwargs):
+            self.entered.set()
+            self.release.wait(5)
+            return super().send_message(chat_id, text, **kwargs)
+
+    bot = SlowBot()
+    outbound = make_queue(bot)
+    in_flight = outbound.enqueue(1, 'first')
+    queued = outbound.enqueue(1, 'second')
+    assert bot.entered.wait(5)
+
+    outbound.stop(timeout=0.2)
+
+    assert queued.wait(1) is False
+    assert not in_flight.done.is_set()
+    bot.release.set()
+    assert in_flight.wait(5) is True
+    time.sleep(0.1)
+    assert outbound.stats()['depth'] == 0
+
+
+def test_repeated_429_fails_the_message(make_queue, monkeypatch):
+    monkeypatch.setattr(Config, 'OUTBOUND_MAX_RATE_LIMITED', 2)
+    bot = FakeBot({1: [api_error(429, 'Too Many Requests', retry_after=0.01) for _ in range(5)]})
+    outbound = make_queue(bot)
+
+    message = outbound.enqueue(1, 'hello')
+    after = outbound.enqueue(1, 'after')
+
+    assert message.wait(5) is False
+    assert len([call for call in bot.calls if call[2] == 'hello']) == 3
+    assert after.wait(5) is True
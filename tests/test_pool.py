@@ -0,0 +1,148 @@
+import sqlite3
+import threading
+import pytest
+from database import ConnectionPool
+
+
+@pytest.fixture
+def make_pool(tmp_path):
+    pools = []
+
+    def make(max_size=4, health_check_interval=60):
+        pool = ConnectionPool(str(tmp_path / 'pool.db'), max_size, health_check_interval)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close_all()
+
+
+def in_thread(func):
+    """Выполнение func в отдельном (затем завершившемся) потоке"""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def is_closed(conn):
+    try:
+        conn.execute('SELECT 1')
+        return False
+    except sqlite3.ProgrammingError:
+        return True
+
+
+def test_connection_is_reused_within_thread(make_pool):
+    pool = make_pool()
+
+    conn = pool.acquire()
+
+    assert pool.acquire() is conn
+    assert pool.size() == 1
+
+
+def test_threads_get_their_own_connections(make_pool):
+    pool = make_pool()
+    conn = pool.acquire()
+
+    assert in_thread(pool.acquire) is not conn
+
+
+def test_dead_threads_connections_are_reclaimed(make_pool):
+    pool = make_pool(max_size=4)
+    dead = [in_thread(pool.acquire) for _ in range(3)]
+
+    pool.acquire()
+
+    assert pool.size() == 1
+    assert all(is_closed(conn) for conn in dead)
+
+
+def test_overflow_connections_are_tracked_and_closed(make_pool):
+    pool = make_pool(max_size=1)
+    pool.acquire()
+    release = threading.Event()
+    acquired = threading.Event()
+    overflow = []
+
+    def hold():
+        overflow.append(pool.acquire())
+        acquired.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    acquired.wait(5)
+
+    assert pool.size() == 1
+    assert pool.overflow_size() == 1
+
+    release.set()
+    thread.join()
+    # Новое соединение другого потока освобождает соединение завершившегося
+    in_thread(pool.acquire)
+
+    assert is_closed(overflow[0])
+    assert pool.overflow_size() == 1
+
+
+def test_exhausted_warning_is_logged_once(make_pool, caplog):
+    pool = make_pool(max_size=1)
+    pool.acquire()
+    release = threading.Event()
+    barrier = threading.Barrier(4)
+
+    def hold():
+        pool.acquire()
+        barrier.wait(5)
+        release.wait(5)
+
+    threads = [threading.Thread(target=hold) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    barrier.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert sum('exhausted' in record.message for record in caplog.records) == 1
+
+
+def test_broken_connection_is_replaced_after_health_check(make_pool):
+    pool = make_pool(health_check_interval=0)
+    conn = pool.acquire()
+
+    assert pool.acquire() is conn
+    conn.close()
+
+    replacement = pool.acquire()
+    assert replacement is not conn
+    assert replacement.execute('SELECT 1').fetchone()[0] == 1
+    assert pool.size() == 1
+
+
+def test_close_all_closes_pooled_and_overflow_connections(make_pool):
+    pool = make_pool(max_size=1)
+    conn = pool.acquire()
+
+    pool.close_all()
+
+    assert is_closed(conn)
+    assert pool.size() == 0
+    # После закрытия пула соединение открывается заново и тоже учитывается
+    after = pool.acquire()
+    assert after is not conn and not is_closed(after)
+    assert pool.overflow_size() == 1
+    pool.close_all()
+    assert is_closed(after)
+
+
+def test_database_close_closes_connections(database):
+    conn = database.get_connection()
+
+    database.close()
+
+    assert is_closed(conn)
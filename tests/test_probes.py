@@ -0,0 +1,64 @@
+import http.server
+import threading
+import pytest
+from config import Config
+from probes import run_probe, validate_probe
+
+
+@pytest.fixture
+def http_server():
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/redirect':
+                self.send_response(302)
+                self.send_header('Location', 'http://169.254.169.254/latest/meta-data/')
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('probe_type, target', [
+    ('http', 'http://169.254.169.254/latest/meta-data/'),
+    ('http', 'internal.example:8080/health'),
+    ('http', 'http://10.0.0.5/'),
+    ('http', 'file:///etc/passwd'),
+    ('tcp', '192.168.1.1:22'),
+    ('tcp', 'db.internal:5432'),
+])
+def test_non_loopback_targets_are_rejected(probe_type, target):
+    assert validate_probe(probe_type, target) is not None
+    assert run_probe(probe_type, target)[0] is False
+
+
+@pytest.mark.parametrize('probe_type, target', [
+    ('http', 'localhost:8080/health'),
+    ('http', 'http://127.0.0.1:8080/'),
+    ('http', 'http://[::1]:8080/'),
+    ('tcp', '8080'),
+    ('tcp', '127.0.0.2:8080'),
+])
+def test_loopback_targets_are_accepted(probe_type, target):
+    assert validate_probe(probe_type, target) is None
+
+
+def test_configured_hosts_are_accepted(monkeypatch):
+    monkeypatch.setattr(Config, 'HEALTH_PROBE_ALLOWED_HOSTS', ['bot-host'])
+
+    assert validate_probe('http', 'http://bot-host:8080/health') is None
+    assert validate_probe('tcp', 'bot-host:22') is None
+    assert validate_probe('tcp', 'other-host:22') is not None
+
+
+def test_http_probe_does_not_follow_redirects(http_server):
+    assert run_probe('http', f'{http_server}/health') == (True, "HTTP 200")
+    assert run_probe('http', f'{http_server}/redirect') == (True, "HTTP 302")
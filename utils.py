@@ -1,12 +1,14 @@
 import re
-import subprocess
-import psutil
-import os
+import time
+import html
 from database import db_instance
+from supervisor import bot_supervisor
+from outbound import outbound_queue
 from config import Config, logger
 
 telegram_bot = None
 
+
 class Utils:
     @staticmethod
     def extract_username(text):
@@ -23,84 +25,212 @@ class Utils:
     @staticmethod
     def get_bot_status(bot):
         """Проверка статуса бота"""
-
-        if not bot or not bot.get('exe_path'):
-            return "not_found"
-
         try:
-            exe_path = bot.get('exe_path')
-            exe_name = os.path.basename(exe_path)
-
-            for process in psutil.process_iter(['name', 'exe']):
-                if process.info['exe'] and os.path.basename(process.info['exe']).lower() == exe_name.lower():
-                    return "running"
-            return "stopped"
+            return bot_supervisor.status(bot)
         except Exception as e:
-            print(f"❌ Ошибка проверки статуса бота {bot.get('name')}: {e}")
+            logger.error(f"Error checking bot status {bot.get('name') if bot else None}: {e}")
             return "error"
 
     @staticmethod
-    def start_bot(bot_name):
-        """Запуск бота"""
+    def get_bots_status(bots):
+        """Статусы всех ботов: {имя: статус}"""
+        try:
+            return bot_supervisor.statuses(bots)
+        except Exception as e:
+            logger.error(f"Error checking bot statuses: {e}")
+            return {bot.get('name'): "error" for bot in bots}
+
+    @staticmethod
+    def format_bot_status(bot, status):
+        """Эмодзи статуса бота и код последнего завершения"""
+        status_emoji = {"running": "🟢", "unhealthy": "🟠", "restarting": "🟡", "stopped": "🔴"}.get(status, "⚫")
+        if status == "unhealthy":
+            health = bot_supervisor.health(bot.get('name'))
+            status_emoji += f" (не отвечает: {health['detail'] if health else '?'})"
+        if status in ("stopped", "restarting") and bot.get('exit_code') is not None:
+            exited_at = time.strftime('%d.%m %H:%M', time.localtime(bot['exited_at'])) if bot.get('exited_at') else "?"
+            status_emoji += f" (код {bot['exit_code']}, {exited_at})"
+        if status == "stopped" and bot_supervisor.is_crash_looping(bot.get('name')):
+            status_emoji += " ⚠️ цикл падений"
+        sample = bot_supervisor.latest_sample(bot.get('name')) if status in ("running", "unhealthy") else None
+        if sample:
+            status_emoji += f" ({sample.cpu:.0f}% CPU, {Utils.format_size(sample.rss)})"
+        return status_emoji
+
+    @staticmethod
+    def format_size(size):
+        """Размер в байтах в читаемом виде"""
+        for unit in ("Б", "КБ", "МБ"):
+            if size < 1024:
+                return f"{size:.0f} {unit}"
+            size /= 1024
+        return f"{size:.1f} ГБ"
+
+    @staticmethod
+    def get_bot_info(bot_name):
+        """Информация о боте и потребляемых им ресурсах. None, если бота нет"""
         bot = db_instance.get_bot(bot_name)
+        if not bot:
+            return None
 
-        if not bot or not bot.get('exe_path'):
-            return False, "❌ Бот не найден"
+        status = Utils.get_bot_status(bot)
+        lines = [
+            f"🤖 <b>Бот {bot_name}</b>",
+            "",
+            f"👤 Username: {bot.get('username')}",
+            f"🔧 Тип: {bot.get('type')}",
+            f"🔁 Перезапуск: {bot.get('restart_policy')}",
+            f"📡 Статус: {Utils.format_bot_status(bot, status)}",
+        ]
+        if status in ("running", "unhealthy") and bot.get('pid'):
+            lines.append(f"🆔 PID: {bot['pid']}")
+
+        if bot.get('probe_type'):
+            lines.append(f"🩺 Проба: {bot['probe_type']} {bot.get('probe_target')}")
+            health = bot_supervisor.health(bot_name)
+            if health:
+                checked_at = time.strftime('%H:%M:%S', time.localtime(health['checked_at']))
+                result = "✅" if not health['failures'] else f"❌ неудач подряд: {health['failures']}"
+                lines.append(f"   {result}, {health['detail']} ({checked_at})")
+
+        sample = bot_supervisor.latest_sample(bot_name)
+        if sample:
+            lines += [
+                "",
+                "<b>Сейчас:</b>",
+                f"⚙️ CPU: {sample.cpu:.1f}%",
+                f"🧠 Память: {Utils.format_size(sample.rss)}",
+                f"🧵 Потоков: {sample.threads}",
+                f"📂 Дескрипторов: {sample.fds}",
+            ]
+
+        summary = bot_supervisor.resource_summary(bot_name)
+        if summary:
+            minutes = max(1, round((time.time() - summary['since']) / 60))
+            lines += [
+                "",
+                f"<b>За {minutes} мин (замеров: {summary['samples']}):</b>",
+                f"⚙️ CPU: ср. {summary['cpu_avg']:.1f}%, макс. {summary['cpu_max']:.1f}%",
+                f"🧠 Память: ср. {Utils.format_size(summary['rss_avg'])}, макс. {Utils.format_size(summary['rss_max'])}",
+            ]
+
+        # Сохраненная история показывает рост памяти и дескрипторов (утечки)
+        history = db_instance.get_bot_metrics(bot_name, int(time.time()) - 24 * 3600)
+        if history:
+            first, last = history[0], history[-1]
+            lines += [
+                "",
+                "<b>За 24 часа:</b>",
+                f"⚙️ CPU макс.: {max(row['cpu_max'] for row in history):.1f}%",
+                f"🧠 Память: {Utils.format_size(first['rss_avg'])} → {Utils.format_size(last['rss_avg'])}, "
+                f"макс. {Utils.format_size(max(row['rss_max'] for row in history))}",
+                f"📂 Дескрипторов: {first['fds']} → {last['fds']}",
+            ]
+
+        return "\n".join(lines)
 
-        try:
-            if Utils.get_bot_status(bot) == "running":
-                return False, "❌ Бот уже запущен"
+    @staticmethod
+    def get_bot_logs(bot_name, count=None, limit=4000, escape_html=False):
+        """Последние строки вывода бота не длиннее limit символов. None, если бота нет"""
+        if not db_instance.get_bot(bot_name):
+            return None
 
-            subprocess.Popen([bot.get('exe_path')])
-            db_instance.update_bot_state(bot_name, True)
-            return "✅ Бот запущен"
-        except Exception as e:
-            return f"❌ Ошибка запуска: {e}"
+        count = Config.BOT_LOGS_DEFAULT_LINES if count is None else min(count, Config.BOT_LOG_BUFFER_LINES)
+        lines = []
+        length = 0
+        # Берем строки с конца, пока текст помещается в сообщение
+        for line in reversed(bot_supervisor.output_tail(bot_name, count)):
+            line = html.escape(line) if escape_html else line
+            length += len(line) + 1
+            if length > limit:
+                break
+            lines.append(line)
+        return "\n".join(reversed(lines))
+
+    @staticmethod
+    def start_bot(bot_name):
+        """Запуск бота"""
+        success, message = bot_supervisor.start(bot_name)
+        return message
 
     @staticmethod
     def stop_bot(bot_name):
-        """Остановка бота"""
-        bot = db_instance.get_bot(bot_name)
+        """Остановка бота: SIGTERM, ожидание BOT_STOP_TIMEOUT секунд, затем kill (блокирующий вызов)"""
+        success, message = bot_supervisor.stop(bot_name)
+        return message
 
-        if not bot:
-            return False, "❌ Бот не найден"
+    @staticmethod
+    def get_bot_names(bot_type=None):
+        """Имена всех ботов или ботов указанного типа"""
+        bots = db_instance.get_all_bots()
+        if bot_type:
+            bots = [bot for bot in bots if (bot.get('type') or '').lower() == bot_type.lower()]
+        return [bot['name'] for bot in bots]
 
-        exe_path = bot.get('exe_path')
-        if not exe_path:
-            return False, "❌ Путь к exe не указан"
+    @staticmethod
+    def start_all_bots(bot_type=None, progress=None):
+        """Параллельный запуск всех ботов (или ботов одного типа). None, если ботов нет"""
+        bot_names = Utils.get_bot_names(bot_type)
+        if not bot_names:
+            return None
+        title = "▶️ Запуск ботов"
+        results = bot_supervisor.start_many(bot_names, Utils.bulk_progress(title, len(bot_names), progress))
+        return Utils.format_bulk_results(title, results)
 
-        try:
-            process_found = False
-            exe_name = os.path.basename(exe_path)
+    @staticmethod
+    def stop_all_bots(bot_type=None, progress=None):
+        """Остановка всех ботов (или ботов одного типа). None, если ботов нет"""
+        bot_names = Utils.get_bot_names(bot_type)
+        if not bot_names:
+            return None
+        title = "⏹️ Остановка ботов"
+        results = bot_supervisor.stop_many(bot_names, on_done=Utils.bulk_progress(title, len(bot_names), progress))
+        return Utils.format_bulk_results(title, results)
+
+    @staticmethod
+    def bulk_progress(title, total, progress):
+        """Обработчик окончания операции над одним ботом, передающий в progress текст 'title: N/total ⏳'"""
+        if progress is None:
+            return None
+        finished = []
 
-            for process in psutil.process_iter(['name', 'exe']):
-                if process.info['exe'] and os.path.basename(process.info['exe']).lower() == exe_name.lower():
-                    process.terminate()
-                    process_found = True
+        def on_done(bot_name):
+            finished.append(bot_name)
+            progress(f"{title}: {len(finished)}/{total} ⏳")
+        return on_done
 
-            if process_found:
-                db_instance.update_bot_state(bot_name, False)
-                return "✅ Бот остановлен"
-            else:
-                return "❌ Бот не был запущен"
-        except Exception as e:
-            return False, f"❌ Ошибка остановки: {e}"
+    @staticmethod
+    def format_bulk_results(title, results):
+        """Таблица результатов массовой операции над ботами"""
+        succeeded = sum(1 for success, _ in results.values() if success)
+        lines = [f"<b>{title}: {succeeded}/{len(results)}</b>", ""]
+        for bot_name, (success, message) in results.items():
+            lines.append(f"{bot_name}: {message}")
+        return "\n".join(lines)
 
     @staticmethod
     def get_stats():
         """Получение статистики"""
-        users = db_instance.get_all_users()
-        bots = db_instance.get_all_bots()
-        operators = db_instance.get_all_operators()
-        global_admins = db_instance.get_all_global_admins()
+        stats = db_instance.get_stats()
+        if stats is None:
+            return "📊 <b>Статистика системы</b>\n\n❌ Ошибка получения статистики"
 
-        total_users = len(users)
-        banned_users = sum(1 for user in users if user['banned'])
+        total_users = stats['total_users']
+        banned_users = stats['banned_users']
+        running_bots = stats['running_bots']
 
-        running_bots = 0
-        for i, bot in enumerate(bots, 1):
-            if Utils.get_bot_status(bot) == "running":
-                running_bots += 1
+        cache = db_instance.cache_stats()
+
+        samples = bot_supervisor.latest_samples()
+        resources = "нет данных"
+        if samples:
+            heaviest = max(samples, key=lambda name: samples[name].rss)
+            resources = (f"CPU {sum(s.cpu for s in samples.values()):.0f}%, "
+                         f"память {Utils.format_size(sum(s.rss for s in samples.values()))} "
+                         f"(больше всех: {heaviest}, {Utils.format_size(samples[heaviest].rss)})")
+
+        queue = outbound_queue.stats()
+        latency = f", задержка p50 {queue['p50']:.1f}с / p95 {queue['p95']:.1f}с" if queue['p50'] is not None else ""
 
         return f"""📊 <b>Статистика системы</b>
 
@@ -108,12 +238,17 @@ class Utils:
 🚫 Забаненных: {banned_users}
 ✅ Активных: {total_users - banned_users}
 
-🤖 Всего ботов: {len(bots)}
+🤖 Всего ботов: {stats['total_bots']}
 ▶️ Активных ботов: {running_bots}
-⏹️ Остановленных: {len(bots) - running_bots}
+⏹️ Остановленных: {stats['total_bots'] - running_bots}
+💻 Ресурсы ботов: {resources}
+
+👨‍💼 Локальных админов: {stats['local_admins']}
+👑 Глобальных админов: {stats['global_admins']}
+⚡ Операторов: {stats['operators']}
 
-👑 Глобальных админов: {len(global_admins)}
-⚡ Операторов: {len(operators)}"""
+🧠 Кэш: {cache['size']} записей, попаданий {cache['hit_rate']:.0%} ({cache['hits']}/{cache['hits'] + cache['misses']})
+📤 Очередь Telegram: {queue['depth']} в очереди, отправлено {queue['sent']}, ошибок {queue['failed']}, повторов {queue['retried']}, 429: {queue['rate_limited']}{latency}"""
 
     @staticmethod
     def format_user_list(users, list_type):
@@ -157,18 +292,22 @@ class Utils:
         """Установка экземпляра Telegram бота для отправки сообщений"""
         global telegram_bot
         telegram_bot = bot_instance
+        outbound_queue.set_bot(bot_instance)
+
+    @staticmethod
+    def send_message_to_chat(chat_id, message):
+        """Отправка сообщения в чат Telegram через очередь с ожиданием результата"""
+        if telegram_bot is None:
+            return False
+        return outbound_queue.send(chat_id, message, parse_mode='HTML')
 
     @staticmethod
     def send_message_to_user(bot, username, message):
-        """Отправка сообщения пользователю в ЛС через Telegram"""
+        """Постановка сообщения пользователю в ЛС Telegram в очередь отправки"""
         try:
             user = db_instance.get_user(username)
-            if user and user.get('user_id'):
-                # Используем глобальный экземпляр бота если не передан
-                if bot is None and telegram_bot is not None:
-                    telegram_bot.send_message(user['user_id'], message, parse_mode='HTML')
-                elif bot is not None:
-                    bot.send_message(user['user_id'], message, parse_mode='HTML')
+            if user and user.get('user_id') and (bot is not None or telegram_bot is not None):
+                outbound_queue.enqueue(user['user_id'], message, parse_mode='HTML')
                 return True
         except Exception as e:
             logger.error(f"Error sending message to {username}: {e}")
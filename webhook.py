@@ -0,0 +1,178 @@
+import hmac
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot.types import Update
+from config import Config, logger
+
+# Максимальный размер тела запроса с обновлением (байт)
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Прием обновлений Telegram: проверка секрета и постановка в очередь"""
+
+    def do_POST(self):
+        webhook = self.server.webhook
+        if self.path != webhook.path:
+            self._reply(404)
+            return
+
+        if not self._authorized():
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length <= 0 or length > MAX_BODY_SIZE:
+            self._reply(413 if length > MAX_BODY_SIZE else 400)
+            return
+
+        try:
+            update = json.loads(self.rfile.read(length))
+        except ValueError:
+            update = None
+        if not isinstance(update, dict):
+            self._reply(400)
+            return
+
+        if webhook.put(update):
+            self._reply(200)
+        else:
+            # Не 2xx: Telegram повторит доставку позже
+            self._reply(503, retry_after=1)
+
+    def do_GET(self):
+        # Проверка работоспособности для балансировщика (с тем же секретом, что и у Telegram)
+        if self.path != self.server.webhook.path:
+            self._reply(404)
+            return
+        if not self._authorized():
+            return
+        self._reply(200, body=json.dumps(self.server.webhook.stats()).encode())
+
+    def _authorized(self):
+        """Проверка заголовка X-Telegram-Bot-Api-Secret-Token; при несовпадении отвечает 403"""
+        webhook = self.server.webhook
+        secret = self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if hmac.compare_digest(secret.encode(), webhook.secret.encode()):
+            return True
+        webhook.count('rejected')
+        logger.warning(f"Webhook request with invalid secret token from {self.client_address[0]}")
+        self._reply(403)
+        return False
+
+    def _reply(self, code, body=b'', retry_after=None):
+        self.send_response(code)
+        if retry_after is not None:
+            self.send_header('Retry-After', str(retry_after))
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Webhook {self.client_address[0]}: {format % args}")
+
+
+class WebhookServer:
+    """Локальный HTTP-сервер для webhook Telegram.
+
+    Запросы только проверяются и кладутся в ограниченную очередь, обновления
+    разбирают и передают в bot.process_new_updates потоки-обработчики. При
+    переполнении очереди сервер отвечает 503, и Telegram повторяет доставку.
+    Бот должен быть создан с threaded=False: иначе process_new_updates лишь
+    перекладывает обновление в неограниченную очередь telebot, и очередь
+    сервера никогда не заполняется.
+    """
+
+    def __init__(self, bot, host, port, path, secret, queue_size, workers):
+        if not secret:
+            raise ValueError("WEBHOOK_SECRET is required in webhook mode")
+        if getattr(bot, 'threaded', False):
+            raise ValueError("Webhook mode needs a TeleBot created with threaded=False")
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._httpd = None
+        self._serving = False
+        self._stats = {'received': 0, 'processed': 0, 'errors': 0, 'rejected': 0, 'overloaded': 0}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Запуск потоков обработки и привязка HTTP-сервера к порту"""
+        self._httpd = ThreadingHTTPServer((self.host, self.port), WebhookRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.webhook = self
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"webhook-worker-{i}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+        logger.info(f"Webhook server listening on {self.host}:{self._httpd.server_address[1]}{self.path}")
+
+    def serve_forever(self):
+        """Прием запросов до вызова stop (блокирует)"""
+        self._serving = True
+        self._httpd.serve_forever()
+
+    def stop(self, timeout=10):
+        """Остановка приема и обработка уже принятых обновлений"""
+        if self._httpd is not None:
+            # shutdown ждет выхода из serve_forever, без него он зависнет
+            if self._serving:
+                self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def put(self, update):
+        """Постановка обновления в очередь без ожидания. False, если очередь переполнена"""
+        try:
+            self._queue.put_nowait(update)
+        except queue.Full:
+            self.count('overloaded')
+            logger.warning(f"Webhook queue is full ({self._queue.maxsize}), update {update.get('update_id')} rejected")
+            return False
+        self.count('received')
+        return True
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """Счетчики обновлений и глубина очереди"""
+        with self._lock:
+            return dict(self._stats, depth=self._queue.qsize())
+
+    def _run(self):
+        """Поток обработки обновлений"""
+        while True:
+            update = self._queue.get()
+            if update is None:
+                return
+            try:
+                self.bot.process_new_updates([Update.de_json(update)])
+                self.count('processed')
+            except Exception as e:
+                self.count('errors')
+                logger.error(f"Error processing webhook update {update.get('update_id')}: {e}")
+
+    @staticmethod
+    def from_config(bot):
+        """Сервер с параметрами из Config"""
+        if not Config.WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL is required in webhook mode")
+        return WebhookServer(bot, Config.WEBHOOK_HOST, Config.WEBHOOK_PORT, Config.WEBHOOK_PATH,
+                             Config.WEBHOOK_SECRET, Config.WEBHOOK_QUEUE_SIZE, Config.WEBHOOK_WORKERS)